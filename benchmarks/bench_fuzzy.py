@@ -0,0 +1,48 @@
+""" Time the searches of the FuzzyIndex against a linear scan scoring every
+name, as the commands did with fuzzy_match over one semester.
+
+Usage: python benchmarks/bench_fuzzy.py [courses]
+
+The names are generated from a list of words (default 800 courses, the
+archive of a whole cursus with duplicates across semesters).
+"""
+
+import sys
+import time
+import random
+
+from epflmanager.fuzzy import FuzzyIndex, _Name, trigrams
+
+WORDS = ["Algorithms", "Advanced", "Algebra", "Linear", "Analysis", "Computer", "Architecture",
+         "Probability", "Statistics", "Physics", "Quantum", "Networks", "Databases", "Systems",
+         "Distributed", "Compilers", "Machine", "Learning", "Signal", "Processing", "Information",
+         "Theory", "Security", "Graphics", "Vision", "Robotics", "Optimization", "Numerical"]
+QUERIES = ["alg", "aa", "algoritms", "pas", "mach lear", "sys", "x", "Computer Architecture"]
+
+def names(n):
+    rng = random.Random(0)
+    return [ "%s %s %d" % (rng.choice(WORDS), rng.choice(WORDS), i % 7) for i in range(n) ]
+
+def timed(func, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        func()
+    return (time.perf_counter() - start) / runs * 10**6
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 800
+    all_names = names(n)
+
+    build = timed(lambda: FuzzyIndex(enumerate(all_names)), 5)
+    index = FuzzyIndex(enumerate(all_names))
+    prepared = [ _Name(name) for name in all_names ]
+    print("%d names, index built in %.0f us" % (n, build))
+    print("%-22s %10s %10s %8s" % ("query", "index", "scan", "results"))
+    for query in QUERIES:
+        q = query.lower()
+        scan = lambda: [ p for p in prepared if p.score(q, trigrams(q), len(p.trigrams & trigrams(q))) > 0 ]
+        print("%-22s %8.0fus %8.0fus %8d" % (query, timed(lambda: index.search(query), 50),
+                                            timed(scan, 50), len(index.search(query))))
+
+if __name__ == "__main__":
+    main()
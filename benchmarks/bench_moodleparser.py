@@ -0,0 +1,93 @@
+""" Compare the single-pass parser of the course pages with the former PyQuery one.
+
+Usage: python benchmarks/bench_moodleparser.py [recorded_page.html ...]
+
+Without argument, large course pages are generated (hundreds of resources and
+long section summaries). Saved course pages can be given to measure on real
+data (save them from the browser while logged in Moodle).
+
+The peak memory is the one of the Python objects only (tracemalloc does not
+see the trees allocated by libxml2, which PyQuery keeps whole).
+"""
+
+import sys
+import time
+import tracemalloc
+
+from pyquery import PyQuery
+
+from epflmanager.connections.moodleparser import parse_course_resources
+
+def pyquery_course_resources(html):
+    """ The parser used before, kept as a reference """
+    def create_link(pylink):
+        d = {}
+        d.update(pylink.attrib)
+        d["text"] = pylink.text_content()
+        return d
+
+    pcourse = PyQuery(html, parser="html")
+
+    links = []
+    pcourse("h3.sectionname").parent().find("a").each(lambda i,e: links.append(e))
+    attrs = list(map(lambda x: x.attrib, links))
+    list(map(lambda ix: attrs[ix[0]].update({'text': ix[1].text_content()}), enumerate(links)))
+
+    links = []
+    pcourse("h3.sectionname").parent().each(lambda i,x: links.append({ "links": list(pcourse(x).find("a").map(lambda i,l: create_link(l))), "name": pcourse(x).find("h3.sectionname").text()}))
+    return links
+
+def generated_page(sections, resources, summary_words):
+    summary = " ".join(["Lorem ipsum <b>dolor</b> sit amet"] * (summary_words // 5))
+    parts = ["<!DOCTYPE html><html><head><title>Course</title></head><body><ul class='topics'>"]
+    rid = 900000
+    for s in range(sections):
+        parts.append("<li id='section-%d' class='section main'><div class='content'>" % s)
+        parts.append("<h3 class='sectionname'><span>Week %d</span></h3>" % s)
+        parts.append("<div class='summary'><p>%s</p></div><ul class='section img-text'>" % summary)
+        for r in range(resources):
+            rid += 1
+            parts.append("<li class='activity resource'><div><a class='' href='http://moodle.epfl.ch/mod/resource/view.php?id=%d'>"
+                         "<img src='pdf.png' class='iconlarge'><span class='instancename'>Resource %d"
+                         "<span class='accesshide'> File</span></span></a></div></li>" % (rid, r))
+        parts.append("</ul></div></li>")
+    parts.append("</ul></body></html>")
+    return "".join(parts)
+
+def chunked(text, size=16*1024):
+    return (text[i:i+size] for i in range(0, len(text), size))
+
+def measure(name, func, arg_factory, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        arg = arg_factory()
+        start = time.perf_counter()
+        func(arg)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(arg_factory())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("  %-22s %8.1f ms %10.1f KiB peak" % (name, best * 1000, peak / 1024))
+
+def main(paths):
+    pages = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            pages.append((path, f.read()))
+    if not pages:
+        pages = [("generated 14x20, short summaries", generated_page(14, 20, 50)),
+                 ("generated 14x50, long summaries", generated_page(14, 50, 2000)),
+                 ("generated 30x100, long summaries", generated_page(30, 100, 2000))]
+
+    for name, html in pages:
+        print("%s (%.0f KiB)" % (name, len(html) / 1024))
+        assert parse_course_resources(html) == pyquery_course_resources(html)
+        measure("pyquery", pyquery_course_resources, lambda: html)
+        measure("single pass", parse_course_resources, lambda: html)
+        measure("single pass, chunked", parse_course_resources, lambda: chunked(html))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
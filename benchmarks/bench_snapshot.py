@@ -0,0 +1,62 @@
+""" Compare the listing of the course tree with the former listdir + isdir
+approach and the scandir snapshots.
+
+Usage: python benchmarks/bench_snapshot.py [courses_per_semester]
+
+A synthetic tree is generated in a temporary directory: 10 semesters of
+thousands of course folders (default 2000), each with a few files. The
+directories of every semester are listed and then queried for their type, as
+`CourseHandler` and the commands do.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from epflmanager.io.fileorganizer import Directory
+
+SEMESTERS = ["BA1","BA2","BA3","BA4","BA5","BA6","MA1","MA2","MA3","MA4"]
+
+def make_tree(root, courses_per_semester):
+    for semester in SEMESTERS:
+        for i in range(courses_per_semester):
+            course = os.path.join(root, semester, "Course%d" % i)
+            os.makedirs(os.path.join(course, "Moodle"))
+            for name in ["site.url", ".moodle.Course%d" % i, "notes.txt"]:
+                open(os.path.join(course, name), "w").close()
+
+def listdir_isdir(root):
+    """ The listing used before: one stat per entry, another one per query """
+    found = 0
+    for semester in SEMESTERS:
+        p = os.path.join(root, semester)
+        courses = [ d for d in os.listdir(p) if os.path.isdir(os.path.join(p, d)) ]
+        found += sum(1 for d in courses if os.path.isdir(os.path.join(p, d)) and os.path.exists(os.path.join(p, d)))
+    return found
+
+def snapshots(root):
+    found = 0
+    for semester in SEMESTERS:
+        courses = Directory(root)(semester).dirs()
+        found += sum(1 for d in courses if d.is_dir() and d.exists())
+    return found
+
+def bench(name, func, root, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = func(root)
+        best = min(best, time.perf_counter() - start)
+    print("%-15s %8.1f ms  (%d courses)" % (name, best * 1000, found))
+
+if __name__ == "__main__":
+    courses_per_semester = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    root = tempfile.mkdtemp()
+    try:
+        make_tree(root, courses_per_semester)
+        bench("listdir+isdir", listdir_isdir, root)
+        bench("scandir", snapshots, root)
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,48 @@
+""" Measure the cold start of bin/epfl, and fail if it regressed.
+
+Usage: python benchmarks/bench_startup.py [--runs N] [--budget MS] [-- epfl arguments]
+
+The time of `python bin/epfl --help` (or of the given arguments) is compared
+to the start of a bare interpreter, so that the result does not depend on
+the machine: the script exits with status 1 if the overhead of bin/epfl is
+above the budget (default 40 ms). No daemon is used.
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def median_time(cmd, runs, env):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--budget", type=float, default=40.0, help="maximum overhead in ms")
+    parser.add_argument("epfl_args", nargs="*", default=["--help"])
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=ROOT, EPFL_DAEMON_SOCKET=os.path.join(ROOT, "no-daemon.sock"))
+    bare = median_time([sys.executable, "-c", "pass"], args.runs, env)
+    epfl = median_time([sys.executable, os.path.join(ROOT, "bin", "epfl")] + args.epfl_args, args.runs, env)
+    overhead = (epfl - bare) * 1000
+
+    print("python:    %6.1f ms" % (bare * 1000))
+    print("bin/epfl:  %6.1f ms  (%s)" % (epfl * 1000, " ".join(args.epfl_args)))
+    print("overhead:  %6.1f ms  (budget %.0f ms)" % (overhead, args.budget))
+    if overhead > args.budget:
+        print("Startup time regressed")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
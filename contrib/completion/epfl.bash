@@ -0,0 +1,12 @@
+# bash completion of epfl, source it from ~/.bashrc
+_epfl() {
+    local cur=${COMP_WORDS[COMP_CWORD]}
+    if [[ ${COMP_WORDS[COMP_CWORD-1]} == --config ]]; then
+        COMPREPLY=( $(compgen -f -- "$cur") )
+        return
+    fi
+    local IFS=$'\n' name
+    COMPREPLY=( $(epfl __complete "${COMP_WORDS[@]:1:COMP_CWORD}" 2>/dev/null |
+                  while IFS= read -r name; do printf '%q\n' "$name"; done) )
+}
+complete -F _epfl epfl
@@ -0,0 +1,7 @@
+# fish completion of epfl, put it in ~/.config/fish/completions
+function __epfl_complete
+    set -l words (commandline -opc) (commandline -ct)
+    epfl __complete $words[2..-1] 2>/dev/null
+end
+complete -c epfl -f -a '(__epfl_complete)'
+complete -c epfl -l config -r -F
@@ -0,0 +1,107 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+class Cache(object):
+    """
+    Cache of values computed from the content of directories (listings of
+    directories, courses of a semester, ...).
+
+    - Every value depends on a directory: it is computed again when the
+      modification time of the directory changed. A value computed less than
+      `RACY` ns after the modification of its directory could miss a change
+      made in the same tick (coarse mtimes), it is computed again too.
+    - The cache is bounded: the least recently used values are evicted when
+      the total size (the length of the values, 1 for values without length)
+      exceeds `max_size`.
+    - `invalidate` drops the values depending on a directory, for the changes
+      made by the program itself.
+    """
+    RACY = 2 * 10**9
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._entries = OrderedDict() # key -> (value, size, directory, mtime, computed)
+        self._by_directory = {} # directory -> keys of the values depending on it
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _size_of(value):
+        try:
+            return max(1, len(value))
+        except TypeError:
+            return 1
+
+    def get(self, key, compute, directory):
+        """ Return the value of the key, computed by `compute()` if it is not
+        in the cache or if `directory` changed since it was computed """
+        directory = os.path.abspath(directory)
+        mtime = _mtime(directory)
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, size, _, cached_mtime, computed = entry
+            if mtime is not None and mtime == cached_mtime and computed - mtime >= Cache.RACY:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+            self._remove(key)
+
+        self.misses += 1
+        value = compute()
+        if mtime is not None:
+            self._add(key, value, directory, mtime)
+        return value
+
+    def _add(self, key, value, directory, mtime):
+        size = Cache._size_of(value)
+        self._entries[key] = (value, size, directory, mtime, time.time() * 10**9)
+        self._by_directory.setdefault(directory, set()).add(key)
+        self._size += size
+        while self._size > self.max_size and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._size -= entry[1]
+        keys = self._by_directory[entry[2]]
+        keys.discard(key)
+        if not keys:
+            del self._by_directory[entry[2]]
+
+    def invalidate(self, directory):
+        """ Drop the values depending on a directory """
+        directory = os.path.abspath(directory)
+        keys = list(self._by_directory.get(directory, ()))
+        for k in keys:
+            self._remove(k)
+        self.invalidations += len(keys)
+        logger.debug("Invalidated %d cached values of %s" % (len(keys), directory))
+
+    def clear(self):
+        self._entries.clear()
+        self._by_directory.clear()
+        self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return { "entries": len(self._entries), "size": self._size, "hits": self.hits,
+                 "misses": self.misses, "evictions": self.evictions, "invalidations": self.invalidations }
+
+# Cache shared by the paths and the CourseHandler
+shared = Cache()
@@ -0,0 +1,97 @@
+import logging
+
+import epflmanager.metadata as metadata
+from epflmanager.fuzzy import FuzzyIndex
+
+logger = logging.getLogger(__name__)
+
+class CourseCatalogue(object):
+    """
+    The courses of all the semesters, by name and by Moodle id, and the
+    FuzzyIndex of their names (keyed by (semester, course name)).
+
+    It is kept up to date from the cached listings of the semesters (see
+    CourseHandler.catalogue): only the semesters whose listing changed are
+    diffed in, so it costs one `stat` per semester instead of a listing of
+    every semester.
+
+    The Moodle ids of all the courses are read (through the metadata cache)
+    the first time a course is looked up by id. The map then answers without
+    touching the disk until the listings or the generation of the metadata
+    cache change: a Moodle file read again with another id, after a link by
+    the program, a listing of the courses of a semester or a change seen by
+    the Watcher.
+    """
+    def __init__(self, semester_directories):
+        self._order = { name: i for i, name in enumerate(semester_directories) }
+        self._listings = {} # semester -> the courses_by_name that was indexed
+        self._by_name = {} # course name -> { semester: course }
+        self._by_moodle_id = None # moodle id -> courses, built when needed
+        self._generation = None # of the metadata cache when the map was built
+        self.fuzzy = FuzzyIndex()
+
+    def update(self, listings):
+        """ Take the listings ({ semester: courses_by_name }) of the semesters
+        into account """
+        for semester in self._listings.keys() - listings.keys():
+            for name in self._listings.pop(semester):
+                self._remove(semester, name)
+
+        for semester, courses in listings.items():
+            indexed = self._listings.get(semester, {})
+            if courses is indexed:
+                continue
+            logger.debug("Cataloguing the courses of %s" % semester)
+            for name in indexed.keys() - courses.keys():
+                self._remove(semester, name)
+            for name, course in courses.items():
+                self._by_name.setdefault(name, {})[semester] = course
+                if name not in indexed:
+                    self.fuzzy.add((semester, name), name)
+            self._listings[semester] = courses
+            self._by_moodle_id = None
+
+    def _remove(self, semester, name):
+        self.fuzzy.remove((semester, name))
+        semesters = self._by_name[name]
+        del semesters[semester]
+        if not semesters:
+            del self._by_name[name]
+        self._by_moodle_id = None
+
+    def _sorted(self, courses_by_semester):
+        return [ c for s, c in sorted(courses_by_semester.items(), key=lambda i: self._order.get(i[0], -1)) ]
+
+    def course(self, semester, name):
+        return self._listings[semester][name]
+
+    def __iter__(self):
+        """ Iterate over all the courses, semester after semester """
+        for semester in sorted(self._listings, key=lambda s: self._order.get(s, -1)):
+            yield from self._listings[semester].values()
+
+    def __len__(self):
+        return sum(len(courses) for courses in self._listings.values())
+
+    def by_name(self, name):
+        """ Courses with this name, oldest semester first """
+        return self._sorted(self._by_name.get(name, {}))
+
+    def by_moodle_id(self, moodle_id):
+        """ Courses linked with this Moodle id, oldest semester first """
+        moodle_id = str(moodle_id)
+        if self._by_moodle_id is None or self._generation != metadata.shared.generation:
+            logger.debug("Reading the Moodle ids of all the courses")
+            by_moodle_id = {}
+            for course in self:
+                course_id = metadata.shared.moodle_id(course.moodle_file_path)
+                if course_id is not None:
+                    by_moodle_id.setdefault(course_id, []).append(course)
+            self._by_moodle_id = by_moodle_id
+            self._generation = metadata.shared.generation
+        return list(self._by_moodle_id.get(moodle_id, []))
+
+    def forget_moodle_ids(self):
+        """ Read the Moodle ids again on the next lookup by id, for the links
+        made by the program itself """
+        self._by_moodle_id = None
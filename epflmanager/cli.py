@@ -0,0 +1,164 @@
+import argparse
+import logging
+
+import epflmanager.components as components
+import epflmanager.config as config
+
+logger = logging.getLogger(__name__)
+
+# Only what every command needs is imported here: the modules of the
+# commands and of the components are imported when they are used
+
+def command(name):
+    """ Return a function running the command `Class.method` of the
+    epflmanager.commands package, imported when the command runs """
+    def run(args):
+        import importlib
+        from epflmanager.commands import MODULES
+        cls, method = name.split(".")
+        return getattr(getattr(importlib.import_module(MODULES[cls]), cls), method)(args)
+    run.__name__ = name
+    return run
+
+def start_console():
+    if not components.is_registered("Console"):
+        def create_console():
+            from epflmanager.io.console import ConsoleManager
+            return ConsoleManager()
+        components.register_factory("Console", create_console)
+
+def start_components(config_file=None):
+    """ Register the components used by all the commands, unless they
+    already exist (in the daemon) """
+    if components.is_started("Config"):
+        return
+    conf_file = config_file if config_file else config.default_config_file()
+    conf = config.read_config_file(conf_file)
+    config.start_config_component(conf)
+
+    from epflmanager.index import start_index_component
+    start_index_component(conf) # Index of the tree, if enabled
+
+    def create_course_handler():
+        from epflmanager.coursehandler import CourseHandler
+        return CourseHandler() # The file&directory handler
+    components.register_factory("CourseHandler", create_course_handler, depends=["Config", "Console"])
+
+    def create_moodle():
+        from epflmanager.connections import start_moodle_component
+        return start_moodle_component()
+    components.register_factory("Moodle", create_moodle, depends=["Config", "Console"])
+
+def config_initializer(func):
+    def intercept_args(args): # args are those provided by argparser
+        start_components(args.config)
+        args.semester = find_semester(args.semester)
+
+        return func(args)
+
+    return intercept_args
+
+wrap = config_initializer
+
+def moodle_initializer(func, when=None):
+    """ Connect to Moodle before running the command (only if `when(args)`
+    is true, when given), report a failed connection on the console """
+    def intercept_args(args):
+        from epflmanager.connections.session import AuthenticationFailed, CredentialsUnavailable
+        if when is not None and not when(args):
+            return func(args)
+        try:
+            # kept by the daemon between commands: connect only renews the session if needed
+            components.get("Moodle").connect()
+        except (AuthenticationFailed, CredentialsUnavailable) as e:
+            components.get("Console").error("Unable to connect to Moodle: %s" % e)
+            return
+        return func(args)
+
+    return intercept_args
+
+def find_semester(semester_name):
+    ch = components.get("CourseHandler")
+    if semester_name is not None:
+        return ch.get_semester(semester_name)
+    else:
+        return ch.latest_semester()
+
+def build_parser():
+    # Check ref https://docs.python.org/3/library/argparse.html#argparse.ArgumentParser.add_argument
+    parser = argparse.ArgumentParser(prog="epfl", description='Manage EPFL courses')
+    parser.add_argument("--config"
+                        , action='store'
+                        , default=None
+                        , type=str)
+    parser.add_argument("--semester"
+                        , action='store'
+                        , default=None
+                        , type=str)
+
+    # Commands with `local` set always run in the process of the client
+    subparsers = parser.add_subparsers()
+    open_parser = subparsers.add_parser("open", aliases=["o"])
+    open_parser.add_argument("course")
+    open_parser.add_argument("target", default="site", nargs="?")
+    open_parser.set_defaults(func=wrap(command("CourseCommands.go_to_url")))
+
+    horaire = subparsers.add_parser("schedule", aliases=["s"])
+    horaire.set_defaults(func=wrap(command("Schedule.show")), local=True) # displayed in the terminal
+
+    watch_parser = subparsers.add_parser("watch", aliases=["w"])
+    watch_parser.add_argument("--polling", action="store_true",
+                              help="compare modification times instead of using inotify")
+    watch_parser.set_defaults(func=wrap(command("CourseCommands.watch")), local=True)
+
+    search_parser = subparsers.add_parser("search", aliases=["f"])
+    search_parser.add_argument("query", nargs="*", help="words to find (as prefixes) in the files of the courses")
+    search_parser.add_argument("--no-update", action="store_true",
+                               help="only query the index, without reading the changed files first")
+    search_parser.add_argument("--limit", type=int, default=20)
+    search_parser.set_defaults(func=wrap(command("CourseCommands.search")))
+
+    daemon_parser = subparsers.add_parser("daemon")
+    daemon_parser.add_argument("action", choices=["start", "stop", "status"], default="start", nargs="?")
+    daemon_parser.set_defaults(func=command("DaemonCommands.run"), local=True)
+
+    courses = subparsers.add_parser("courses", aliases=["c"])
+    courses.set_defaults(func=wrap(command("CourseCommands.listing")))
+
+    action_subparsers = courses.add_subparsers(help='action help')
+    show_parser = action_subparsers.add_parser("list")
+
+    link_parser = action_subparsers.add_parser("link")
+    link_parser.add_argument("course", default="", nargs="?")
+    link_parser.add_argument("--all", action="store_true", help="link all the unlinked courses with the Moodle courses of similar titles")
+    # only linking all the courses needs the list of the Moodle courses
+    link_parser.set_defaults(func=wrap(moodle_initializer(command("CourseCommands.link"), when=lambda args: args.all)))
+
+    news_parser = action_subparsers.add_parser("news")
+    news_parser.add_argument("course", default="", nargs="?")
+    news_parser.set_defaults(func=wrap(moodle_initializer(command("CourseCommands.news"))))
+
+    sync_parser = action_subparsers.add_parser("sync")
+    sync_parser.add_argument("course", default="", nargs="?")
+    sync_parser.set_defaults(func=wrap(moodle_initializer(command("CourseCommands.sync"))))
+
+    add_parser = action_subparsers.add_parser("add")
+    add_parser.set_defaults(func=wrap(command("CourseCommands.add")))
+
+    parser.set_defaults(func=wrap(command("CourseCommands.listing")))
+    return parser
+
+def execute(args):
+    """ Run the command of the parsed arguments """
+    from epflmanager.coursehandler import SemesterNotFound
+    try:
+        args.func(args)
+    except SemesterNotFound:
+        components.get("Console").error("Semester not found")
+
+def main(argv=None):
+    start_console()
+    try:
+        execute(build_parser().parse_args(argv))
+    finally:
+        components.teardown()
@@ -0,0 +1,123 @@
+""" Client of the daemon (see epflmanager.daemon) and their protocol.
+
+Only the standard library is imported here: the client must start fast.
+
+Messages are JSON objects preceded by their length (4 bytes, big endian).
+The client sends one request:
+
+    {"op": "run", "argv": [...], "cwd": "..."}   run a command
+    {"op": "status"}                             describe the daemon
+    {"op": "shutdown"}                           stop the daemon
+
+and the daemon answers with messages until the end of the request:
+
+    {"op": "print", "text": "...", "err": false}  text for stdout/stderr
+    {"op": "input", "prompt": "..."}              the client answers {"answer": "..."}
+    {"op": "password", "prompt": "..."}           same, without echo
+    {"op": "local"}                               run the command in-process instead
+    {"op": "exit", "status": 0, ...}              end of the request
+"""
+
+import os
+import sys
+import json
+import socket
+import struct
+
+HEADER = struct.Struct(">I")
+MAX_MESSAGE = 16 * 1024 * 1024
+
+class ProtocolError(ConnectionError): pass
+
+def socket_path():
+    """ Path of the socket of the daemon: $EPFL_DAEMON_SOCKET, or in
+    $XDG_RUNTIME_DIR, or in the configuration directory """
+    path = os.environ.get("EPFL_DAEMON_SOCKET")
+    if path:
+        return path
+    directory = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(os.path.expanduser("~"), ".config", "epflmanager")
+    return os.path.join(directory, "epflmanager.sock")
+
+def send(sock, message):
+    data = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 64 * 1024))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def recv(sock):
+    """ Return the next message, None if the connection is closed """
+    header = _recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    (size,) = HEADER.unpack(header)
+    if size > MAX_MESSAGE:
+        raise ProtocolError("Message of %d bytes is too big" % size)
+    data = _recv_exactly(sock, size)
+    if data is None:
+        raise ProtocolError("Connection closed in the middle of a message")
+    return json.loads(data.decode("utf-8"))
+
+def connect(path=None):
+    """ Return a socket connected to the daemon, None if it is not running """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path or socket_path())
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    return sock
+
+def request(message, path=None):
+    """ Send a control request (status, shutdown) and return the answer,
+    None if the daemon is not running """
+    sock = connect(path)
+    if sock is None:
+        return None
+    with sock:
+        send(sock, message)
+        return recv(sock)
+
+def run(argv, path=None):
+    """ Run a command in the daemon, forwarding its IO to the terminal.
+    Return the exit status, None if the command must run in-process (no
+    daemon, or a command that needs the terminal) """
+    sock = connect(path)
+    if sock is None:
+        return None
+
+    with sock:
+        send(sock, {"op": "run", "argv": argv, "cwd": os.getcwd()})
+        while True:
+            message = recv(sock)
+            if message is None:
+                sys.stderr.write("Connection to the daemon lost\n")
+                return 1
+
+            op = message["op"]
+            if op == "print":
+                stream = sys.stderr if message.get("err") else sys.stdout
+                stream.write(message["text"])
+                stream.flush()
+            elif op == "input":
+                try:
+                    answer = input(message["prompt"])
+                except EOFError:
+                    answer = None
+                send(sock, {"answer": answer})
+            elif op == "password":
+                import getpass
+                send(sock, {"answer": getpass.getpass(prompt=message["prompt"])})
+            elif op == "local":
+                return None
+            elif op == "exit":
+                return message.get("status", 0)
+            else:
+                raise ProtocolError("Unknown message %s" % op)
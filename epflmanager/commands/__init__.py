@@ -1,2 +1,5 @@
-from .coursemanagement import CourseCommands
-from .schedule import Schedule
+# Modules of the commands, imported when a command is first used (see
+# epflmanager.cli.command)
+MODULES = { "CourseCommands": "epflmanager.commands.coursemanagement",
+            "Schedule": "epflmanager.commands.schedule",
+            "DaemonCommands": "epflmanager.commands.daemon" }
@@ -1,3 +1,6 @@
+import os
+from collections import OrderedDict
+
 import epflmanager.components as components
 from epflmanager.common import *
 from epflmanager.io.console import *
@@ -9,8 +12,9 @@ class CourseCommands(object):
         adjustement = 20
         console.print("All courses for this semester: ")
         console.print("%s   %s" % ("Course:".ljust(adjustement), "Linked with Moodle:"))
-        for c in args.semester.courses():
-            console.print("- %s %s" % (c.name.ljust(adjustement), "[x]" if c.is_linked_with_moodle else ""))
+        ch = components.get("CourseHandler")
+        for c, meta in ch.courses_metadata(args.semester).items():
+            console.print("- %s %s" % (c.name.ljust(adjustement), "[x]" if meta.moodle_id is not None else ""))
 
     @staticmethod
     def add(args):
@@ -20,24 +24,210 @@ class CourseCommands(object):
 
         ch.add_course(course_name, semester=args.semester)
 
+    @staticmethod
+    def _choose_course(course_name, semester, keep=lambda c: True):
+        """ Return the course best matching the name in all the semesters, ask
+        the user to choose if the best match is not clear """
+        from epflmanager.fuzzy import clear_winner
+
+        ch = components.get("CourseHandler")
+        console = components.get("Console")
+        results = [ (score, c) for score, c in ch.find_courses(course_name, semester) if keep(c) ]
+        course = clear_winner(results)
+        if course is not None:
+            return course
+        return console.choose_from([ c for _, c in results ],
+                                   msg="What course do you want?",
+                                   display_func=lambda c: "%s (%s)" % (c.name, c.semester_name))
+
     @staticmethod
     def link(args):
+        if args.all:
+            return CourseCommands.link_all(args)
+        ch = components.get("CourseHandler")
         console = components.get("Console")
         course_name = args.course
         s = args.semester
         try:
-            course = console.choose_from(
-                s.filter_courses(lambda c: fuzzy_match(course_name, c.name) and not c.is_linked_with_moodle),
-                msg="What course do you want?",
-                display_func=lambda s: s.name)
+            course = CourseCommands._choose_course(course_name, s, lambda c: not c.is_linked_with_moodle)
             moodle_id = console.input("What is the moodle id of %s ? " % course.name)
+            others = ch.courses_with_moodle_id(moodle_id)
             course.link_with_moodle(moodle_id)
             console.info("Course linked!")
+            if others:
+                console.info("Also linked with this Moodle course: %s" %
+                             ", ".join("%s (%s)" % (c.name, c.semester_name) for c in others))
         except NoChoiceException:
             pass
         except UserQuitException:
             pass
 
+    @staticmethod
+    def link_all(args):
+        """ Link every unlinked course of the semester with the Moodle course
+        whose title is the most similar to its name, after one confirmation """
+        from epflmanager.fuzzy import match_names
+
+        ch = components.get("CourseHandler")
+        console = components.get("Console")
+        moodle = components.get("Moodle")
+
+        unlinked = { c.name: c for c in ch.unlinked_courses(args.semester) }
+        if not unlinked:
+            console.info("All the courses are linked with Moodle.")
+            return
+
+        # the Moodle courses already linked in this semester are not proposed again
+        linked_ids = { meta.moodle_id for meta in ch.courses_metadata(args.semester).values() }
+        titles = { title: moodle_id for title, moodle_id in moodle.courses.items() if str(moodle_id) not in linked_ids }
+        matches = sorted(match_names(unlinked.keys(), titles.keys()).items())
+        if not matches:
+            console.info("No Moodle course matches the unlinked courses.")
+            return
+
+        adjustement = max(len(name) for name, _ in matches)
+        console.print("%s   %s" % ("Course:".ljust(adjustement), "Moodle course:"))
+        for name, (score, title) in matches:
+            console.print("%s   %s (id %s, %d%%)" % (name.ljust(adjustement), title, titles[title], round(100 * score)))
+        unmatched = sorted(unlinked.keys() - dict(matches).keys())
+        if unmatched:
+            console.info("Not matched: %s" % ", ".join(unmatched))
+
+        if console.confirm("Link these %d courses?" % len(matches)):
+            ch.link_courses_with_moodle([ (unlinked[name], titles[title]) for name, (_, title) in matches ])
+            console.info("Courses linked!")
+
+    @staticmethod
+    def _linked_courses_resources(semester, course_name="", repair=False):
+        """ Fetch the Moodle resources of every linked course (matching the
+        name) at once. Yield (course, resources) as soon as they are fetched.
+        With `repair`, the renamed courses are repaired first (see
+        CourseHandler.repair_courses) """
+        ch = components.get("CourseHandler")
+        console = components.get("Console")
+        moodle = components.get("Moodle")
+
+        linked = ch.repair_courses(semester) if repair else ch.linked_courses(semester)
+        courses = [ c for c in linked if fuzzy_match(course_name, c.name) ]
+        if not courses and course_name:
+            # the linked course of another semester best matching the name
+            from epflmanager.fuzzy import clear_winner
+            course = clear_winner([ (score, c) for score, c in ch.find_courses(course_name, semester)
+                                    if c.is_linked_with_moodle ])
+            courses = [course] if course is not None else []
+
+        # courses linked with the same Moodle course share its resources
+        by_id = OrderedDict()
+        for c in courses:
+            by_id.setdefault(ch.moodle_id_for_course(c), []).append(c)
+        for moodle_id, resources, error in moodle.courses_resources(by_id.keys()):
+            for course in by_id[moodle_id]:
+                if error is not None:
+                    console.error("Unable to fetch the resources of %s: %s" % (course.name, error))
+                    continue
+                yield (course, resources)
+
+    @staticmethod
+    def news(args):
+        from epflmanager.sync import Synchronizer
+
+        console = components.get("Console")
+        synchronizer = Synchronizer(components.get("Moodle"))
+        for course, resources in CourseCommands._linked_courses_resources(args.semester, args.course):
+            changes = synchronizer.changes(course, course.read_manifest(), resources)
+            if not changes:
+                console.info("%s: nothing new" % course.name)
+                continue
+
+            console.print("%s:" % course.name)
+            for change in changes:
+                console.print("- [%s] %s (%s)" % (change.kind, change.name, change.section))
+
+    @staticmethod
+    def sync(args):
+        from epflmanager.sync import Synchronizer
+        from epflmanager.store import BlobStore
+
+        console = components.get("Console")
+        config = components.get("Config")
+        store_dir = config.get("directories", "store_dir",
+                               fallback=os.path.join(config["directories"]["main_dir"], ".store"))
+        synchronizer = Synchronizer(components.get("Moodle"), BlobStore(store_dir))
+
+        for course, resources in CourseCommands._linked_courses_resources(args.semester, args.course, repair=True):
+            results = synchronizer.sync(course, resources)
+            if not results:
+                console.info("%s is up to date" % course.name)
+                continue
+
+            console.print("%s:" % course.name)
+            for change, error in results:
+                if error is None:
+                    console.print("- [%s] %s%s" % (change.kind, change.name, " (already stored)" if change.stored else ""))
+                else:
+                    console.error("- [failed] %s: %s" % (change.name, error))
+
+    @staticmethod
+    def watch(args):
+        from epflmanager.watcher import create_watcher, InotifyWatcher
+
+        console = components.get("Console")
+        config = components.get("Config")
+        interval = config.getfloat("directories", "watch_poll_interval", fallback=5.0)
+        watcher = create_watcher(polling=args.polling, interval=interval)
+        console.info("Watching %s (%s), Ctrl-C to stop" %
+                     (watcher.main_dir, "inotify" if isinstance(watcher, InotifyWatcher) else "polling"))
+
+        def report(directories):
+            for d in directories:
+                console.print("- updated %s" % os.path.relpath(d, watcher.main_dir))
+
+        try:
+            watcher.run(callback=report)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+
+    @staticmethod
+    def search(args):
+        from epflmanager.config import default_config_dir
+        from epflmanager.search import SearchIndex, SearchUnavailable
+
+        ch = components.get("CourseHandler")
+        console = components.get("Console")
+        config = components.get("Config")
+        path = config.get("directories", "search_index_file",
+                          fallback=os.path.join(default_config_dir(), "search.sqlite"))
+        workers = config.getint("directories", "search_workers", fallback=None)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        try:
+            index = SearchIndex(path, workers)
+        except SearchUnavailable as e:
+            console.error(str(e))
+            return
+
+        try:
+            if not args.no_update:
+                courses = [ ("%s/%s" % (s.name, c.name), c.fullpath())
+                            for s in ch.sorted_semesters() for c in ch.courses(s) ]
+                indexed, removed = index.update(courses)
+                if indexed or removed:
+                    console.info("Index updated: %d files read, %d removed" % (indexed, removed))
+
+            query = " ".join(args.query)
+            if not query:
+                return
+            results = index.search(query, limit=args.limit)
+            if not results:
+                console.info("Nothing found for %s" % query)
+            main_dir = ch._main_dir.fullpath()
+            for result in results:
+                console.print("%s: %s" % (result.course, os.path.relpath(result.path, os.path.join(main_dir, result.course))))
+                console.print("    %s" % result.snippet)
+        finally:
+            index.close()
+
     @staticmethod
     def go_to_url(args):
         s = args.semester
@@ -45,16 +235,19 @@ class CourseCommands(object):
         console = components.get("Console")
 
         try:
-            course = console.choose_from(
-                s.filter_courses(lambda c: fuzzy_match(course_name, c.name)),
-                msg="What course do you want?",
-                display_func=lambda s: s.name)
+            course = CourseCommands._choose_course(course_name, s)
+        except NoChoiceException:
+            console.warn("No course matches %s." % course_name)
+            return
+        except UserQuitException:
+            return
 
+        try:
             url, site = console.choose_from(course.course_urls(),
                                             msg="URLs for %s" % course.name,
                                             display_func=lambda x: "%s (%s)" % (x[1].ljust(12),x[0]))
             sys_open(url)
         except NoChoiceException:
-            console.warn("The %s file in %s is empty." % (urls_file, course_name))
+            console.warn("The %s file in %s is empty." % (course.course_urls_filename, course.name))
         except UserQuitException:
             pass
@@ -0,0 +1,49 @@
+import logging
+
+import epflmanager.components as components
+import epflmanager.client as client
+
+logger = logging.getLogger(__name__)
+
+class DaemonCommands(object):
+    @staticmethod
+    def run(args):
+        { "start": DaemonCommands.start,
+          "stop": DaemonCommands.stop,
+          "status": DaemonCommands.status }[args.action](args)
+
+    @staticmethod
+    def start(args):
+        from epflmanager.daemon import Daemon
+
+        daemon = Daemon(config_file=args.config)
+        try:
+            daemon.bind()
+        except RuntimeError as e:
+            daemon.console.error(str(e))
+            return
+        daemon.console.info("Daemon listening on %s, Ctrl-C to stop" % daemon.path)
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+    @staticmethod
+    def stop(args):
+        console = components.get("Console")
+        if client.request({"op": "shutdown"}) is None:
+            console.warn("No daemon is running")
+        else:
+            console.info("Daemon stopped")
+
+    @staticmethod
+    def status(args):
+        console = components.get("Console")
+        status = client.request({"op": "status"})
+        if status is None:
+            console.info("No daemon is running")
+        else:
+            console.info("Daemon %d listening on %s for %ds, %d commands served" %
+                         (status["pid"], status["socket"], status["uptime"], status["requests"]))
+            for name, seconds in sorted(status["timings"].items(), key=lambda t: -t[1]):
+                console.info("- %s created in %.1f ms" % (name, seconds * 1000))
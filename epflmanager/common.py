@@ -19,6 +19,6 @@ def display_img(path):
 def fuzzy_match(to_match, model, case_insensitive=True):
     """ Return True iff the to_match "fuzzy matches" the model.
     Not so fuzzy for the moment """
-    lower = lambda x: x.lower() if case_insensitive else lambda x: x
+    lower = (lambda x: x.lower()) if case_insensitive else (lambda x: x)
 
     return lower(model).startswith(lower(to_match))
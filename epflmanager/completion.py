@@ -0,0 +1,252 @@
+""" Completion of the arguments of bin/epfl, used by the scripts of
+contrib/completion through `epfl __complete <words>`: the last word is the
+one being completed, the candidates are printed one per line.
+
+The names of the semesters, courses and sites (labels of site.url) are kept
+in a small JSON file. An entry is used as long as the modification time of
+the directory (or site.url file) it was read from did not change, so a TAB
+only costs a few stat calls: the course tree is only read through the
+CourseHandler when something changed. Only os, sys, json and time are
+imported when the entries are valid (not even logging, which alone takes
+longer than the rest of a TAB).
+"""
+
+import os
+import sys
+import json
+import time
+
+OPTIONS = ["--config", "--semester"]
+COMMANDS = ["open", "o", "schedule", "s", "watch", "w", "search", "f", "daemon", "courses", "c"]
+COURSE_ACTIONS = ["list", "link", "news", "sync", "add"]
+DAEMON_ACTIONS = ["start", "stop", "status"]
+COMMAND_OPTIONS = { "watch": ["--polling"], "w": ["--polling"],
+                    "search": ["--no-update", "--limit"], "f": ["--no-update", "--limit"] }
+ACTION_OPTIONS = { ("courses", "link"): ["--all"], ("c", "link"): ["--all"] }
+
+def cache_path():
+    return os.path.join(os.path.expanduser("~"), ".config", "epflmanager", "completion.json")
+
+def default_config_file():
+    # as epflmanager.config.default_config_file, without importing configparser
+    return os.path.join(os.path.expanduser("~"), ".config", "epflmanager", "config.ini")
+
+def _debug(msg):
+    import logging
+    logging.getLogger(__name__).debug(msg)
+
+def _matches(prefix, name):
+    """ Same rule as epflmanager.common.fuzzy_match """
+    return name.lower().startswith(prefix.lower())
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+class TreeSource(object):
+    """ Read the names through the CourseHandler of a configuration, started
+    the first time it is needed """
+    def __init__(self, config_file):
+        self.config_file = config_file
+        self._ch = None
+
+    @property
+    def course_handler(self):
+        if self._ch is None:
+            import epflmanager.cli as cli
+            import epflmanager.components as components
+            cli.start_console()
+            cli.start_components(self.config_file)
+            self._ch = components.get("CourseHandler")
+        return self._ch
+
+    @property
+    def main_dir(self):
+        return os.path.abspath(self.course_handler._main_dir.fullpath())
+
+    @property
+    def urls_file(self):
+        import epflmanager.components as components
+        return components.get("Config")["directories"]["course_urls_file"]
+
+    def semesters(self):
+        """ Names of the semesters, in chronological order """
+        return [ s.name for s in self.course_handler.sorted_semesters() ]
+
+    def courses(self, semester):
+        ch = self.course_handler
+        return [ c.name for c in ch.courses(ch.get_semester(semester)) ]
+
+    def sites(self, semester, course):
+        from epflmanager.io.specialdirs import CourseURLsFileNotFound
+        ch = self.course_handler
+        try:
+            return [ label for _, label in ch.get_course(course, ch.get_semester(semester)).course_urls() ]
+        except CourseURLsFileNotFound:
+            return []
+
+class CompletionCache(object):
+    """
+    Names of the semesters, of their courses and of the sites of the
+    courses, stored in `path` for the configuration `config_file`. The file
+    is thrown away when the configuration file changed.
+
+    As in epflmanager.cache, an entry read less than RACY nanoseconds after
+    the modification of its directory is read again next time: the
+    directory could have changed again within the same timestamp.
+    """
+    VERSION = 1
+    RACY = 2 * 10**9
+
+    def __init__(self, path, config_file, source=None):
+        self.path = path
+        self.config_file = os.path.abspath(config_file)
+        self.source = source if source is not None else TreeSource(self.config_file)
+        self.misses = 0
+        self._changed = False
+        self._data = self._load()
+
+    def _config_stamp(self):
+        st = os.stat(self.config_file)
+        return [self.config_file, st.st_mtime_ns, st.st_size]
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+
+        stamp = self._config_stamp()
+        if not isinstance(data, dict) or data.get("version") != self.VERSION or data.get("config") != stamp:
+            self._changed = True
+            data = { "version": self.VERSION, "config": stamp, "main_dir": self.source.main_dir,
+                     "urls_file": self.source.urls_file, "entries": {} }
+        return data
+
+    def save(self):
+        """ Write the entries if some changed. Failures are ignored: the
+        names are then read again next time """
+        if not self._changed:
+            return
+        tmp = "%s.%d.tmp" % (self.path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(self._data, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+            self._changed = False
+        except OSError as e:
+            _debug("Unable to write the completion cache %s: %s" % (self.path, e))
+
+    def _lookup(self, key, path, compute):
+        """ Names stored under `key`, computed again if `path` changed """
+        entries = self._data["entries"]
+        mtime = _mtime(path)
+        entry = entries.get(key)
+        if entry is not None and entry[0] == mtime and (mtime is None or entry[1] - mtime >= self.RACY):
+            return entry[2]
+
+        self.misses += 1
+        checked = time.time_ns()
+        names = compute()
+        entries[key] = [mtime, checked, names]
+        self._changed = True
+        return names
+
+    def semesters(self):
+        return self._lookup("", self._data["main_dir"], self.source.semesters)
+
+    def courses(self, semester):
+        path = os.path.join(self._data["main_dir"], semester)
+        return self._lookup(semester, path, lambda: self.source.courses(semester))
+
+    def sites(self, semester, course):
+        path = os.path.join(self._data["main_dir"], semester, course, self._data["urls_file"])
+        return self._lookup(semester + "/" + course, path, lambda: self.source.sites(semester, course))
+
+    def latest_semester(self):
+        semesters = self.semesters()
+        return semesters[-1] if semesters else None
+
+def complete(words, cache_for=None):
+    """ Return the candidates for the last of `words` (the arguments of
+    bin/epfl typed so far). `cache_for(config_file)` gives the
+    CompletionCache, only created if names of the tree are needed """
+    if cache_for is None:
+        cache_for = lambda config_file: CompletionCache(cache_path(), config_file)
+    words = list(words) or [""]
+    *done, current = words
+
+    options = {}
+    positional = []
+    i = 0
+    while i < len(done):
+        if done[i] in OPTIONS:
+            if i + 1 == len(done): # the current word is the value of the option
+                options["expected"] = done[i]
+            else:
+                options[done[i]] = done[i + 1]
+            i += 2
+            continue
+        if not done[i].startswith("-"):
+            positional.append(done[i])
+        i += 1
+
+    cache = None
+    def get_cache():
+        nonlocal cache
+        if cache is None:
+            cache = cache_for(options.get("--config") or default_config_file())
+        return cache
+
+    def semester():
+        return options.get("--semester") or get_cache().latest_semester()
+
+    def courses():
+        return get_cache().courses(semester()) if semester() else []
+
+    expected = options.get("expected")
+    if expected == "--config":
+        candidates = [] # left to the completion of files of the shell
+    elif expected == "--semester":
+        candidates = get_cache().semesters()
+    elif current.startswith("-"):
+        candidates = OPTIONS + (COMMAND_OPTIONS.get(positional[0], []) if positional else []) \
+                             + ACTION_OPTIONS.get(tuple(positional[:2]), [])
+    elif not positional:
+        candidates = COMMANDS
+    elif positional[0] in ("open", "o") and len(positional) == 1:
+        candidates = courses()
+    elif positional[0] in ("open", "o") and len(positional) == 2:
+        names = courses()
+        course = positional[1] if positional[1] in names else None
+        if course is None:
+            matching = [ c for c in names if _matches(positional[1], c) ]
+            course = matching[0] if len(matching) == 1 else None
+        candidates = get_cache().sites(semester(), course) if course else []
+    elif positional[0] in ("courses", "c") and len(positional) == 1:
+        candidates = COURSE_ACTIONS
+    elif positional[0] in ("courses", "c") and positional[1:] in (["link"], ["news"], ["sync"]):
+        candidates = courses()
+    elif positional[0] == "daemon" and len(positional) == 1:
+        candidates = DAEMON_ACTIONS
+    else:
+        candidates = []
+
+    if cache is not None:
+        cache.save()
+    return [ c for c in candidates if _matches(current, c) ]
+
+def main(words):
+    """ Print the candidates, one per line. Errors are only logged: a TAB
+    must not print a traceback in the middle of the command line """
+    try:
+        candidates = complete(words)
+    except Exception as e:
+        _debug("Completion failed: %s" % e)
+        return 0
+    sys.stdout.write("".join(c + "\n" for c in candidates))
+    return 0
@@ -1,32 +1,118 @@
 """ Components management inspired by the Deluge implementation """
 
+import time
 import logging
+from collections import namedtuple
 logger = logging.getLogger(__name__)
 
 class ComponentAlreadyRegisteredError(Exception): pass
+class ComponentDependencyError(Exception): pass
 
 class Component(object):
     def __init__(self, name):
         self._component_name = name
         register(self)
 
+    def teardown(self):
+        """ Release what the component holds (connections, threads, ...) """
+        pass
+
+# How to create a component: `factory()` once its dependencies exist,
+# `teardown(component)` to release it (its `teardown` method by default)
+Factory = namedtuple("Factory", ["create", "depends", "teardown"])
+
 class ComponentRegistry(object):
     def __init__(self, *args, **kwargs):
         self.components = {}
+        self.factories = {} # components created on first use
+        self.timings = {} # name -> seconds spent in the factory
+        self._order = [] # names of the started components, in creation order
+        self._creating = [] # names of the components being created
 
     def register(self, component):
         logger.info("Component %s initialized." % component._component_name)
         name = component._component_name
         if name in self.components:
             raise ComponentAlreadyRegisteredError("Component already registered as %s" % name)
+        # a component given explicitly replaces the one that was to be created
+        self.factories.pop(name, None)
         self.components[name] = component
+        self._order.append(name)
+
+    def register_factory(self, name, factory, depends=(), teardown=None):
+        """ Register a function creating a component, called the first time
+        the component is asked, after the creation of its dependencies """
+        if name in self.components or name in self.factories:
+            raise ComponentAlreadyRegisteredError("Component already registered as %s" % name)
+        self.factories[name] = Factory(factory, tuple(depends), teardown)
 
     def get(self, name):
-        return self.components.get(name)
+        component = self.components.get(name)
+        if component is None and name in self.factories:
+            component = self._create(name)
+        return component
+
+    def _create(self, name):
+        if name in self._creating:
+            cycle = self._creating[self._creating.index(name):] + [name]
+            raise ComponentDependencyError("Circular dependency: %s" % " -> ".join(cycle))
+
+        factory = self.factories[name]
+        self._creating.append(name)
+        try:
+            for dependency in factory.depends:
+                if self.get(dependency) is None:
+                    raise ComponentDependencyError("%s depends on %s, which is not registered" % (name, dependency))
+
+            start = time.perf_counter()
+            component = factory.create()
+            self.timings[name] = time.perf_counter() - start
+        finally:
+            self._creating.pop()
+
+        logger.debug("Component %s created in %.1f ms" % (name, self.timings[name] * 1000))
+        if name not in self.components: # not a Component registering itself
+            component._component_name = name
+            self.components[name] = component
+            self._order.append(name)
+        # the factory stays to create the component again after a teardown
+        self.factories[name] = factory
+        return component
+
+    def dependents(self, name):
+        """ Names of the started components depending (indirectly) on a component """
+        found = []
+        for other in self._order:
+            factory = self.factories.get(other)
+            if factory is not None and other not in found and \
+               any(d == name or d in found for d in factory.depends):
+                found.append(other)
+        return found
+
+    def teardown(self, name=None):
+        """ Release a component and the ones depending on it (all the
+        components if no name is given), most recently created first """
+        names = list(self._order) if name is None else [name] + self.dependents(name)
+        names = [ n for n in names if n in self.components ]
+        for n in sorted(names, key=self._order.index, reverse=True):
+            component = self.components.pop(n)
+            self._order.remove(n)
+            factory = self.factories.get(n)
+            try:
+                if factory is not None and factory.teardown is not None:
+                    factory.teardown(component)
+                elif hasattr(component, "teardown"):
+                    component.teardown()
+            except Exception as e:
+                logger.warn("Teardown of component %s failed: %s" % (n, e))
 
     def is_started(self, name):
         return name in self.components
 
+    def is_registered(self, name):
+        """ True if the component exists or will be created when asked """
+        return name in self.components or name in self.factories
+
 def as_component(obj, name):
     """ Lift an object to be registered as a Component """
     obj._component_name = name
@@ -36,4 +122,8 @@ _ComponentRegistry = ComponentRegistry()
 
 register = _ComponentRegistry.register
 get = _ComponentRegistry.get
+register_factory = _ComponentRegistry.register_factory
+teardown = _ComponentRegistry.teardown
 is_started = _ComponentRegistry.is_started
+is_registered = _ComponentRegistry.is_registered
+timings = _ComponentRegistry.timings
@@ -37,7 +37,11 @@ def read_config_file(filename):
 def start_config_component(config):
     components.as_component(config, "Config")
 
-def default_config_file():
+def default_config_dir():
     from os.path import join, expanduser
     from functools import reduce
-    return reduce(join, [expanduser('~'), '.config','epflmanager','config.ini'])
+    return reduce(join, [expanduser('~'), '.config','epflmanager'])
+
+def default_config_file():
+    from os.path import join
+    return join(default_config_dir(), 'config.ini')
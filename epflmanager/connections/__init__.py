@@ -0,0 +1,14 @@
+import epflmanager.components as components
+
+BACKENDS = {"html", "webservice"}
+
+def start_moodle_component():
+    """ Create the Moodle component with the backend chosen in the config """
+    backend = components.get("Config").get("moodle", "backend", fallback="html")
+    if backend == "webservice":
+        from .moodlews import MoodleWebService
+        return MoodleWebService()
+    elif backend == "html":
+        from .moodle import Moodle
+        return Moodle()
+    raise ValueError("Unknown Moodle backend %s (possible: %s)" % (backend, ", ".join(sorted(BACKENDS))))
@@ -0,0 +1,193 @@
+import os
+import asyncio
+import logging
+from http.cookies import SimpleCookie
+from urllib import parse
+from collections import defaultdict
+
+import aiohttp
+import requests
+from yarl import URL
+
+import epflmanager.components as components
+from .moodle import parse_courses, parse_course_resources, IMPORTANT_COOKIES
+from .downloader import Downloader, DownloadError
+from .session import SessionStore, credentials_source, get_credentials, check_tequila_answer, TEQUILA_LOGIN_URL
+
+logger = logging.getLogger(__name__)
+
+def jar_from_requests(cookies):
+    """ Convert the cookies of a requests session to an aiohttp CookieJar """
+    jar = aiohttp.CookieJar(unsafe=True)
+    for cookie in cookies:
+        morsel = SimpleCookie()
+        morsel[cookie.name] = cookie.value
+        morsel[cookie.name]["path"] = cookie.path
+        if cookie.domain_specified:
+            morsel[cookie.name]["domain"] = cookie.domain
+        jar.update_cookies(morsel, response_url=URL("https://%s/" % cookie.domain.lstrip(".")))
+    return jar
+
+def jar_to_requests(jar):
+    """ Convert an aiohttp CookieJar to the cookies of a requests session """
+    cookies = requests.cookies.RequestsCookieJar()
+    for morsel in jar:
+        cookies.set_cookie(requests.cookies.create_cookie(
+            morsel.key, morsel.value, domain=morsel["domain"], path=morsel["path"] or "/"))
+    return cookies
+
+class AsyncMoodle(object):
+    """
+    asyncio counterpart of Moodle: the same operations, as coroutines, on a
+    single aiohttp session. Any number of requests can be in flight at once
+    on one thread, `concurrency` bounding how many are sent to Moodle at the
+    same time. The cookies are shared with Moodle through the session file.
+
+    To be used as an asynchronous context manager:
+
+        async with AsyncMoodle() as moodle:
+            await moodle.connect()
+            courses = await moodle.courses()
+    """
+    def __init__(self, concurrency=None, main_url=None, course_url=None, cookie_file=None):
+        config = components.get("Config")
+
+        self._session_store = SessionStore(cookie_file or config["moodle"]["cookie_file"],
+                                           lifetime=config.getint("moodle", "session_lifetime", fallback=4*3600))
+        self._credentials = credentials_source(config)
+        self._main_url = main_url or config["moodle"]["main_url"]
+        self._course_url = course_url or config["moodle"]["course_url"]
+        if concurrency is None:
+            concurrency = config.getint("moodle", "async_concurrency", fallback=32)
+        self._concurrency = concurrency
+
+        self._session = None
+        self._semaphore = None
+
+        # Used as caches
+        self._courses = None
+        self._resources = defaultdict(list)
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self._concurrency)
+        self._session = aiohttp.ClientSession(cookie_jar=self.load_cookies())
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def load_cookies(self):
+        """ Return the cookies of the last session as an aiohttp CookieJar.
+        The jar is empty if there is no valid session """
+        session = self._session_store.load()
+        if session is None:
+            return aiohttp.CookieJar(unsafe=True)
+        return jar_from_requests(session[0])
+
+    def save_cookies(self):
+        self._session_store.save(jar_to_requests(self._session.cookie_jar))
+
+    async def _get_text(self, url):
+        async with self._semaphore:
+            async with self._session.get(url) as resp:
+                return await resp.text()
+
+    async def connect(self):
+        names = { morsel.key for morsel in self._session.cookie_jar }
+        if not IMPORTANT_COOKIES.issubset(names):
+            logger.info("Outdated or no cookies, need to reauthenticate")
+            components.get("Console").info("Outdated or no cookies, need to reauthenticate")
+            await self.authentication_process()
+        else:
+            logger.info("Good cookies, no need to reauthenticate")
+
+    async def authentication_process(self):
+        loginUrl = self._main_url + "/login/"
+        authUrl = self._main_url + "/auth/tequila"
+
+        async with self._session.get(loginUrl) as login:
+            reqkey = parse.parse_qs(login.url.query_string).get("requestkey")[0]
+
+        gaspar, password = get_credentials(self._credentials)
+        async with self._session.post(TEQUILA_LOGIN_URL % reqkey, data={"username": gaspar, "password": password}) as teq:
+            text = await teq.text()
+        del gaspar
+        del password
+
+        # raises AuthenticationFailed: a refused session is never saved
+        check_tequila_answer(text)
+
+        async with self._session.get(authUrl) as auth:
+            pass
+
+        # As the authentication is successful, we save the cookies collected
+        self.save_cookies()
+
+    async def _parse(self, parser, text):
+        """ Parse in a thread to keep the event loop free for the other requests """
+        return await asyncio.get_running_loop().run_in_executor(None, parser, text)
+
+    async def courses(self):
+        if not self._courses:
+            text = await self._get_text(self._main_url + "/my/")
+            self._courses = await self._parse(parse_courses, text)
+
+        return self._courses
+
+    async def course_resources(self, course_id):
+        if not self._resources[course_id]:
+            text = await self._get_text(self._course_url.format(course_id=course_id))
+            self._resources[course_id] = await self._parse(parse_course_resources, text)
+
+        return self._resources[course_id]
+
+    async def courses_resources(self, course_ids):
+        """ Fetch the resources of all the courses at once. Yield the tuples
+        (course_id, resources, error) as soon as a course is done """
+        async def fetch(course_id):
+            try:
+                return (course_id, await self.course_resources(course_id), None)
+            except Exception as e:
+                logger.warn("Resources of course %s could not be fetched: %s" % (course_id, e))
+                return (course_id, None, e)
+
+        for done in asyncio.as_completed([ fetch(course_id) for course_id in course_ids ]):
+            yield await done
+
+    async def download(self, download):
+        """ Stream a resource to the disk. Return the path of the downloaded file """
+        async with self._semaphore:
+            async with self._session.get(download.url) as resp:
+                if resp.status != 200:
+                    raise DownloadError("Unable to download %s (HTTP %d)" % (download.url, resp.status))
+
+                filename = download.filename or Downloader.filename_from_response(resp)
+                path = os.path.join(download.directory, filename)
+                part = path + Downloader.PART_SUFFIX
+                with open(part, "wb") as f:
+                    async for chunk in resp.content.iter_chunked(Downloader.CHUNK_SIZE):
+                        f.write(chunk)
+
+        os.replace(part, path)
+        download.path = path
+        logger.info("Downloaded %s to %s" % (download.url, path))
+        return path
+
+    async def download_all(self, downloads):
+        """ Download all the resources at once. Yield the tuples
+        (download, error) as soon as they are finished """
+        async def fetch(download):
+            try:
+                await self.download(download)
+                return (download, None)
+            except Exception as e:
+                logger.warn("Download of %s failed: %s" % (download.url, e))
+                return (download, e)
+
+        for done in asyncio.as_completed([ fetch(d) for d in downloads ]):
+            yield await done
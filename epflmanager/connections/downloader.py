@@ -0,0 +1,285 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from urllib import parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+class DownloadError(Exception): pass
+
+def free_name(filename, taken):
+    """ Return `filename` or, if `taken(filename)`, the first "name (n).ext"
+    that is not taken """
+    base, ext = os.path.splitext(filename)
+    name, n = filename, 1
+    while taken(name):
+        n += 1
+        name = "%s (%d)%s" % (base, n, ext)
+    return name
+
+class Download(object):
+    """ A resource to fetch: its url and the directory it will be saved in.
+    The filename is given by the server if it is not set. `replaces` is the
+    path of the previous version of the resource, the only existing file
+    the download may overwrite """
+    def __init__(self, url, directory, filename=None, replaces=None):
+        self.url = url
+        self.directory = directory
+        self.filename = filename
+        self.replaces = replaces
+        self.path = None # set once the download is finished
+        self.fingerprint = None # validators of the content given by the server
+
+    def __str__(self):
+        return "Download: %s" % self.url
+
+    def __repr__(self):
+        return "<" + str(self) + ">"
+
+class Downloader(object):
+    """ Fetch many resources at once with a bounded pool of threads that all
+    share the same session (and thus the same keep-alive connections) """
+    CHUNK_SIZE = 64 * 1024
+    PART_SUFFIX = ".part"
+
+    def __init__(self, session, workers=4):
+        self._session = session
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._claimed = set() # (directory, filename) of the running downloads
+
+        # One connection per worker is kept alive for every host
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    @staticmethod
+    def filename_from_response(resp):
+        """ Find the name of the file sent in the response: use the
+        Content-Disposition header if any, the last part of the url otherwise """
+        disposition = resp.headers.get("Content-Disposition", "")
+        m = re.search(r"filename\*=(?:UTF-8'')?([^;]+)", disposition, re.IGNORECASE)
+        if m is None:
+            m = re.search(r'filename="?([^";]+)"?', disposition, re.IGNORECASE)
+        if m is not None:
+            name = parse.unquote(m.group(1).strip().strip('"'))
+        else:
+            name = parse.unquote(os.path.basename(parse.urlparse(str(resp.url)).path))
+
+        # never let the server choose where the file goes
+        name = os.path.basename(name)
+        if not name:
+            # without the query of the url, that can hold a token
+            raise DownloadError("No filename could be found for %s" % parse.urlparse(str(resp.url)).path)
+        return name
+
+    @staticmethod
+    def fingerprint(resp):
+        """ Return what the server tells about the content of a response, to
+        be able to recognise the same content later without downloading it """
+        size = resp.headers.get("Content-Length")
+        if resp.headers.get("Content-Encoding", "identity") != "identity":
+            size = None # the length is the one of the encoded content
+        return { "etag": resp.headers.get("ETag"),
+                 "last_modified": resp.headers.get("Last-Modified"),
+                 "size": int(size) if size is not None and size.isdigit() else None }
+
+    def probe(self, url):
+        """ Return the fingerprint of the resource at the url without
+        downloading it, None if the server cannot give it """
+        try:
+            resp = self._session.request("head", url, allow_redirects=True)
+        except requests.RequestException as e:
+            logger.info("Unable to probe %s: %s" % (url, e))
+            return None
+        if resp.status_code != 200:
+            return None
+        return Downloader.fingerprint(resp)
+
+    @staticmethod
+    def journal_path(download):
+        """ The journal of a download is found with its url only, as the name
+        of the file is only known once the server answered """
+        key = hashlib.sha1(download.url.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(download.directory, ".download-%s.json" % key)
+
+    @staticmethod
+    def read_journal(download):
+        """ Return the journal of an interrupted download, None if there is none """
+        try:
+            with open(Downloader.journal_path(download), "r") as f:
+                journal = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return journal if journal.get("url") == download.url else None
+
+    @staticmethod
+    def write_journal(download, journal):
+        with open(Downloader.journal_path(download), "w") as f:
+            json.dump(journal, f)
+
+    def _request(self, download, journal):
+        """ Start the request of the download. Ask only for the missing part
+        of the file if a previous attempt was interrupted. Return the response
+        and the number of bytes already downloaded """
+        headers = {}
+        offset = 0
+        if journal is not None and journal.get("resumable"):
+            part = os.path.join(download.directory, journal["filename"] + Downloader.PART_SUFFIX)
+            offset = os.path.getsize(part) if os.path.isfile(part) else 0
+            validator = journal["fingerprint"].get("etag") or journal["fingerprint"].get("last_modified")
+            if offset > 0 and validator:
+                headers["Range"] = "bytes=%d-" % offset
+                # the server sends the whole file again if it changed
+                headers["If-Range"] = validator
+            else:
+                offset = 0
+
+        resp = self._session.request("get", download.url, stream=True, headers=headers)
+        if offset > 0 and resp.status_code == 206:
+            m = re.match(r"bytes (\d+)-", resp.headers.get("Content-Range", ""))
+            if m is None or int(m.group(1)) != offset:
+                resp.close()
+                raise DownloadError("Invalid range received for %s" % download.url)
+            logger.info("Resuming %s at byte %d" % (download.url, offset))
+            return (resp, offset)
+        if offset > 0 and resp.status_code == 416 and offset == journal["fingerprint"].get("size"):
+            # everything was received, only the rename is missing
+            resp.close()
+            return (None, offset)
+        if resp.status_code == 416:
+            # the partial file cannot be used, start over
+            resp.close()
+            resp = self._session.request("get", download.url, stream=True)
+        return (resp, 0)
+
+    def _taken(self, directory, name, replaces, reserved):
+        """ True if the name is written by another download of the running
+        batches, or is the one of a file (existing or `reserved`) that the
+        download does not replace """
+        path = os.path.join(directory, name)
+        if replaces is not None and path == os.path.abspath(replaces):
+            return (directory, name) in self._claimed
+        return (directory, name) in self._claimed or path in reserved or os.path.lexists(path)
+
+    def _claim(self, directory, filename, claimed, replaces=None, reserved=frozenset()):
+        """ Return a name that no other download of the running batches
+        writes to and that is not the one of another file ("name (2).ext" if
+        `filename` is taken), and reserve it in `claimed`, the names of the
+        batch """
+        directory = os.path.abspath(directory)
+        with self._lock:
+            name = free_name(filename, lambda name: self._taken(directory, name, replaces, reserved))
+            self._claimed.add((directory, name))
+            claimed.add((directory, name))
+        if name != filename:
+            logger.info("Another file is named %s in %s, saving this one as %s" % (filename, directory, name))
+        return name
+
+    def _release(self, claimed):
+        with self._lock:
+            self._claimed.difference_update(claimed)
+
+    def download(self, download, reserved=()):
+        """ Stream a single resource to the disk, chunk by chunk.
+
+        The content is first written to a `.part` file along with a journal, so
+        that an interrupted download is resumed where it stopped (if the server
+        supports ranges) the next time. The file gets its final name only once
+        it is complete. The paths of `reserved` (belonging to other resources,
+        even if the files are missing) are never written to. Return the path
+        of the downloaded file """
+        claimed = set()
+        try:
+            return self._download(download, claimed, Downloader._reserved(reserved))
+        finally:
+            self._release(claimed)
+
+    @staticmethod
+    def _reserved(paths):
+        return frozenset(os.path.abspath(p) for p in paths)
+
+    def _download(self, download, claimed, reserved=frozenset()):
+        """ download(), the names used being reserved in `claimed` """
+        logger.debug("Downloading %s" % download.url)
+        journal = Downloader.read_journal(download)
+        filename = None
+        if journal is not None:
+            filename = self._claim(download.directory, journal["filename"], claimed, download.replaces, reserved)
+            if filename != journal["filename"]:
+                # another file has this name now
+                journal = None
+        resp, offset = self._request(download, journal)
+
+        if resp is not None:
+            with resp:
+                if resp.status_code not in {200, 206}:
+                    raise DownloadError("Unable to download %s (HTTP %d)" % (download.url, resp.status_code))
+
+                if offset == 0:
+                    wanted = download.filename or Downloader.filename_from_response(resp)
+                    if journal is None or journal["filename"] != wanted:
+                        filename = self._claim(download.directory, wanted, claimed, download.replaces, reserved)
+                    journal = { "url": download.url,
+                                "filename": filename,
+                                "fingerprint": Downloader.fingerprint(resp),
+                                "resumable": (resp.headers.get("Accept-Ranges", "").lower() == "bytes" and
+                                               resp.headers.get("Content-Encoding", "identity") == "identity") }
+                    Downloader.write_journal(download, journal)
+
+                part = os.path.join(download.directory, filename + Downloader.PART_SUFFIX)
+                with open(part, "ab" if offset > 0 else "wb") as f:
+                    for chunk in resp.iter_content(chunk_size=Downloader.CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
+
+        part = os.path.join(download.directory, filename + Downloader.PART_SUFFIX)
+        size = journal["fingerprint"].get("size")
+        if size is not None and os.path.getsize(part) != size:
+            raise DownloadError("Incomplete download of %s (%d of %d bytes)" % (download.url, os.path.getsize(part), size))
+
+        path = os.path.join(download.directory, filename)
+        os.replace(part, path)
+        os.remove(Downloader.journal_path(download))
+
+        download.fingerprint = journal["fingerprint"]
+        download.path = path
+        logger.info("Downloaded %s to %s" % (download.url, path))
+        return path
+
+    def download_all(self, downloads, reserved=()):
+        """ Download all the resources concurrently, never writing to the
+        paths of `reserved`. Yield the tuples (download, error) as soon as
+        they are finished, error being None if the download succeeded """
+        # the same url asked twice for a directory is downloaded once
+        same = {}
+        for d in downloads:
+            same.setdefault((d.url, os.path.abspath(d.directory)), []).append(d)
+        if not same:
+            return
+
+        # the names stay reserved until the end of the batch: two resources
+        # of a directory with the same name are saved under different names
+        claimed = set()
+        reserved = Downloader._reserved(reserved)
+        try:
+            with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                futures = { executor.submit(self._download, ds[0], claimed, reserved): ds for ds in same.values() }
+                for future in as_completed(futures):
+                    first, *others = futures[future]
+                    error = future.exception()
+                    if error is not None:
+                        logger.warn("Download of %s failed: %s" % (first.url, error))
+                    yield (first, error)
+                    for download in others:
+                        download.path, download.fingerprint = first.path, first.fingerprint
+                        yield (download, error)
+        finally:
+            self._release(claimed)
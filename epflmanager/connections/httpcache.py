@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+class HTTPCache(object):
+    """
+    Persistent cache of the pages fetched from Moodle.
+
+    Every entry keeps the body of the page, its validators (ETag and
+    Last-Modified) and the results of the parsers that were run on it. A page
+    fetched less than `ttl` seconds ago is served without any request, an
+    older one is revalidated with a conditional request: when the server
+    answers 304 (or sends the same body again), the page is neither
+    downloaded nor parsed again.
+
+    The results are kept under the qualified name of the parser and its
+    `version` attribute (1 if it has none), to be increased when the parser
+    gives another result for the same page.
+
+    The entries least recently used are evicted once the cache grows over
+    `max_size` bytes.
+    """
+    CHUNK_SIZE = 16 * 1024
+
+    def __init__(self, directory, ttl=300, max_size=50*1024*1024):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, key)
+        return (base + ".json", base + ".body")
+
+    def _read(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            with open(body_path, "r", encoding="utf-8") as f:
+                body = f.read()
+        except (FileNotFoundError, ValueError):
+            return (None, None)
+        return (meta, body) if meta.get("url") == url else (None, None)
+
+    def _write_meta(self, url, meta):
+        meta_path, _ = self._paths(url)
+        tmp = "%s.%d.tmp" % (meta_path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, meta_path)
+
+    def _write(self, url, meta, body):
+        os.makedirs(self.directory, exist_ok=True)
+        _, body_path = self._paths(url)
+        tmp = "%s.%d.tmp" % (body_path, os.getpid())
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(body)
+        os.replace(tmp, body_path)
+        self._write_meta(url, meta)
+        self.evict()
+
+    @staticmethod
+    def parser_key(parser):
+        """ Key of the results of a parser in the entries """
+        return "%s.%s:%s" % (parser.__module__, getattr(parser, "__qualname__", type(parser).__qualname__),
+                             getattr(parser, "version", 1))
+
+    @staticmethod
+    def _parsed(meta, body, parser):
+        """ Return the result of the parser on the body, parsing only if the
+        result is not already in the entry """
+        name = HTTPCache.parser_key(parser)
+        if name not in meta["parsed"]:
+            logger.debug("Parsing %s with %s" % (meta["url"], name))
+            meta["parsed"][name] = parser(body)
+            return (meta["parsed"][name], True)
+        return (meta["parsed"][name], False)
+
+    def fetch(self, session, url, parser, stream=False, check=None):
+        """ Return the result of `parser` applied on the page at the url,
+        using the cached page and parsing result whenever possible.
+
+        With `stream`, the parser is given an iterable of text chunks instead
+        of the whole page, so that a new page is parsed while it is received.
+        `check(response)` is called on every response before it is used, to
+        reject it by raising an exception """
+        meta, body = self._read(url)
+        now = time.time()
+
+        if meta is not None and now - meta["validated_at"] < self.ttl:
+            logger.debug("Fresh cache entry for %s" % url)
+            result, changed = HTTPCache._parsed(meta, [body] if stream else body, parser)
+            if changed:
+                self._write_meta(url, meta)
+            else:
+                os.utime(self._paths(url)[0]) # mark as recently used
+            return result
+
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        with session.request("get", url, headers=headers, stream=stream) as resp:
+            if check is not None:
+                check(resp)
+            if meta is not None and resp.status_code == 304:
+                logger.debug("%s not modified" % url)
+                meta["validated_at"] = now
+                result, _ = HTTPCache._parsed(meta, [body] if stream else body, parser)
+                self._write_meta(url, meta)
+                return result
+
+            if resp.status_code != 200 or resp.history:
+                # errors and redirections (e.g. to the login page) are never cached
+                return parser([resp.text] if stream else resp.text)
+
+            if not stream:
+                text = resp.text
+                parsed = None
+            else:
+                # keep the chunks while they are parsed
+                if resp.encoding is None:
+                    resp.encoding = "utf-8"
+                chunks = []
+                def received():
+                    for chunk in resp.iter_content(chunk_size=HTTPCache.CHUNK_SIZE, decode_unicode=True):
+                        chunks.append(chunk)
+                        yield chunk
+                parsed = parser(received())
+                text = "".join(chunks)
+
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if meta is None or meta["digest"] != digest:
+            meta = { "url": url, "digest": digest, "parsed": {} }
+        meta.update({ "etag": resp.headers.get("ETag"),
+                      "last_modified": resp.headers.get("Last-Modified"),
+                      "validated_at": now })
+        if parsed is not None:
+            meta["parsed"][HTTPCache.parser_key(parser)] = parsed
+        result, _ = HTTPCache._parsed(meta, [text] if stream else text, parser)
+        self._write(url, meta, text)
+        return result
+
+    def invalidate(self, url):
+        for path in self._paths(url):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache fits in its size """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+
+        entries = []
+        total = 0
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.directory, name)
+            body_path = meta_path[:-len(".json")] + ".body"
+            try:
+                size = os.path.getsize(meta_path) + os.path.getsize(body_path)
+                used = os.path.getmtime(meta_path)
+            except FileNotFoundError:
+                continue
+            entries.append((used, size, meta_path, body_path))
+            total += size
+
+        entries.sort()
+        while total > self.max_size and entries:
+            used, size, meta_path, body_path = entries.pop(0)
+            logger.debug("Evicting %s from the cache" % meta_path)
+            for path in (meta_path, body_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
@@ -1,8 +1,10 @@
 import requests
 import os
-import pickle
+import time
+import threading
 from urllib import parse
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,137 +12,270 @@ logger = logging.getLogger(__name__)
 from pyquery import PyQuery
 
 import epflmanager.components as components
+from epflmanager.config import default_config_dir
+from .downloader import Downloader, Download
+from .httpcache import HTTPCache
+from .moodleparser import parse_course_resources, iter_course_resources
+from .session import SessionStore, AuthenticationFailed, CredentialsUnavailable, credentials_source, \
+    get_credentials, check_tequila_answer, TEQUILA_LOGIN_URL
 
 # Notes:
 # - not connected/enrolled if `enrol` in the response url when trying to access resources
-# -
+# - cookies are not correctly set by moodle, sessions are considered valid for 4h (see SessionStore)
+
+# Cookies needed to be considered as logged in
+IMPORTANT_COOKIES = {'MoodleSession', 'TequilaPHP', 'tequila_key', 'tequila_user'}
+TEQUILA_HOST = "tequila.epfl.ch"
+
+def resource_id(url):
+    """ Return the Moodle id of the resource the url points to, or None if
+    the url is not the one of a downloadable resource """
+    url = parse.urlparse(url)
+    if not url.path.endswith("/mod/resource/view.php"):
+        return None
+    ids = parse.parse_qs(url.query).get("id")
+    return int(ids[0]) if ids else None
+
+def parse_courses(html):
+    """ Return a map from the titles of the courses listed in the page to their ids """
+    # hackish way to get the id
+    def get_course_id(url):
+        return int(url[url.rindex('id=')+3:])
+
+    p = PyQuery(html, parser="html")
+    courses = []
+    p(".coc-course").find("h3").find("a").each(lambda i,e: courses.append(e.attrib))
+    return { course['title']: get_course_id(course['href']) for course in courses }
+
+class Moodle(components.Component):
+    # Bounds of the delay before a background renewal of the session
+    MIN_REFRESH_DELAY = 60
+    MAX_REFRESH_BACKOFF = 3600
 
-# TODO:
-# - Set an expiration time (4h ?) on cookies as they are not correctly set by moodle
-#
-
-class Moodle(object):
     def __init__(self):
         config = components.get("Config")
 
         self._cookies = None # we don't directly use the session.cookies to load/save cookies
-        self._cookie_file = config["moodle"]["cookie_file"]
+        self._issued = None  # when the session of the cookies was issued
+        self._session_store = SessionStore(config["moodle"]["cookie_file"],
+                                           lifetime=config.getint("moodle", "session_lifetime", fallback=4*3600))
+        self._refresh_margin = config.getint("moodle", "session_refresh_margin", fallback=15*60)
+        if self._refresh_margin >= self._session_store.lifetime:
+            logger.warn("session_refresh_margin (%d) must be smaller than session_lifetime (%d), using %d" %
+                        (self._refresh_margin, self._session_store.lifetime, self._session_store.lifetime // 4))
+            self._refresh_margin = self._session_store.lifetime // 4
+        self._credentials = credentials_source(config)
+        self._refresh_timer = None
+        self._refresh_failures = 0
         self._main_url = config["moodle"]["main_url"]
         self._course_url = config["moodle"]["course_url"]
         self._session = requests.session()
+        self._download_workers = config.getint("moodle", "download_workers", fallback=4)
+        self._downloader = None
+        self._listing_workers = config.getint("moodle", "listing_workers", fallback=4)
 
-        self._important_cookies = {'MoodleSession', 'TequilaPHP', 'tequila_key', 'tequila_user'}
+        cache_dir = config.get("moodle", "cache_dir", fallback=os.path.join(default_config_dir(), "cache"))
+        self._cache = HTTPCache(cache_dir,
+                                ttl=config.getint("moodle", "cache_ttl", fallback=300),
+                                max_size=config.getint("moodle", "cache_max_size", fallback=50*1024*1024))
 
-        # Used as caches
+        # Answers kept for the current command only (see forget_answers)
         self._courses = None
         self._resources = defaultdict(list)
 
         self.load_cookies()
+        super().__init__("Moodle")
+
+    def forget_answers(self):
+        """ Forget the courses and resources fetched by the previous command:
+        the daemon keeps the component from a command to the next, the
+        HTTPCache decides what is fetched again """
+        self._courses = None
+        self._resources.clear()
 
     def connect(self):
+        """ Prepare the component for a command: called by each command
+        using Moodle """
+        self.forget_answers()
         console = components.get("Console")
         cookies = self._cookies
 
-        if cookies is not None:
-            cookies.clear_expired_cookies()
-
-        if cookies is None or not self._important_cookies.issubset(set(cookies.get_dict().keys())):
+        if cookies is None or not IMPORTANT_COOKIES.issubset(set(cookies.get_dict().keys())):
             logger.info("Outdated or no cookies, need to reauthenticate")
             console.info("Outdated or no cookies, need to reauthenticate")
             self.authentication_process()
+        elif self.expires_in() <= 0:
+            logger.info("Session expired, need to reauthenticate")
+            console.info("Session expired, need to reauthenticate")
+            self.authentication_process()
+        elif self._credentials is not None and self.expires_in() < self._refresh_margin:
+            logger.info("Session expires soon, renewing it")
+            self.authentication_process()
         else:
             logger.info("Good cookies, no need to reauthenticate")
             self._session.cookies = cookies
 
+        self.schedule_refresh()
+
+    def check_session(self, resp):
+        """ Raise AuthenticationFailed if Moodle redirected the request to
+        the login page: the session is not valid anymore (and the login page
+        must not be parsed as an empty one) """
+        if not resp.history:
+            return
+        url = parse.urlparse(resp.url)
+        login = parse.urlparse(self._main_url.rstrip("/") + "/login/")
+        if url.netloc == TEQUILA_HOST or (url.netloc == login.netloc and url.path.startswith(login.path)):
+            # the next connect authenticates again
+            self._cookies = None
+            self._issued = None
+            raise AuthenticationFailed("Redirected to the login page: the Moodle session expired")
+
+    def expires_in(self):
+        """ Number of seconds before the current session expires """
+        if self._issued is None:
+            return 0
+        return self._session_store.expires_at(self._issued) - time.time()
+
+    def schedule_refresh(self, delay=None):
+        """ Renew the session in the background shortly before it expires
+        (or in `delay` seconds), never sooner than MIN_REFRESH_DELAY. Only
+        possible if the credentials can be obtained without the user """
+        if self._credentials is None:
+            return
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+
+        if delay is None:
+            delay = self.expires_in() - self._refresh_margin
+        delay = max(Moodle.MIN_REFRESH_DELAY, delay)
+        logger.debug("Session will be renewed in %d seconds" % delay)
+        self._refresh_timer = threading.Timer(delay, self._refresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def _refresh(self):
+        """ Run by the timer: the messages only go to the log, the console
+        may be the one of another command (in the daemon) """
+        try:
+            self.authentication_process()
+        except (AuthenticationFailed, CredentialsUnavailable) as e:
+            # the same credentials would fail again (and could lock the account)
+            logger.error("Renewal of the Moodle session failed, not trying again: %s" % e)
+            self._refresh_timer = None
+            return
+        except Exception as e:
+            self._refresh_failures += 1
+            delay = min(Moodle.MAX_REFRESH_BACKOFF, Moodle.MIN_REFRESH_DELAY * 2 ** min(self._refresh_failures - 1, 16))
+            logger.warn("Renewal of the Moodle session failed, trying again in %d seconds: %s" % (delay, e))
+            self.schedule_refresh(delay)
+            return
+
+        self._refresh_failures = 0
+        self.schedule_refresh()
+
+    def close(self):
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+            self._refresh_timer = None
+
+    def teardown(self):
+        self.close()
+        self._session.close()
+
     def save_cookies(self, cookies):
-        with open(self._cookie_file, "wb") as f:
-            pickle.dump(cookies, f)
+        self._session_store.save(cookies, self._issued)
 
     def load_cookies(self):
         """
-        Try to load cookies from the cookie file.
-        Fail silently if the file does not exist.
+        Try to load the cookies of the last session.
+        Fail silently if there is no valid session.
         """
-        try:
-            with open(self._cookie_file, "rb") as f:
-                self._cookies = pickle.load(f)
-        except FileNotFoundError:
-            pass
+        session = self._session_store.load()
+        if session is not None:
+            self._cookies, self._issued = session
 
     def authentication_process(self):
         loginUrl = self._main_url + "/login/"
         authUrl = self._main_url + "/auth/tequila"
-        teqUrl = "https://tequila.epfl.ch/cgi-bin/tequila/login?requestkey=%s"
 
-        login = self._session.request("get", loginUrl)
+        # The current session is kept usable until the new one is ready
+        session = requests.session()
+        login = session.request("get", loginUrl)
 
-        console = components.get("Console")
-        gaspar = console.input("Gaspar user: ")
-        password = console.password()
+        # the console is never used in the background: the refresh needs credentials
+        gaspar, password = get_credentials(self._credentials)
 
         loginData = parse.urlencode({"username": gaspar, "password": password})
         loginData = loginData.encode("utf-8")
 
         reqkey = parse.parse_qs(parse.urlparse(login.url).query).get("requestkey")[0]
 
-        teq = self._session.request("post", teqUrl % reqkey, data=loginData)
+        teq = session.request("post", TEQUILA_LOGIN_URL % reqkey, data=loginData)
         del gaspar
         del password
         del loginData
 
-        if not "You are connected as" in teq.text:
-            console.error("Authentication failed")
+        check_tequila_answer(teq.text)
 
-        auth = self._session.request("get", authUrl)
-        self._cookies = self._session.cookies
+        auth = session.request("get", authUrl)
+        self._cookies = session.cookies
+        self._issued = time.time()
+        self._session.cookies.update(session.cookies)
 
         # As the authentication is successful, we save the cookies collected
         self.save_cookies(self._cookies)
 
     @property
     def courses(self):
-        # hackish way to get the id
-        def get_course_id(url):
-            return int(url[url.rindex('id=')+3:])
-
         if not self._courses:
-            p = PyQuery(self._session.request("get", self._main_url + "/my/").text)
-            courses = []
-            p(".coc-course").find("h3").find("a").each(lambda i,e: courses.append(e.attrib))
-            self._courses = { course['title']: get_course_id(course['href']) for course in courses }
+            self._courses = self._cache.fetch(self._session, self._main_url + "/my/", parse_courses,
+                                              check=self.check_session)
 
         return self._courses
 
     def course_resources(self, course_id):
-        def create_link(pylink):
-            d = {}
-            d.update(pylink.attrib)
-            d["text"] = pylink.text_content()
-            return d
-
         if not self._resources[course_id]:
-            course_resp = self._session.request("get", self._course_url.format(course_id=course_id))
-
-            pcourse = PyQuery(course_resp.text)
-
-            links = []
-            pcourse("h3.sectionname").parent().find("a").each(lambda i,e: links.append(e))
-            attrs = list(map(lambda x: x.attrib, links))
-            list(map(lambda ix: attrs[ix[0]].update({'text': ix[1].text_content()}), enumerate(links)))
-
-            links = []
-            pcourse("h3.sectionname").parent().each(lambda i,x: links.append({ "links": list(pcourse(x).find("a").map(lambda i,l: create_link(l))), "name": pcourse(x).find("h3.sectionname").text()}))
-            links
-            self._resources[course_id] = links
+            url = self._course_url.format(course_id=course_id)
+            self._resources[course_id] = self._cache.fetch(self._session, url, parse_course_resources, stream=True,
+                                                           check=self.check_session)
 
         return self._resources[course_id]
 
-#def download_file(s, url, localfile):
-#    CHUNK_SIZE = 1024
-#    resp = s.request("get", url, stream=True)
-#    with open(localfile, "wb") as f:
-#        for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
-#            if chunk:
-#                f.write(chunk)
-#
-#    return True
+    def iter_course_resources(self, course_id):
+        """ Yield the sections of a course as soon as they are received,
+        without waiting for the whole page (nor using the cache) """
+        url = self._course_url.format(course_id=course_id)
+        with self._session.request("get", url, stream=True) as resp:
+            self.check_session(resp)
+            if resp.encoding is None:
+                resp.encoding = "utf-8"
+            yield from iter_course_resources(resp.iter_content(chunk_size=HTTPCache.CHUNK_SIZE, decode_unicode=True))
+
+    def courses_resources(self, course_ids):
+        """ Fetch the resources of many courses concurrently. Yield the tuples
+        (course_id, resources, error) as soon as a course is done, error being
+        None if its resources could be fetched """
+        course_ids = list(course_ids)
+        if not course_ids:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(self._listing_workers, len(course_ids))) as executor:
+            futures = { executor.submit(self.course_resources, course_id): course_id for course_id in course_ids }
+            for future in as_completed(futures):
+                error = future.exception()
+                if error is not None:
+                    logger.warn("Resources of course %s could not be fetched: %s" % (futures[future], error))
+                yield (futures[future], future.result() if error is None else None, error)
+
+    @property
+    def downloader(self):
+        if self._downloader is None:
+            self._downloader = Downloader(self._session, workers=self._download_workers)
+        return self._downloader
+
+    def download_resources(self, links, directory):
+        """ Download every link (as returned by `course_resources`) in the
+        given directory. Yield (download, error) as they are finished """
+        downloads = [ Download(link["href"], directory) for link in links ]
+        return self.downloader.download_all(downloads)
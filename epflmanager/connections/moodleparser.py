@@ -0,0 +1,96 @@
+""" Single-pass parser of the Moodle course pages """
+
+import re
+import logging
+
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+def _text(element):
+    return "".join(element.itertext())
+
+def _is_section_title(element):
+    return element.tag == "h3" and "sectionname" in (element.get("class") or "").split()
+
+class CoursePageParser(object):
+    """
+    Find the sections of a course page while it is fed. A section is the
+    element containing a `h3.sectionname`: its name is the text of the title
+    and its links are all the `a` it contains.
+
+    The page is read once by the incremental parser of lxml, which only
+    reports the end of the `h3` elements. As the sections follow each other,
+    a section is complete as soon as the title of the next one (outside of
+    it) is read, or once the page is finished. It is then handed out by
+    `sections()` and dropped from the tree, so that the memory used stays
+    bounded by the size of a section rather than the size of the page.
+    """
+    def __init__(self):
+        self._parser = etree.HTMLPullParser(events=("end",), tag="h3")
+        self._pending = [] # (element containing a section, name of the section)
+
+    def feed(self, chunk):
+        self._parser.feed(chunk)
+
+    def close(self):
+        try:
+            self._parser.close()
+        except etree.XMLSyntaxError:
+            pass # nothing was fed
+
+    def sections(self, final=False):
+        """ Return the sections finished since the last call. With `final`,
+        the sections still open are considered finished """
+        sections = []
+        for _, element in self._parser.read_events():
+            if not _is_section_title(element):
+                continue
+            container = element.getparent()
+            if container is None or any(c is container for c,_ in self._pending):
+                continue
+
+            # every section before this title that does not contain it is complete
+            ancestors = set(container.iterancestors())
+            while self._pending and self._pending[0][0] not in ancestors:
+                sections.append(self._section(*self._pending.pop(0)))
+            self._pending.append((container, re.sub(r"\s+", " ", _text(element)).strip()))
+
+        if final:
+            while self._pending:
+                sections.append(self._section(*self._pending.pop(0)))
+        return sections
+
+    def _section(self, element, name):
+        links = []
+        for a in element.iter("a"):
+            link = dict(a.attrib)
+            link["text"] = _text(a)
+            links.append(link)
+
+        # free the section and what came before it
+        element.clear()
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+
+        return { "name": name, "links": links }
+
+def iter_course_resources(chunks):
+    """ Parse a course page given as an iterable of text chunks. Yield its
+    sections { "name": ..., "links": [...] } as soon as they are complete """
+    parser = CoursePageParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from parser.sections()
+    parser.close()
+    yield from parser.sections(final=True)
+
+def parse_course_resources(chunks):
+    """ Return the sections of a course page as a list of dicts
+    { "name": section name, "links": [attributes of the links and their "text"] }.
+    The page can be given whole or as an iterable of text chunks """
+    if isinstance(chunks, str):
+        chunks = [chunks]
+    return list(iter_course_resources(chunks))
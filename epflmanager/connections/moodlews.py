@@ -0,0 +1,109 @@
+import logging
+from urllib import parse
+
+import requests
+
+import epflmanager.components as components
+from .moodle import Moodle
+
+logger = logging.getLogger(__name__)
+
+class MoodleWebServiceError(Exception): pass
+
+def courses_from_enrolments(enrolments):
+    """ Return a map from the titles of the courses to their ids, given the
+    result of `core_enrol_get_users_courses` """
+    return { course["fullname"]: int(course["id"]) for course in enrolments }
+
+def sections_from_contents(contents):
+    """ Convert the result of `core_course_get_contents` to the sections
+    returned by `Moodle.course_resources`. The links of the files also have a
+    "download" url, fetched with the token (see WebServiceToken) """
+    sections = []
+    for section in contents:
+        links = []
+        for module in section.get("modules", []):
+            if "url" not in module:
+                continue # labels and the like
+            link = { "href": module["url"], "text": module.get("name", ""), "modname": module.get("modname", "") }
+            files = [ c for c in module.get("contents", []) if c.get("type") == "file" ]
+            if module.get("modname") == "resource" and files:
+                link["download"] = files[0]["fileurl"]
+                link["filename"] = files[0].get("filename")
+                link["filesize"] = files[0].get("filesize")
+            links.append(link)
+        sections.append({ "name": section.get("name", ""), "links": links })
+    return sections
+
+class WebServiceToken(requests.auth.AuthBase):
+    """ Add the token to the requests of the files served by the web service
+    when they are sent: the urls that are kept, logged or shown never
+    contain it """
+    FILES_PATH = "/webservice/pluginfile.php"
+
+    def __init__(self, token, host):
+        self.token = token
+        self.host = host
+
+    def __call__(self, request):
+        url = parse.urlparse(request.url)
+        if url.netloc == self.host and url.path.startswith(self.FILES_PATH):
+            request.prepare_url(request.url, { "token": self.token })
+        return request
+
+class MoodleWebService(Moodle):
+    """
+    Backend using the REST web service of Moodle instead of scraping its
+    HTML pages: the answers are compact JSON documents that cost almost
+    nothing to parse and do not depend on the theme of the site.
+
+    It needs a web service token (`token` in the `moodle` section of the
+    config), that can be found in the security keys of the Moodle preferences.
+    """
+    def __init__(self):
+        super().__init__()
+        config = components.get("Config")
+        self._token = config.get("moodle", "token", fallback=None)
+        self._ws_url = config.get("moodle", "webservice_url",
+                                  fallback=self._main_url.rstrip("/") + "/webservice/rest/server.php")
+        self._user_id = None
+        if self._token:
+            self._session.auth = WebServiceToken(self._token, parse.urlparse(self._ws_url).netloc)
+
+    def call(self, function, **params):
+        """ Call a function of the web service and return its decoded result """
+        params.update({ "wstoken": self._token, "wsfunction": function, "moodlewsrestformat": "json" })
+        resp = self._session.request("post", self._ws_url, data=params)
+        if resp.status_code != 200:
+            raise MoodleWebServiceError("%s failed (HTTP %d)" % (function, resp.status_code))
+
+        result = resp.json()
+        if isinstance(result, dict) and "exception" in result:
+            raise MoodleWebServiceError("%s failed: %s" % (function, result.get("message", result["exception"])))
+        return result
+
+    def connect(self):
+        self.forget_answers()
+        if not self._token:
+            components.get("Console").error("No Moodle web service token in the configuration")
+            raise MoodleWebServiceError("No token to connect to the web service")
+
+        self._user_id = self.call("core_webservice_get_site_info")["userid"]
+        logger.info("Connected to the web service as user %d" % self._user_id)
+
+    @property
+    def courses(self):
+        if not self._courses:
+            self._courses = courses_from_enrolments(self.call("core_enrol_get_users_courses", userid=self._user_id))
+
+        return self._courses
+
+    def course_resources(self, course_id):
+        if not self._resources[course_id]:
+            contents = self.call("core_course_get_contents", courseid=course_id)
+            self._resources[course_id] = sections_from_contents(contents)
+
+        return self._resources[course_id]
+
+    def iter_course_resources(self, course_id):
+        yield from self.course_resources(course_id)
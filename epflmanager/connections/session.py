@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import logging
+import subprocess
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+class CredentialsUnavailable(Exception): pass
+class AuthenticationFailed(Exception): pass
+
+# Where the credentials are sent, with the request key given by Moodle
+TEQUILA_LOGIN_URL = "https://tequila.epfl.ch/cgi-bin/tequila/login?requestkey=%s"
+
+class SessionStore(object):
+    """
+    Persist the cookies of an authenticated Moodle session along with the
+    time the session was issued. Moodle does not set a correct expiration on
+    its cookies, so a session is considered valid for `lifetime` seconds
+    (4h by default) after it was issued.
+
+    The file is a small versioned JSON document:
+
+        { "version": 1, "issued": 1457355360.0,
+          "cookies": [[name, value, domain, path, secure, expires], ...] }
+
+    Files in another format (like the pickled cookie jars written before)
+    are ignored, which only means that a new authentication is needed.
+    """
+    VERSION = 1
+
+    def __init__(self, path, lifetime=4*3600):
+        self.path = path
+        self.lifetime = lifetime
+
+    def save(self, cookies, issued=None):
+        if issued is None:
+            issued = time.time()
+        session = { "version": SessionStore.VERSION,
+                    "issued": issued,
+                    "cookies": [ [c.name, c.value, c.domain, c.path, c.secure, c.expires] for c in cookies ] }
+
+        tmp = self.path + ".tmp"
+        # the cookies give access to the account: keep them private
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(session, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def load(self):
+        """ Return the tuple (cookies, issued) of the saved session, None if
+        there is no usable session (missing, expired or in another format) """
+        try:
+            with open(self.path, "r") as f:
+                session = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (ValueError, UnicodeDecodeError):
+            logger.info("Session file %s is in an unknown format, ignoring it" % self.path)
+            return None
+
+        if not isinstance(session, dict) or session.get("version") != SessionStore.VERSION:
+            logger.info("Session file %s has an unknown version, ignoring it" % self.path)
+            return None
+
+        if self.expires_at(session["issued"]) <= time.time():
+            logger.info("Saved session has expired")
+            return None
+
+        cookies = requests.cookies.RequestsCookieJar()
+        for name, value, domain, path, secure, expires in session["cookies"]:
+            cookies.set_cookie(requests.cookies.create_cookie(
+                name, value, domain=domain, path=path, secure=secure, expires=expires))
+        cookies.clear_expired_cookies()
+        return (cookies, session["issued"])
+
+    def expires_at(self, issued):
+        return issued + self.lifetime
+
+def credentials_source(config):
+    """ Return a function giving the (username, password) to authenticate
+    without asking the user, or None if the credentials must be asked.
+
+    The `credentials` key of the `moodle` section selects the source:
+    - `prompt` (default): ask the user
+    - `env`: read EPFL_GASPAR_USER and EPFL_GASPAR_PASSWORD
+    - `command`: username from `gaspar_user`, password printed by `password_command`
+    """
+    source = config.get("moodle", "credentials", fallback="prompt")
+
+    if source == "prompt":
+        return None
+    elif source == "env":
+        def from_env():
+            try:
+                return (os.environ["EPFL_GASPAR_USER"], os.environ["EPFL_GASPAR_PASSWORD"])
+            except KeyError as e:
+                raise CredentialsUnavailable("Environment variable %s is not set" % e.args[0])
+        return from_env
+    elif source == "command":
+        user = config.get("moodle", "gaspar_user", fallback=None)
+        command = config.get("moodle", "password_command", fallback=None)
+        if not user or not command:
+            raise CredentialsUnavailable("gaspar_user and password_command are needed to get the credentials")
+        def from_command():
+            try:
+                output = subprocess.check_output(command, shell=True, universal_newlines=True)
+            except subprocess.CalledProcessError as e:
+                raise CredentialsUnavailable("%s failed with status %d" % (command, e.returncode))
+            return (user, output.splitlines()[0] if output else "")
+        return from_command
+
+    raise CredentialsUnavailable("Unknown credentials source %s" % source)
+
+def get_credentials(credentials):
+    """ Return the (username, password) given by a source of credentials_source,
+    asked to the user if it is None """
+    if credentials is not None:
+        return credentials()
+    import epflmanager.components as components
+    console = components.get("Console")
+    return (console.input("Gaspar user: "), console.password())
+
+def check_tequila_answer(text):
+    """ Raise AuthenticationFailed unless Tequila accepted the credentials """
+    if not "You are connected as" in text:
+        raise AuthenticationFailed("Tequila refused the credentials")
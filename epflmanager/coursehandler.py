@@ -3,6 +3,9 @@ import logging
 from collections import OrderedDict
 
 import epflmanager.components as components
+import epflmanager.cache as cache
+import epflmanager.metadata as metadata
+from epflmanager.catalogue import CourseCatalogue
 from epflmanager.io import *
 
 logger = logging.getLogger(__name__)
@@ -23,9 +26,9 @@ class CourseHandler(components.Component):
         parent, name = Path.split_parent(config["directories"]["main_dir"])
         self._main_dir = Directory(parent)(name)
 
-        # Cache
-        self._semesters = {} # map from semester to (map from names to courses)
-        self._courses = {} # map from name to courses
+        cache.shared.clear()
+        metadata.shared.clear()
+        self._catalogue = CourseCatalogue(self._semester_directories)
 
     def can_be_course_dir(self, d):
         """ Decide if a directory can be a course directory
@@ -43,9 +46,9 @@ class CourseHandler(components.Component):
 
     def semesters(self):
         """ Returns all semesters """
-        if not self._semesters:
-           self._semesters = { d.as_class(SemesterDir): {} for d in self._main_dir.dirs() if self.is_semester_dir(d) }
-        return list(self._semesters.keys())
+        main_dir = self._main_dir.fullpath()
+        return cache.shared.get((os.path.abspath(main_dir), "semesters"), lambda:
+            [ d.as_class(SemesterDir) for d in self._main_dir.dirs() if self.is_semester_dir(d) ], main_dir)
 
     def get_semester(self, name):
         for s in self.semesters():
@@ -70,24 +73,162 @@ class CourseHandler(components.Component):
         if semester is None:
             semester = self.latest_semester()
 
-        if not self._semesters.get(semester, None):
-            courses = ( (c.name,c.as_class(CourseDir)) for c in semester.courses() )
-            self._semesters[semester] = OrderedDict(courses)
+        return list(self._courses_by_name(semester).values())
 
-        return list(self._semesters[semester].values())
+    def _courses_by_name(self, semester):
+        """ Map from the names of the courses of a semester to the courses """
+        semester_dir = semester.fullpath()
+        return cache.shared.get((os.path.abspath(semester_dir), "courses_by_name"), lambda:
+            OrderedDict( (c.name, c.as_class(CourseDir)) for c in semester.courses() ), semester_dir)
+
+    def catalogue(self):
+        """ Return the CourseCatalogue of all the semesters, up to date """
+        self._catalogue.update({ s.name: self._courses_by_name(s) for s in self.semesters() })
+        return self._catalogue
+
+    def find_courses(self, query, semester=None):
+        """ Return the (score, course) of the courses of all the semesters
+        matching the query, best first. The courses of `semester` (the latest
+        one by default) are preferred, and are the only ones returned for an
+        empty query """
+        if semester is None:
+            semester = self.latest_semester()
+        catalogue = self.catalogue()
+
+        if not query.strip():
+            return [ (0.0, c) for c in self.courses(semester) ]
+
+        results = []
+        for score, (semester_name, course_name) in catalogue.fuzzy.search(query):
+            if semester_name == semester.name:
+                score += 0.1
+            results.append((score, catalogue.course(semester_name, course_name)))
+        results.sort(key=lambda r: -r[0])
+        return results
+
+    def courses_metadata(self, semester=None):
+        """ Map from the courses of the semester to their CourseMetadata (Moodle
+        id and site.url), read at once and only parsed if they changed """
+        return metadata.shared.courses(self.courses(semester))
+
+    def linked_courses(self, semester=None):
+        """ Return the courses of the semester that are linked with Moodle.
+        Only reads: see repair_courses for the renamed courses """
+        return [ c for c, meta in self.courses_metadata(semester).items() if meta.moodle_id is not None ]
+
+    def repair_courses(self, semester=None):
+        """ Like linked_courses, but the Moodle files of the renamed courses
+        are repaired first and the locations of the linked courses are
+        recorded in the CourseIndex (for the next repairs). Used before
+        synchronizing, not by the commands that only list the courses """
+        linked = []
+        for c, meta in self.courses_metadata(semester).items():
+            moodle_id = meta.moodle_id
+            if moodle_id is None and self.repair_rename(c):
+                moodle_id = metadata.shared.moodle_id(c.moodle_file_path)
+            if moodle_id is not None:
+                linked.append((c, moodle_id))
+        self._remember_locations(linked)
+        return [ c for c, _ in linked ]
+
+    def _remember_locations(self, links):
+        index = components.get("CourseIndex")
+        if index is not None:
+            locations = []
+            for course, moodle_id in links:
+                path = os.path.abspath(course.fullpath())
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError: # removed since it was listed
+                    index.forget_course(path)
+                    continue
+                locations.append((path, st.st_dev, st.st_ino, moodle_id))
+            index.remember_courses(locations)
+
+    def repair_rename(self, course):
+        """ If the directory of the course was linked with Moodle under another
+        name (renamed or moved), rename its Moodle file after the new name of
+        the course. Return True if the course was repaired.
+
+        The directory is recognized by its device and inode, recorded in the
+        CourseIndex when the course was last seen linked: this costs one
+        `stat` and one lookup, no search of the Moodle file in the tree """
+        index = components.get("CourseIndex")
+        if index is None:
+            return False
+        path = os.path.abspath(course.fullpath())
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        known = index.course_by_file(st.st_dev, st.st_ino)
+        if known is None or known[0] == path:
+            return False
+
+        old_path, moodle_id = known
+        old_moodle_file = os.path.join(path, CourseDir.moodle_filename_of(os.path.basename(old_path)))
+        if not os.path.exists(old_moodle_file) or os.path.exists(course.moodle_file_path):
+            return False
+
+        logger.info("%s was moved to %s, renaming its Moodle file" % (old_path, path))
+        os.rename(old_moodle_file, course.moodle_file_path)
+        metadata.shared.invalidate(old_moodle_file)
+        metadata.shared.invalidate(course.moodle_file_path)
+        self._catalogue.forget_moodle_ids()
+        index.remember_course(path, st.st_dev, st.st_ino, moodle_id)
+        return True
+
+    def _find_moved(self, course_name, semester):
+        """ Return the course of the semester that was named `course_name`
+        when it was last seen linked with Moodle, None if there is none """
+        index = components.get("CourseIndex")
+        if index is None:
+            return None
+        known = index.course_by_path(os.path.join(os.path.abspath(semester.fullpath()), course_name))
+        if known is None:
+            return None
+
+        dev, inode, _ = known
+        courses = self._courses_by_name(semester)
+        with os.scandir(semester.fullpath()) as entries:
+            for entry in entries:
+                # the inode of an entry is known without stat
+                if entry.inode() == inode and entry.name in courses and entry.stat().st_dev == dev:
+                    course = courses[entry.name]
+                    break
+            else:
+                return None
+        self.repair_rename(course)
+        return course
 
     def get_course(self, course_name, semester=None):
         """ Try to retreive a course by its name, raise a CourseNotFound exception if
-        there is no such course """
+        there is no such course. Without semester, the course is looked for in
+        the latest semester, then in the most recent semester having it """
         if semester is None:
-            semester = self.latest_semester()
+            courses = self._courses_by_name(self.latest_semester())
+            if course_name in courses:
+                return courses[course_name]
+            found = self.catalogue().by_name(course_name)
+            if found:
+                return found[-1]
+            semesters = reversed(self.sorted_semesters())
+        else:
+            courses = self._courses_by_name(semester)
+            if course_name in courses:
+                return courses[course_name]
+            semesters = [semester]
 
-        # initialize the courses
-        courses = self.courses(semester=semester)
-        if not course_name in self._semesters[semester]:
-            raise CourseNotFound("Course %s could not be found" % course_name)
+        # renamed since it was last used?
+        for s in semesters:
+            course = self._find_moved(course_name, s)
+            if course is not None:
+                return course
+        raise CourseNotFound("Course %s could not be found" % course_name)
 
-        return self._semesters[semester][course_name]
+    def courses_with_moodle_id(self, moodle_id):
+        """ Return the courses of all the semesters linked with a Moodle id """
+        return self.catalogue().by_moodle_id(moodle_id)
 
     def add_course(self, course_name, semester=None, ask_confirmation=False):
         # Possible ways to add a course:
@@ -105,36 +246,50 @@ class CourseHandler(components.Component):
             console.warn("Directory %s was not created. Aborting." % course_directory)
             return False
 
+        # What was cached for a former directory with the same name is stale
+        cache.shared.invalidate(semester_dir)
+        cache.shared.invalidate(course_directory)
+
         # Directory was created
         return True
 
     def moodle_id_for_course(self, course):
-        try:
-            config = course.read_moodle_config()
-            return config["course"]["moodle_id"]
-        except (KeyError, MoodleFileNotFound):
+        moodle_id = metadata.shared.moodle_id(course.moodle_file_path)
+        if moodle_id is None:
             raise CourseNotLinkedWithMoodle("Course %s is not linked with Moodle." % course.name)
+        return moodle_id
 
     def link_course_with_moodle(self, course, moodle_id):
-        import configparser
+        self.link_courses_with_moodle([(course, moodle_id)])
 
-        moodle_config = None
-        try:
-            moodle_config = course.read_moodle_config()
-            logger.debug("Moodle file for %s exists and was read." % course)
-            if not "course" in moodle_config:
-                moodle_config.add_section("course")
-            moodle_config["course"]["moodle_id"] = str(moodle_id)
-        except MoodleFileNotFound:
-            logger.info("Creating the moodle config for the course %s" % course.name)
-            moodle_config = CourseHandler.moodle_config_skeleton(course_name=course.name, moodle_id=moodle_id)
+    def link_courses_with_moodle(self, links):
+        """ Write the Moodle files of the (course, moodle id) of `links`, then
+        update the catalogue and the CourseIndex once for all of them """
+        for course, moodle_id in links:
+            moodle_config = None
+            try:
+                moodle_config = course.read_moodle_config()
+                logger.debug("Moodle file for %s exists and was read." % course)
+                if not "course" in moodle_config:
+                    moodle_config.add_section("course")
+                moodle_config["course"]["moodle_id"] = str(moodle_id)
+            except MoodleFileNotFound:
+                logger.info("Creating the moodle config for the course %s" % course.name)
+                moodle_config = CourseHandler.moodle_config_skeleton(course_name=course.name, moodle_id=moodle_id)
+
+            course.write_moodle_config(moodle_config)
+        self._catalogue.forget_moodle_ids()
+        self._remember_locations(links)
 
-        course.write_moodle_config(moodle_config)
+    def unlinked_courses(self, semester=None):
+        """ Return the courses of the semester that are not linked with Moodle """
+        linked = set(self.linked_courses(semester))
+        return [ c for c in self.courses(semester) if c not in linked ]
 
     @staticmethod
     def moodle_config_skeleton(course_name, moodle_id):
         from configparser import ConfigParser
-        config = ConfigParser()
+        config = ConfigParser(interpolation=None)
         config.add_section("course")
         config['course']['course_name'] = course_name
         config['course']['moodle_id'] = str(moodle_id)
@@ -0,0 +1,186 @@
+import io
+import os
+import sys
+import time
+import socket
+import logging
+
+import epflmanager.components as components
+from epflmanager.io.console import ConsoleManager
+from epflmanager.client import send, recv, socket_path, connect, ProtocolError
+
+logger = logging.getLogger(__name__)
+
+class ClientGone(ConnectionError): pass
+
+class RemoteStream(io.TextIOBase):
+    """ Text stream whose writes are printed by the client """
+    def __init__(self, console, err=False):
+        self._console = console
+        self._err = err
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if text:
+            self._console.send({"op": "print", "text": text, "err": self._err})
+        return len(text)
+
+class RemoteConsole(ConsoleManager):
+    """ Console of the daemon: the IO is done by the client currently served """
+    def __init__(self):
+        super().__init__(printer=RemoteStream(self), error=RemoteStream(self, err=True))
+        self._connection = None
+
+    def attach(self, connection):
+        self._connection = connection
+
+    def detach(self):
+        self._connection = None
+
+    def send(self, message):
+        if self._connection is None:
+            # outside of a request (background tasks): goes to the log of the daemon
+            if message["op"] != "print":
+                raise ClientGone("No client to talk to")
+            sys.__stderr__.write(message["text"])
+            return
+        try:
+            send(self._connection, message)
+        except OSError as e:
+            raise ClientGone(str(e))
+
+    def _ask(self, op, text):
+        self.send({"op": op, "prompt": text})
+        reply = recv(self._connection)
+        if reply is None:
+            raise ClientGone("Client left while asked for an input")
+        return reply.get("answer")
+
+    def input(self, text, default=None):
+        inp = self._ask("input", text)
+        if inp is None:
+            raise EOFError("No input from the client")
+        if default is not None and not inp.strip():
+            inp = default
+        return inp
+
+    def password(self, text="Password: "):
+        return self._ask("password", text)
+
+class Daemon(object):
+    """
+    Long-running process owning the components (config, course handler and
+    their caches, Moodle session) and running the commands of `bin/epfl`
+    sent over a Unix domain socket, one at a time. See epflmanager.client
+    for the protocol.
+
+    The configuration is read once: restart the daemon after changing it.
+    """
+    def __init__(self, config_file=None, path=None):
+        from epflmanager import cli
+        from epflmanager.config import default_config_file
+        self._cli = cli
+        self.path = path or socket_path()
+        self.config_file = os.path.abspath(config_file or default_config_file())
+        self._socket = None
+        self._running = False
+        self._started = time.time()
+        self._requests = 0
+
+        self.console = RemoteConsole()
+        cli.start_components(self.config_file)
+        self._parser = cli.build_parser()
+
+    def bind(self):
+        if connect(self.path) is not None:
+            raise RuntimeError("A daemon is already listening on %s" % self.path)
+        if os.path.exists(self.path):
+            os.remove(self.path) # left by a daemon that was killed
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # the daemon acts on behalf of the user: nobody else may connect
+        old_umask = os.umask(0o177)
+        try:
+            self._socket.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        self._socket.listen(8)
+        logger.info("Listening on %s" % self.path)
+
+    def serve_forever(self):
+        if self._socket is None:
+            self.bind()
+        self._running = True
+        try:
+            while self._running:
+                connection, _ = self._socket.accept()
+                with connection:
+                    try:
+                        self.handle(connection)
+                    except (ClientGone, ProtocolError, OSError) as e:
+                        logger.info("Request aborted: %s" % e)
+        finally:
+            self.close()
+
+    def close(self):
+        components.teardown()
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def status(self):
+        return { "op": "exit", "status": 0, "pid": os.getpid(), "socket": self.path,
+                 "uptime": time.time() - self._started, "requests": self._requests,
+                 "timings": dict(components.timings) }
+
+    def handle(self, connection):
+        message = recv(connection)
+        if message is None:
+            return
+        op = message.get("op")
+        if op == "status":
+            send(connection, self.status())
+        elif op == "shutdown":
+            self._running = False
+            send(connection, self.status())
+        elif op == "run":
+            status = self.run(connection, message)
+            if status is None:
+                send(connection, { "op": "local" })
+            else:
+                self._requests += 1
+                send(connection, { "op": "exit", "status": status })
+        else:
+            raise ProtocolError("Unknown request %s" % op)
+
+    def run(self, connection, message):
+        """ Run a command for a client, return its exit status (None if it
+        must be run by the client) """
+        self.console.attach(connection)
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = self.console.printer, self.console._error # argparse messages
+        try:
+            os.chdir(message["cwd"])
+            args = self._parser.parse_args(message["argv"])
+            if getattr(args, "local", False) or (args.config and os.path.abspath(args.config) != self.config_file):
+                return None
+
+            logger.info("Running %s" % " ".join(message["argv"]))
+            self._cli.execute(args)
+            return 0
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except (ClientGone, ProtocolError):
+            raise
+        except Exception as e:
+            logger.exception("Command %s failed" % message["argv"])
+            self.console.error("Error: %s" % e)
+            return 1
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+            self.console.detach()
@@ -0,0 +1,195 @@
+""" Ranked fuzzy search of names (the courses of all the semesters) """
+
+import re
+
+# Scores are in [0, 1]: the kinds of match are tried from the best to the worst
+EXACT = 1.0
+PREFIX = 0.9   # "alg" -> "Algorithms"
+WORD = 0.8     # "alg" -> "Advanced Algorithms"
+SUBSEQUENCE = 0.4 # "aa" -> "Advanced Algorithms", plus up to SUBSEQUENCE_BONUS
+SUBSEQUENCE_BONUS = 0.3
+TRIGRAMS = 0.6 # "algoritms" -> "Algorithms", scaled by the similarity
+MIN_SIMILARITY = 0.3
+
+_word_start = re.compile(r"(?:^|(?<=[^0-9a-zA-Z])|(?<=[a-z])(?=[A-Z]))[0-9a-zA-Z]")
+
+def trigrams(text):
+    """ Trigrams of a lowered text, padded to give weight to its start """
+    text = "  " + text + " "
+    return { text[i:i+3] for i in range(len(text) - 2) }
+
+class _Name(object):
+    """ What is precomputed for an indexed name """
+    __slots__ = ("name", "lower", "word_starts", "starts_by_char", "trigrams")
+
+    def __init__(self, name):
+        self.name = name
+        self.lower = name.lower()
+        starts = [ m.start() for m in _word_start.finditer(name) ]
+        self.word_starts = frozenset(starts)
+        self.starts_by_char = {} # letter -> positions of the words starting with it
+        for pos in starts:
+            self.starts_by_char.setdefault(self.lower[pos], []).append(pos)
+        self.trigrams = trigrams(self.lower)
+
+    def subsequence_score(self, query):
+        """ Score of the letters of the query found in order in the name,
+        favouring starts of words and consecutive letters. None if they are
+        not all found """
+        points = 0
+        previous = -2
+        start = 0
+        for char in query:
+            pos = self.lower.find(char, start)
+            if pos < 0:
+                return None
+            # prefer a start of word close by ("ad" in "Advanced Algorithms")
+            if pos not in self.word_starts and pos != previous + 1:
+                for start_of_word in self.starts_by_char.get(char, ()):
+                    if start_of_word >= pos:
+                        pos = start_of_word
+                        break
+            points += 1 + (pos in self.word_starts) + (pos == previous + 1)
+            previous, start = pos, pos + 1
+        return SUBSEQUENCE + SUBSEQUENCE_BONUS * points / (3 * len(query))
+
+    def score(self, query, query_trigrams, common):
+        """ Score of the name for a lowered query, with which it has `common`
+        trigrams. 0 if it does not match """
+        if self.lower == query:
+            return EXACT
+        if self.lower.startswith(query):
+            return PREFIX + 0.05 * len(query) / len(self.lower)
+        found = self.lower.find(query)
+        while found >= 0:
+            if found in self.word_starts:
+                return WORD + 0.05 * len(query) / len(self.lower)
+            found = self.lower.find(query, found + 1)
+
+        best = self.subsequence_score(query) or 0
+        if common:
+            similarity = common / (len(self.trigrams) + len(query_trigrams) - common)
+            if similarity >= MIN_SIMILARITY:
+                best = max(best, TRIGRAMS * similarity)
+        return best
+
+class FuzzyIndex(object):
+    """
+    Index of names given with a key (any hashable: the index does not care
+    what is named). The names are prepared when added, and two inverted
+    indexes (from the characters and from the trigrams to the keys) restrict
+    a search to the names that can match: the ones containing all the
+    letters of the query (for the subsequences) or sharing a trigram with
+    it (for the typos).
+    """
+    def __init__(self, names=()):
+        self._names = {} # key -> _Name
+        self._by_char = {}
+        self._by_trigram = {}
+        for key, name in names:
+            self.add(key, name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, key):
+        return key in self._names
+
+    def add(self, key, name):
+        if key in self._names:
+            self.remove(key)
+        entry = _Name(name)
+        self._names[key] = entry
+        for char in set(entry.lower):
+            self._by_char.setdefault(char, set()).add(key)
+        for trigram in entry.trigrams:
+            self._by_trigram.setdefault(trigram, set()).add(key)
+
+    def remove(self, key):
+        entry = self._names.pop(key)
+        for char in set(entry.lower):
+            self._by_char[char].discard(key)
+        for trigram in entry.trigrams:
+            self._by_trigram[trigram].discard(key)
+
+    def _candidates(self, query, query_trigrams):
+        """ Map from the keys of the names that can match to the number of
+        trigrams they share with the query """
+        chars = sorted((self._by_char.get(c, ()) for c in set(query)), key=len)
+        candidates = dict.fromkeys(set(chars[0]).intersection(*chars[1:]), 0)
+
+        # a similarity of MIN_SIMILARITY needs that many common trigrams
+        needed = MIN_SIMILARITY * len(query_trigrams)
+        common = {}
+        for trigram in query_trigrams:
+            for key in self._by_trigram.get(trigram, ()):
+                common[key] = common.get(key, 0) + 1
+        candidates.update((key, n) for key, n in common.items() if n >= needed or key in candidates)
+        return candidates
+
+    def search(self, query, limit=None):
+        """ Return the (score, key) matching the query, best first. An empty
+        query matches every name with the same score """
+        query = query.lower().strip()
+        if not query:
+            return [ (0.0, key) for key in self._names ][:limit]
+        query_trigrams = trigrams(query) if len(query) >= 3 else set()
+
+        results = []
+        for key, common in self._candidates(query, query_trigrams).items():
+            score = self._names[key].score(query, query_trigrams, common)
+            if score > 0:
+                results.append((score, key))
+        results.sort(key=lambda r: (-r[0], self._names[r[1]].lower))
+        return results[:limit]
+
+def clear_winner(results, margin=0.1):
+    """ Return the key of the best result if it is clearly better than the
+    next one (or alone), None otherwise """
+    if len(results) == 1 or (len(results) > 1 and results[0][0] - results[1][0] >= margin):
+        return results[0][1]
+    return None
+
+# Names of the same course in two places ("ProbabilityAndStatistics" and
+# "MATH-232 Probability and statistics") are compared by their words
+MIN_NAME_SIMILARITY = 0.5
+
+_name_word = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+def name_words(name):
+    """ Lowered words of a name, without accents and split on the changes of
+    case. The words with digits (course codes, years) are dropped, unless
+    the name has nothing else """
+    import unicodedata
+    name = "".join(c for c in unicodedata.normalize("NFKD", name) if not unicodedata.combining(c))
+    words = [ w.lower() for w in _name_word.findall(name) ]
+    return [ w for w in words if not w.isdigit() ] or words
+
+def similarity(a, b):
+    """ Similarity in [0, 1] of two names of a same thing: the share of the
+    words of the shorter one found in the other, averaged with the trigram
+    (Dice) similarity of their words """
+    words_a, words_b = name_words(a), name_words(b)
+    if not words_a or not words_b:
+        return 0.0
+    set_a, set_b = set(words_a), set(words_b)
+    coverage = len(set_a & set_b) / min(len(set_a), len(set_b))
+    trigrams_a, trigrams_b = trigrams(" ".join(words_a)), trigrams(" ".join(words_b))
+    dice = 2 * len(trigrams_a & trigrams_b) / (len(trigrams_a) + len(trigrams_b))
+    return (coverage + dice) / 2
+
+def match_names(names, others, minimum=MIN_NAME_SIMILARITY):
+    """ Pair the names with the others, each used at most once: the most
+    similar pairs are taken first. Return { name: (score, other) } for the
+    names having an other at least `minimum` similar """
+    pairs = sorted(((similarity(n, o), n, o) for n in set(names) for o in set(others)),
+                   key=lambda p: (-p[0], p[1], p[2]))
+    matched = {}
+    used = set()
+    for score, name, other in pairs:
+        if score < minimum:
+            break
+        if name not in matched and other not in used:
+            matched[name] = (score, other)
+            used.add(other)
+    return matched
@@ -0,0 +1,236 @@
+import os
+import time
+import logging
+
+import epflmanager.components as components
+import epflmanager.parsers as parsers
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE directories (
+    path TEXT PRIMARY KEY,
+    mtime INTEGER NOT NULL,
+    checked INTEGER NOT NULL
+);
+CREATE TABLE subdirectories (
+    parent TEXT NOT NULL REFERENCES directories(path) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    PRIMARY KEY (parent, name)
+);
+CREATE TABLE files (
+    path TEXT PRIMARY KEY,
+    mtime INTEGER,
+    checked INTEGER NOT NULL
+);
+CREATE TABLE moodle_links (
+    path TEXT PRIMARY KEY REFERENCES files(path) ON DELETE CASCADE,
+    moodle_id TEXT
+);
+CREATE TABLE course_urls (
+    path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    label TEXT NOT NULL,
+    PRIMARY KEY (path, position)
+);
+CREATE TABLE course_locations (
+    path TEXT PRIMARY KEY,
+    dev INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    moodle_id TEXT NOT NULL
+);
+CREATE UNIQUE INDEX course_locations_file ON course_locations (dev, inode);
+CREATE INDEX course_locations_moodle_id ON course_locations (moodle_id);
+"""
+
+def _mtime(path):
+    """ Modification time of a path in ns, None if it does not exist """
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+class CourseIndex(object):
+    """
+    On-disk index (SQLite) of the directory tree of the courses: the
+    subdirectories of the main and semester directories, and the content
+    of the Moodle and site.url files of the courses.
+
+    It also remembers where the courses linked with Moodle were last seen,
+    by Moodle id and by file identity (device and inode, which survive a
+    rename or a move on the same filesystem), see `remember_course`.
+
+    Every entry is stored with the modification time of what it was read
+    from. A directory is listed again (a file parsed again) only if its
+    modification time changed, so an unchanged tree costs one `stat` per
+    directory/file instead of listing and parsing everything.
+
+    As the resolution of modification times can be coarse (1s on some
+    network filesystems), an entry read less than `RACY` ns after the
+    modification of its directory/file could miss a later change made in
+    the same tick: such entries are not trusted and read again.
+    """
+    VERSION = 2
+    RACY = 2 * 10**9
+
+    def __init__(self, path):
+        import sqlite3 # only when the index is used
+
+        self.path = path
+        try:
+            self._db = self._open(path)
+        except sqlite3.DatabaseError as e:
+            # the index can always be rebuilt
+            logger.warn("Index %s is unusable (%s), rebuilding it" % (path, e))
+            os.remove(path)
+            self._db = self._open(path)
+
+    @staticmethod
+    def _open(path):
+        import sqlite3
+
+        db = sqlite3.connect(path)
+        # a lost index is only rebuilt: no need to wait for the disk
+        db.execute("PRAGMA synchronous = OFF")
+        db.execute("PRAGMA foreign_keys = ON")
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version != CourseIndex.VERSION:
+            with db:
+                for (table,) in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+                    db.execute("DROP TABLE %s" % table)
+                db.executescript(SCHEMA)
+                db.execute("PRAGMA user_version = %d" % CourseIndex.VERSION)
+        return db
+
+    def close(self):
+        self._db.close()
+
+    def _is_fresh(self, table, path, mtime):
+        row = self._db.execute("SELECT mtime, checked FROM %s WHERE path = ?" % table, (path,)).fetchone()
+        return row is not None and row[0] == mtime and (mtime is None or row[1] - mtime >= CourseIndex.RACY)
+
+    def subdirs(self, path):
+        """ Return the names of the subdirectories of a directory """
+        path = os.path.normpath(path)
+        mtime = _mtime(path)
+        if mtime is None:
+            raise FileNotFoundError("No such directory: %s" % path)
+
+        if self._is_fresh("directories", path, mtime):
+            rows = self._db.execute("SELECT name FROM subdirectories WHERE parent = ? ORDER BY name", (path,))
+            return [ name for (name,) in rows ]
+
+        logger.debug("Listing %s" % path)
+        names = sorted(e.name for e in os.scandir(path) if e.is_dir())
+
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO directories VALUES (?, ?, ?)", (path, mtime, int(time.time() * 10**9)))
+            self._db.execute("DELETE FROM subdirectories WHERE parent = ?", (path,))
+            self._db.executemany("INSERT INTO subdirectories VALUES (?, ?)", ((path, n) for n in names))
+        return names
+
+    def _update_file(self, path, mtime):
+        self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (path, mtime, int(time.time() * 10**9)))
+
+    def moodle_id(self, path):
+        """ Return the Moodle id in the Moodle file of a course, None if
+        there is no such file or it has no id """
+        path = os.path.normpath(path)
+        mtime = _mtime(path)
+        if self._is_fresh("files", path, mtime):
+            row = self._db.execute("SELECT moodle_id FROM moodle_links WHERE path = ?", (path,)).fetchone()
+            return row[0] if row else None
+
+        moodle_id = None
+        if mtime is not None:
+            logger.debug("Parsing %s" % path)
+            with open(path, "r") as f:
+                config = parsers.moodle_file_parser(f.read())
+            moodle_id = config.get("course", "moodle_id", fallback=None)
+
+        with self._db:
+            self._update_file(path, mtime)
+            self._db.execute("INSERT OR REPLACE INTO moodle_links VALUES (?, ?)", (path, moodle_id))
+        return moodle_id
+
+    def course_urls(self, path):
+        """ Return the (url, label) of the site.url file of a course, None if
+        there is no such file """
+        path = os.path.normpath(path)
+        mtime = _mtime(path)
+        if self._is_fresh("files", path, mtime):
+            if mtime is None:
+                return None
+            rows = self._db.execute("SELECT url, label FROM course_urls WHERE path = ? ORDER BY position", (path,))
+            return [ tuple(row) for row in rows ]
+
+        urls = None
+        if mtime is not None:
+            logger.debug("Parsing %s" % path)
+            with open(path, "r") as f:
+                urls = parsers.course_urls_parser(f.read())
+
+        with self._db:
+            self._update_file(path, mtime)
+            self._db.execute("DELETE FROM course_urls WHERE path = ?", (path,))
+            self._db.executemany("INSERT INTO course_urls VALUES (?, ?, ?, ?)",
+                                 ((path, i, url, label) for i, (url, label) in enumerate(urls or [])))
+        return urls
+
+    def remember_course(self, path, dev, inode, moodle_id):
+        """ Record that the course directory `path`, with this identity, is
+        linked with a Moodle id. Only written if it changed """
+        self.remember_courses([(path, dev, inode, moodle_id)])
+
+    def remember_courses(self, courses):
+        """ remember_course for many (path, dev, inode, moodle_id), in one
+        transaction """
+        rows = []
+        for path, dev, inode, moodle_id in courses:
+            path = os.path.normpath(path)
+            moodle_id = str(moodle_id)
+            row = self._db.execute("SELECT dev, inode, moodle_id FROM course_locations WHERE path = ?", (path,)).fetchone()
+            if row is None or tuple(row) != (dev, inode, moodle_id):
+                rows.append((path, dev, inode, moodle_id))
+        if not rows:
+            return
+        with self._db:
+            for path, dev, inode, moodle_id in rows:
+                # a directory is at one place, a place holds one directory
+                self._db.execute("DELETE FROM course_locations WHERE path = ? OR (dev = ? AND inode = ?)", (path, dev, inode))
+                self._db.execute("INSERT INTO course_locations VALUES (?, ?, ?, ?)", (path, dev, inode, moodle_id))
+
+    def forget_course(self, path):
+        """ Forget the course last seen at this path (removed) """
+        with self._db:
+            self._db.execute("DELETE FROM course_locations WHERE path = ?", (os.path.normpath(path),))
+
+    def course_by_file(self, dev, inode):
+        """ Return (path, moodle id) of the course last seen with this
+        identity, None if unknown """
+        row = self._db.execute("SELECT path, moodle_id FROM course_locations WHERE dev = ? AND inode = ?", (dev, inode)).fetchone()
+        return tuple(row) if row else None
+
+    def course_by_path(self, path):
+        """ Return (dev, inode, moodle id) of the course last seen at this
+        path, None if unknown """
+        row = self._db.execute("SELECT dev, inode, moodle_id FROM course_locations WHERE path = ?",
+                               (os.path.normpath(path),)).fetchone()
+        return tuple(row) if row else None
+
+def start_index_component(config):
+    """ Register the CourseIndex of the config as a component, created when
+    first used, unless `index_file` is empty (the tree is then read on every run) """
+    from epflmanager.config import default_config_dir
+
+    path = config.get("directories", "index_file",
+                      fallback=os.path.join(default_config_dir(), "index.sqlite"))
+    if not path:
+        return
+
+    def create_index():
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        return CourseIndex(path)
+    components.register_factory("CourseIndex", create_index, depends=["Config"],
+                                teardown=lambda index: index.close())
@@ -1,6 +1,5 @@
 import sys
 import logging
-import readline
 
 import epflmanager.components as components
 
@@ -30,6 +29,7 @@ class ConsoleManager(components.Component):
     def input(self, text, default=None):
         """ Ask the user for an input
             Can specify a default if only whitespace is entered"""
+        import readline # line editing for input(), only needed when asking
         inp = input(text)
         if default is not None and not inp.strip():
             inp = default
@@ -1,25 +1,61 @@
 import os
+import sys
 import logging
+import weakref
 
 import epflmanager.components as components
 import epflmanager.parsers as parsers
+import epflmanager.cache as cache
+from .snapshot import DirSnapshot, Entry
 
 logger = logging.getLogger(__name__)
 
 class Path(object):
-    """ Represents an abstract path in a filesystem """
+    """ Represents an abstract path in a filesystem
+
+    Paths are interned: `Path(parent)(name)` returns the same object for the
+    same class, parent and name as long as it is alive (relative paths,
+    which depend on the current directory, are not). Their full path is
+    computed once, which makes them cheap to hash and compare """
+    __slots__ = ("parent", "name", "_entry", "_fullpath", "_normpath", "__weakref__")
+
+    _interned = {} # class -> ((type of parent, parent path, name) -> path)
+
     def __new__(cls, parent):
+        if isinstance(parent, str):
+            parent = sys.intern(parent)
+
         def set_name(name, *args, **kwargs):
-            obj = object.__new__(cls)
-            obj.__init__(parent, name, *args, **kwargs)
+            parent_path = parent._fullpath if isinstance(parent, Path) else parent
+            if not os.path.isabs(parent_path):
+                obj = object.__new__(cls)
+                obj.__init__(parent, name, *args, **kwargs)
+                return obj
+
+            interned = Path._interned.get(cls)
+            if interned is None:
+                interned = Path._interned.setdefault(cls, weakref.WeakValueDictionary())
+            # the exact parent and name: the object has the name, parent and
+            # full path that were asked
+            key = (type(parent), parent_path, name)
+            obj = interned.get(key)
+            if obj is None:
+                obj = object.__new__(cls)
+                obj.__init__(parent, name, *args, **kwargs)
+                interned[key] = obj
             return obj
 
         return set_name
 
     def __init__(self, parent, name):
-        self._cache = {}
+        self._entry = None # Entry seen when the parent was scanned, if any
         self.parent = parent
-        self.name = name
+        self.name = sys.intern(name)
+        parent_path = parent._fullpath if isinstance(parent, Path) else parent
+        self._fullpath = os.path.join(parent_path, name)
+        normpath = os.path.normpath(self._fullpath)
+        # share the string when the path is already normalized
+        self._normpath = self._fullpath if normpath == self._fullpath else normpath
 
     def __str__(self):
         return "%s: %s" % (self.__class__.__name__, self.name)
@@ -28,26 +64,32 @@ class Path(object):
         return "<" + str(self) + ">"
 
     def __eq__(self, other):
-        return (type(self) is type(other) and
-            os.path.normpath(self.fullpath()) == os.path.normpath(other.fullpath()))
+        return self is other or (type(self) is type(other) and self._normpath == other._normpath)
     def __hash__(self):
-        return hash(os.path.normpath(self.fullpath()))
+        return hash(self._normpath)
+
+    # The type of a path found by scanning its parent is known without stat.
+    # Whether it still exists is always asked to the filesystem: a path that
+    # is gone forgets what the scan saw
 
     def exists(self):
-        return os.path.exists(self.fullpath())
+        if os.path.exists(self.fullpath()):
+            return True
+        self._entry = None
+        return False
 
     def is_file(self):
+        if self._entry is not None:
+            return self._entry.is_file
         return os.path.isfile(self.fullpath())
 
     def is_dir(self):
+        if self._entry is not None:
+            return self._entry.is_dir
         return os.path.isdir(self.fullpath())
 
     def fullpath(self):
-        parent_path = self.parent.fullpath() if isinstance(self.parent, Path) else self.parent
-        return os.path.join(parent_path, self.name)
-
-    # def clear_cache(self):
-    #     self._cache = {}
+        return self._fullpath
 
     @staticmethod
     def split_parent(path):
@@ -61,16 +103,18 @@ class Path(object):
 
     @staticmethod
     def memoize(attr_name):
+        """ Keep the result of a method of a directory in the shared cache,
+        until the directory is modified or invalidated """
         def inner_mem(func):
-            def inner_func(self, *args, **kwargs):
-                if attr_name not in self._cache:
-                    self._cache[attr_name] = func(self,*args,**kwargs)
-                return self._cache[attr_name]
+            def inner_func(self):
+                path = self.fullpath()
+                return cache.shared.get((os.path.abspath(path), attr_name), lambda: func(self), path)
             return inner_func
         return inner_mem
 
 class Directory(Path):
     """ Represent a directory in the filesystem """
+    __slots__ = ()
 
     def read_file(self, filename, raiseException=False):
         path = os.path.join(self.fullpath(), filename)
@@ -83,12 +127,35 @@ class Directory(Path):
 
     def as_class(self, cls):
         """ Enable to "cast" the directory to other classes like SemesterDir/CourseDir """
-        return cls(self.parent)(self.name)
+        entry = self._entry
+        d = cls(self.parent)(self.name)
+        d._entry = entry
+        return d
+
+    @Path.memoize("snapshot")
+    def snapshot(self):
+        """ Entries of the directory with their types, scanned once """
+        return DirSnapshot(self.fullpath())
+
+    def _dir_entries(self):
+        """ Return the entries of the directories in the current path """
+        p = self.fullpath()
+        index = components.get("CourseIndex")
+        if index is not None:
+            return [ Entry(name, True, False) for name in index.subdirs(p) ]
+        return self.snapshot().dirs()
 
     def _names_of_dirs(self):
         """ Return the directories in the current path (only dirname) """
-        p = self.fullpath()
-        return [d for d in os.listdir(p) if os.path.isdir(os.path.join(p,d))]
+        return [ e.name for e in self._dir_entries() ]
+
+    def child(self, entry, cls=None):
+        """ Path of an entry of the snapshot, that knows its type """
+        if cls is None:
+            cls = Directory if entry.is_dir else Path
+        c = cls(self)(entry.name)
+        c._entry = entry
+        return c
 
   #  def _names_of_files(self, hidden=False):
   #      """ Return the files in the specified path (only filename)
@@ -98,7 +165,7 @@ class Directory(Path):
 
     @Path.memoize("dirs")
     def dirs(self):
-        return list(map(Directory(self), self._names_of_dirs()))
+        return [ self.child(e) for e in self._dir_entries() ]
 
     def create_directory_if_not_exists(self, path, directory_creation_confirm=True):
         """ Create a directory if it doesn't exist
@@ -117,4 +184,5 @@ class Directory(Path):
 
         logger.info("Creating directory %s" % path)
         os.mkdir(path)
+        cache.shared.invalidate(os.path.dirname(os.path.abspath(path)))
         return True
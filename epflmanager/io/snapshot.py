@@ -0,0 +1,44 @@
+import os
+import logging
+from collections import namedtuple, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Type of an entry of a directory, as seen when the directory was scanned
+Entry = namedtuple("Entry", ["name", "is_dir", "is_file"])
+
+class DirSnapshot(object):
+    """
+    The entries of a directory with their type, read in a single pass with
+    `os.scandir`. The type of an entry comes with the listing on most
+    filesystems (d_type), so there is at most one stat per entry (symbolic
+    links, filesystems without d_type) and none on the common path.
+
+    A snapshot is not updated when the directory changes: take a new one.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._entries = OrderedDict()
+        for e in sorted(os.scandir(path), key=lambda e: e.name):
+            # DirEntry caches the result of its stat, is_file is then free
+            self._entries[e.name] = Entry(e.name, e.is_dir(), e.is_file())
+        logger.debug("Scanned %s (%d entries)" % (path, len(self._entries)))
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, name):
+        """ Return the Entry of a name, None if it was not in the directory """
+        return self._entries.get(name)
+
+    def entries(self):
+        return list(self._entries.values())
+
+    def dirs(self):
+        return [ e for e in self._entries.values() if e.is_dir ]
+
+    def files(self):
+        return [ e for e in self._entries.values() if e.is_file ]
@@ -3,6 +3,8 @@ import logging
 
 import epflmanager.components as components
 import epflmanager.parsers as parsers
+import epflmanager.metadata as metadata
+from epflmanager.manifest import Manifest
 from .fileorganizer import Path, Directory
 
 logger = logging.getLogger(__name__)
@@ -21,15 +23,26 @@ class CourseDir(Directory):
     files, it doesn't know how to interprete/parse them so it must query the
     CourseHandler to obtain such information.
     """
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
+    @property
+    def semester_name(self):
+        return os.path.basename(os.path.dirname(self.fullpath()))
+
+    @staticmethod
+    def moodle_filename_of(course_name):
+        """ Name of the Moodle file of a course directory named `course_name` """
+        return components.get("Config")["directories"]["moodle_config_file"].format(course_name=course_name)
+
     @property
     def moodle_filename(self):
-        return components.get("Config")["directories"]["moodle_config_file"].format(course_name=self.name)
+        return CourseDir.moodle_filename_of(self.name)
 
     @property
     def moodle_file_path(self):
@@ -58,6 +71,19 @@ class CourseDir(Directory):
             strerr = e.args[0]
             raise MoodleFileNotFound(strerr)
 
+    def read_manifest(self):
+        """ Return the Manifest of the Moodle resources downloaded for this course """
+        return Manifest(self.read_moodle_config())
+
+    def write_manifest(self, manifest):
+        self.write_moodle_config(manifest.config)
+
+    @property
+    def moodle_resources_path(self):
+        """ Directory in which the resources downloaded from Moodle are put """
+        dirname = components.get("Config").get("directories", "moodle_resources_dir", fallback="Moodle")
+        return os.path.join(self.fullpath(), dirname)
+
     def link_with_moodle(self, moodle_id):
         ch = components.get("CourseHandler")
         ch.link_course_with_moodle(self, moodle_id)
@@ -65,17 +91,19 @@ class CourseDir(Directory):
     def write_moodle_config(self, config):
         with open(self.moodle_file_path, "w") as f:
             config.write(f)
+        metadata.shared.invalidate(self.moodle_file_path)
 
     def course_urls(self):
         """ Find the file containing the urls of interests for this course
             and return the parsed results """
-        try:
-            return parsers.course_urls_parser(self.read_file(self.course_urls_filename, raiseException=True))
-        except FileNotFoundError as e:
-            strerr = e.args[0]
-            raise CourseURLsFileNotFound(strerr)
+        urls = metadata.shared.course_urls(self.course_urls_file_path)
+        if urls is None:
+            raise CourseURLsFileNotFound("No such file: %s" % self.course_urls_file_path)
+        return urls
 
 class SemesterDir(Directory):
+    __slots__ = ()
+
     @Path.memoize("courses")
     def courses(self):
         course_handler = components.get("CourseHandler")
@@ -0,0 +1,96 @@
+import os
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Resource(object):
+    """ A Moodle resource that was downloaded in a course directory.
+    The path is relative to the course directory """
+    FIELDS = ("moodle_id", "section", "name", "path", "size", "hash")
+
+    def __init__(self, moodle_id, section, name, path, size, hash):
+        self.moodle_id = int(moodle_id)
+        self.section = section
+        self.name = name
+        self.path = path
+        self.size = int(size)
+        self.hash = hash
+
+    def __str__(self):
+        return "Resource: %s (%d)" % (self.name, self.moodle_id)
+
+    def __repr__(self):
+        return "<" + str(self) + ">"
+
+    def __eq__(self, other):
+        return (type(self) is type(other) and
+                all(getattr(self, f) == getattr(other, f) for f in Resource.FIELDS))
+
+    @staticmethod
+    def from_file(moodle_id, section, name, course_path, path, hash=None):
+        """ Create the Resource of a downloaded file. `path` must be inside the `course_path` """
+        if hash is None:
+            hash = file_hash(path)
+        return Resource(moodle_id, section, name, os.path.relpath(path, course_path),
+                        os.path.getsize(path), hash)
+
+def file_hash(path, chunk_size=64*1024):
+    """ Return the hexadecimal SHA-1 of the file's content """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class Manifest(object):
+    """
+    View of the Moodle file of a course as a manifest of the downloaded
+    resources. Each resource is kept in its own section of the file:
+
+        [resource 914285]
+        moodle_id = 914285
+        section = Week 1
+        name = Solutions to Problems
+        path = Moodle/Week 1/solutions.pdf
+        size = 104857
+        hash = 2fd4e1c67a2d28fced849ee1bb76e7391b93eb12
+    """
+    SECTION_PREFIX = "resource "
+
+    def __init__(self, config):
+        self.config = config
+
+    def _section_name(self, moodle_id):
+        return "%s%d" % (Manifest.SECTION_PREFIX, int(moodle_id))
+
+    def resources(self):
+        return [ self._read(s) for s in self.config.sections() if s.startswith(Manifest.SECTION_PREFIX) ]
+
+    def _read(self, section):
+        return Resource(**{ f: self.config[section][f] for f in Resource.FIELDS })
+
+    def get(self, moodle_id):
+        section = self._section_name(moodle_id)
+        if section not in self.config:
+            return None
+        return self._read(section)
+
+    def __contains__(self, moodle_id):
+        return self._section_name(moodle_id) in self.config
+
+    def find(self, section, name):
+        """ Return the resources that were downloaded for this (section, name)
+        pair. As the Moodle id of a resource changes every time it is updated,
+        this is how previous versions of a resource are found """
+        return [ r for r in self.resources() if r.section == section and r.name == name ]
+
+    def add(self, resource):
+        section = self._section_name(resource.moodle_id)
+        if section not in self.config:
+            self.config.add_section(section)
+        for f in Resource.FIELDS:
+            self.config[section][f] = str(getattr(resource, f))
+
+    def remove(self, moodle_id):
+        return self.config.remove_section(self._section_name(moodle_id))
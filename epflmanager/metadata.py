@@ -0,0 +1,111 @@
+import os
+import time
+import logging
+from collections import namedtuple, OrderedDict
+
+import epflmanager.components as components
+import epflmanager.parsers as parsers
+
+logger = logging.getLogger(__name__)
+
+# What the Moodle and site.url files of a course say (None without file)
+CourseMetadata = namedtuple("CourseMetadata", ["moodle_id", "urls"])
+
+def _stamp(path):
+    """ (modification time in ns, size) of a file, None if it does not exist """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _read_moodle_id(path):
+    index = components.get("CourseIndex")
+    if index is not None:
+        return index.moodle_id(path)
+    with open(path, "r") as f:
+        return parsers.moodle_file_parser(f.read()).get("course", "moodle_id", fallback=None)
+
+def _read_course_urls(path):
+    index = components.get("CourseIndex")
+    if index is not None:
+        return index.course_urls(path)
+    with open(path, "r") as f:
+        return parsers.course_urls_parser(f.read())
+
+class MetadataCache(object):
+    """
+    Parsed content of the Moodle and site.url files of the courses, kept in
+    memory under (path, modification time, size): a file is only opened and
+    parsed again when it changed, so asking whether the courses of a
+    semester are linked costs one `stat` per course. When the CourseIndex
+    is started, the files that changed are read through it (and its
+    on-disk entries) instead of being parsed here.
+
+    As in epflmanager.cache, a file read less than RACY ns after its
+    modification is read again next time.
+
+    `generation` changes whenever a Moodle id read differs from the one
+    known for the file: what is derived from the ids (the courses by id of
+    the CourseCatalogue) is valid as long as it does not change.
+    """
+    RACY = 2 * 10**9
+
+    def __init__(self):
+        self._entries = {} # (kind, path) -> (stamp, checked, value)
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+
+    def _get(self, kind, path, read):
+        path = os.path.abspath(path)
+        stamp = _stamp(path)
+        entry = self._entries.get((kind, path))
+        if entry is not None and entry[0] == stamp and (stamp is None or entry[1] - stamp[0] >= self.RACY):
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        checked = time.time() * 10**9
+        value = None
+        if stamp is not None:
+            logger.debug("Reading %s" % path)
+            try:
+                value = read(path)
+            except FileNotFoundError: # removed in between
+                stamp = None
+        if kind == "moodle" and value != (entry[2] if entry is not None else None):
+            self.generation += 1
+        self._entries[(kind, path)] = (stamp, checked, value)
+        return value
+
+    def moodle_id(self, path):
+        """ Moodle id in a Moodle file, None if there is no file or no id """
+        return self._get("moodle", path, _read_moodle_id)
+
+    def course_urls(self, path):
+        """ List of (url, label) of a site.url file, None if there is no file """
+        urls = self._get("urls", path, _read_course_urls)
+        return list(urls) if urls is not None else None
+
+    def courses(self, courses):
+        """ Map from the courses (CourseDir) to their CourseMetadata, in one pass """
+        return OrderedDict( (c, CourseMetadata(self.moodle_id(c.moodle_file_path),
+                                               self.course_urls(c.course_urls_file_path)))
+                            for c in courses )
+
+    def invalidate(self, path):
+        """ Forget a file, for the changes made by the program itself """
+        path = os.path.abspath(path)
+        for kind in ("moodle", "urls"):
+            self._entries.pop((kind, path), None)
+
+    def clear(self):
+        self._entries.clear()
+        self.generation += 1
+
+    def stats(self):
+        return { "entries": len(self._entries), "hits": self.hits, "misses": self.misses }
+
+# Metadata of the files read by the CourseHandler and the courses
+shared = MetadataCache()
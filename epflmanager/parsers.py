@@ -1,3 +1,4 @@
+import re
 import logging
 
 logger = logging.getLogger(__name__)
@@ -6,23 +7,23 @@ logger = logging.getLogger(__name__)
 def moodle_file_parser(content):
     """ Parse the content given and return a ConfigParser object """
     import configparser
-    moodle = configparser.ConfigParser()
+    # no interpolation: names of downloaded resources may contain '%'
+    moodle = configparser.ConfigParser(interpolation=None)
     moodle.read_string(content)
 
     return moodle
 
+# Accepted inputs examples
+# 1) http://example.com Label of the site
+# 2) http://example.com
+# TODO Use a regex to match a link?
+COURSE_URLS_REGEX = re.compile(r"^\s*(?P<url>\S+)\s*(?P<label>(?<=\s).+)?(?<=\S)\s*$")
+
 def course_urls_parser(content):
     """ Parse the content given and returns a list of tuples (url,website) """
-    import re
-    # Accepted inputs examples
-    # 1) http://example.com Label of the site
-    # 2) http://example.com
-    # TODO Use a regex to match a link?
-    regex = re.compile("^\s*(?P<url>\S+)\s*(?P<label>(?<=\s).+)?(?<=\S)\s*$")
-
     sites = []
     for line in content.splitlines():
-        m = regex.match(line)
+        m = COURSE_URLS_REGEX.match(line)
         if m is None: # ignore invalid lines
             line = line.strip()
             if line:
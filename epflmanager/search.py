@@ -0,0 +1,231 @@
+import os
+import re
+import json
+import time
+import shutil
+import logging
+import subprocess
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    course TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    checked INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE documents USING fts5(body, tokenize = 'unicode61 remove_diacritics 2');
+"""
+
+# Files read as text, other files are skipped
+TEXT_EXTENSIONS = { ".txt", ".md", ".org", ".rst", ".tex", ".bib", ".csv", ".json", ".xml", ".html", ".htm",
+                    ".py", ".scala", ".java", ".kt", ".c", ".h", ".cpp", ".hpp", ".cc", ".rs", ".go", ".hs",
+                    ".ml", ".js", ".ts", ".sh", ".sql", ".m", ".r", ".jl", ".v", ".vhd", ".s", ".asm", ".ipynb" }
+# Files whose text is extracted by an external tool, when it is installed
+EXTRACTORS = { ".pdf": ["pdftotext", "-q", "-enc", "UTF-8", "{path}", "-"] }
+MAX_SIZE = 20 * 1024 * 1024
+
+# Below this number of files to read, the workers would cost more than they save
+MIN_FILES_FOR_WORKERS = 32
+
+class SearchUnavailable(Exception): pass
+
+Result = namedtuple("Result", ["course", "path", "snippet"])
+
+def installed_extractors():
+    """ Extensions of EXTRACTORS whose tool is installed """
+    return { ext for ext, cmd in EXTRACTORS.items() if shutil.which(cmd[0]) is not None }
+
+def is_indexable(path, extractors=None):
+    """ True if the text of the file can be read, `extractors` being the
+    extensions whose tool is installed (looked up if not given) """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in TEXT_EXTENSIONS:
+        return True
+    if extractors is None:
+        extractors = installed_extractors()
+    return ext in extractors
+
+class ExtractionFailed(Exception):
+    """ The text of a file could not be read this time (timeout, I/O error) """
+
+def extract_text(path):
+    """ Return the text of a file, None if it has none (binary, not readable
+    by the extractor). Raise ExtractionFailed if it may work next time.
+    Run in the worker processes """
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext in EXTRACTORS:
+            cmd = [ arg.format(path=path) for arg in EXTRACTORS[ext] ]
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=60)
+            if proc.returncode != 0: # encrypted or broken file
+                logger.debug("No text extracted from %s: %s exited with %d" % (path, cmd[0], proc.returncode))
+                return None
+            return proc.stdout.decode("utf-8", errors="replace")
+
+        with open(path, "rb") as f:
+            data = f.read(MAX_SIZE)
+        if b"\0" in data[:8192]:
+            return None
+        text = data.decode("utf-8", errors="replace")
+        if ext == ".ipynb":
+            cells = json.loads(text).get("cells", [])
+            text = "\n".join("".join(c.get("source", [])) for c in cells)
+        return text
+    except (ValueError, AttributeError) as e:
+        logger.debug("No text extracted from %s: %s" % (path, e))
+        return None
+    except (OSError, subprocess.SubprocessError) as e:
+        raise ExtractionFailed(str(e))
+
+def _extract(path):
+    """ (path, text, error) of a file, the error of a failed extraction """
+    try:
+        return (path, extract_text(path), None)
+    except ExtractionFailed as e:
+        return (path, None, e)
+
+def query_expression(query):
+    """ FTS5 expression of a query: all its words, as prefixes """
+    words = re.findall(r"\w+", query)
+    return " ".join('"%s"*' % w for w in words)
+
+class SearchIndex(object):
+    """
+    Full-text index (SQLite FTS5) of the text files of the courses: notes,
+    code, markdown and the text of the PDFs when pdftotext is installed.
+
+    `update` only reads the files whose modification time or size changed
+    since they were indexed (or read less than RACY ns after their
+    modification, see epflmanager.index), in worker processes when there
+    are many of them. `search` only queries the index.
+    """
+    VERSION = 1
+    RACY = 2 * 10**9
+
+    def __init__(self, path, workers=None):
+        import sqlite3
+
+        self.path = path
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        try:
+            self._db = self._open(path)
+        except sqlite3.OperationalError as e:
+            if "fts5" in str(e):
+                raise SearchUnavailable("The SQLite of Python has no full-text search (FTS5)")
+            raise
+        except sqlite3.DatabaseError as e:
+            logger.warn("Search index %s is unusable (%s), rebuilding it" % (path, e))
+            os.remove(path)
+            self._db = self._open(path)
+
+    @staticmethod
+    def _open(path):
+        import sqlite3
+        db = sqlite3.connect(path)
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version != SearchIndex.VERSION:
+            if version != 0: # index of another version: start again
+                db.close()
+                os.remove(path)
+                db = sqlite3.connect(path)
+            with db:
+                db.executescript(SCHEMA)
+                db.execute("PRAGMA user_version = %d" % SearchIndex.VERSION)
+        db.execute("PRAGMA synchronous = OFF") # can always be rebuilt
+        return db
+
+    def close(self):
+        self._db.close()
+
+    def _scan(self, courses):
+        """ Yield (course, path, mtime, size) of the indexable files of the
+        courses, given as (name, directory). Hidden files and directories
+        (.git, .moodle files, partial downloads) are skipped """
+        extractors = installed_extractors() # once, not for every file
+        for course, directory in courses:
+            for root, dirs, files in os.walk(directory):
+                dirs[:] = [ d for d in dirs if not d.startswith(".") ]
+                for name in files:
+                    path = os.path.join(root, name)
+                    if name.startswith(".") or not is_indexable(path, extractors):
+                        continue
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    if st.st_size <= MAX_SIZE:
+                        yield (course, path, st.st_mtime_ns, st.st_size)
+
+    def _read(self, paths):
+        """ Yield (path, text, error) of the files, read by worker processes
+        if there are many """
+        if self.workers <= 1 or len(paths) < MIN_FILES_FOR_WORKERS:
+            yield from map(_extract, paths)
+            return
+
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawned: the daemon forking with its threads could deadlock
+        with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            yield from pool.map(_extract, paths, chunksize=max(1, len(paths) // (self.workers * 4)))
+
+    def update(self, courses):
+        """ Bring the index up to date with the files of the courses, given
+        as (name, directory). Return the numbers of (indexed, removed) files """
+        known = { path: (id_, mtime, size, checked)
+                  for id_, path, mtime, size, checked in self._db.execute("SELECT id, path, mtime, size, checked FROM files") }
+
+        changed = {}
+        seen = set()
+        for course, path, mtime, size in self._scan(courses):
+            seen.add(path)
+            entry = known.get(path)
+            if entry is None or entry[1:3] != (mtime, size) or entry[3] - mtime < self.RACY:
+                changed[path] = (course, mtime, size)
+        removed = [ known[p][0] for p in known.keys() - seen ]
+
+        checked = time.time_ns()
+        failed = 0
+        with self._db:
+            self._db.executemany("DELETE FROM documents WHERE rowid = ?", ((i,) for i in removed))
+            self._db.executemany("DELETE FROM files WHERE id = ?", ((i,) for i in removed))
+            for path, text, error in self._read(sorted(changed)):
+                if error is not None:
+                    # not recorded (an older version stays): read again next time
+                    logger.info("Unable to read %s, it will be read again: %s" % (path, error))
+                    failed += 1
+                    continue
+                course, mtime, size = changed[path]
+                old = known.get(path)
+                if old is not None:
+                    self._db.execute("DELETE FROM documents WHERE rowid = ?", (old[0],))
+                    self._db.execute("DELETE FROM files WHERE id = ?", (old[0],))
+                # files without text are kept, so they are not read again
+                cursor = self._db.execute("INSERT INTO files (path, course, mtime, size, checked) VALUES (?, ?, ?, ?, ?)",
+                                          (path, course, mtime, size, checked))
+                if text:
+                    self._db.execute("INSERT INTO documents (rowid, body) VALUES (?, ?)", (cursor.lastrowid, text))
+        logger.info("Indexed %d files, removed %d" % (len(changed) - failed, len(removed)))
+        return (len(changed) - failed, len(removed))
+
+    def search(self, query, limit=20):
+        """ Return the Results of the files containing all the words of the
+        query (as prefixes), best first """
+        expression = query_expression(query)
+        if not expression:
+            return []
+        rows = self._db.execute(
+            "SELECT files.course, files.path, snippet(documents, 0, '[', ']', '...', 12) "
+            "FROM documents JOIN files ON files.id = documents.rowid "
+            "WHERE documents MATCH ? ORDER BY rank LIMIT ?", (expression, limit))
+        return [ Result(course, path, " ".join(snippet.split())) for course, path, snippet in rows ]
+
+    def stats(self):
+        files, = self._db.execute("SELECT COUNT(*) FROM files").fetchone()
+        documents, = self._db.execute("SELECT COUNT(*) FROM documents").fetchone()
+        return { "files": files, "documents": documents, "size": os.path.getsize(self.path) }
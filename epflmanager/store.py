@@ -0,0 +1,132 @@
+import os
+import json
+import shutil
+import logging
+
+from epflmanager.manifest import file_hash
+
+logger = logging.getLogger(__name__)
+
+class BlobNotFound(FileNotFoundError): pass
+
+def same_fingerprint(f1, f2):
+    """ Decide if two fingerprints (as returned by `Downloader.probe`) are the
+    ones of the same content. The ETag is used if the server gives one,
+    otherwise both the size and the last modification date must match """
+    if not f1 or not f2:
+        return False
+    if f1.get("etag") and f2.get("etag"):
+        return f1["etag"] == f2["etag"]
+    return (f1.get("size") is not None and f1.get("last_modified") is not None and
+            f1.get("size") == f2.get("size") and f1.get("last_modified") == f2.get("last_modified"))
+
+class BlobStore(object):
+    """
+    Content-addressed store of the downloaded resources. Every file is kept
+    once under its hash and hard-linked in the course directories that use it.
+
+    The store also remembers, for every Moodle id, the hash of its content and,
+    for every (course, section, name), the successive ids of the resource:
+    as Moodle gives a new id to a resource each time it is updated, this is how
+    an id change of an identical file is recognised without downloading it.
+    """
+    INDEX_FILE = "index.json"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._ids = {}      # moodle id (as str) -> { hash, filename, fingerprint }
+        self._history = {}  # "course/section/name" -> [moodle ids]
+        self.load()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, BlobStore.INDEX_FILE)
+
+    def load(self):
+        """ Load the index of the store. Fail silently if it does not exist """
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            self._ids = index.get("ids", {})
+            self._history = index.get("history", {})
+        except FileNotFoundError:
+            pass
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({ "ids": self._ids, "history": self._history }, f)
+        os.replace(tmp, self.index_path)
+
+    def blob_path(self, hash):
+        return os.path.join(self.directory, hash[:2], hash[2:])
+
+    def has(self, hash):
+        return hash is not None and os.path.isfile(self.blob_path(hash))
+
+    def add(self, path):
+        """ Put the file in the store and return its hash. If the same content
+        is already stored, the file is replaced by a link to the stored one """
+        hash = file_hash(path)
+        blob = self.blob_path(hash)
+        if os.path.isfile(blob):
+            if not os.path.samefile(blob, path):
+                logger.debug("%s is already stored as %s" % (path, hash))
+                self._replace_with_link(blob, path)
+        else:
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            try:
+                os.link(path, blob)
+            except OSError: # not on the same filesystem
+                shutil.copy2(path, blob)
+        return hash
+
+    def link(self, hash, path, replaces=None):
+        """ Make the stored content available at the given path. A file
+        already there is only replaced if it is `replaces` (the previous
+        version of the resource) or has the same content, FileExistsError is
+        raised otherwise """
+        blob = self.blob_path(hash)
+        if not os.path.isfile(blob):
+            raise BlobNotFound("No content stored for %s" % hash)
+        if os.path.lexists(path) and not os.path.samefile(blob, path) and \
+           (replaces is None or os.path.abspath(path) != os.path.abspath(replaces)):
+            raise FileExistsError("%s exists and is not the previous version of the resource" % path)
+        self._replace_with_link(blob, path)
+        return path
+
+    def _replace_with_link(self, blob, path):
+        # renaming a link over another link to the same file does nothing
+        if os.path.exists(path) and os.path.samefile(blob, path):
+            return
+
+        tmp = path + ".link"
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            shutil.copy2(blob, tmp)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _history_key(course_id, section, name):
+        return "%s/%s/%s" % (course_id, section, name)
+
+    def record(self, moodle_id, course_id, section, name, hash, filename, fingerprint=None):
+        """ Remember the content of a Moodle resource """
+        self._ids[str(moodle_id)] = { "hash": hash, "filename": filename, "fingerprint": fingerprint }
+        ids = self._history.setdefault(BlobStore._history_key(course_id, section, name), [])
+        if int(moodle_id) not in ids:
+            ids.append(int(moodle_id))
+
+    def lookup(self, moodle_id):
+        """ Return the dict { hash, filename, fingerprint } of a resource whose
+        content is stored, None if the resource is unknown """
+        entry = self._ids.get(str(moodle_id))
+        if entry is None or not self.has(entry["hash"]):
+            return None
+        return entry
+
+    def previous_ids(self, course_id, section, name):
+        """ Return the ids the resource had, the latest being the last """
+        return list(self._history.get(BlobStore._history_key(course_id, section, name), []))
@@ -0,0 +1,174 @@
+import os
+import logging
+
+import epflmanager.components as components
+from epflmanager.manifest import Resource
+from epflmanager.store import same_fingerprint
+from epflmanager.connections.moodle import resource_id
+from epflmanager.connections.downloader import Download, free_name
+
+logger = logging.getLogger(__name__)
+
+class Change(object):
+    """ A resource of Moodle that needs to be transferred in the course directory.
+    `previous` are the resources of the manifest this one replaces """
+    NEW, UPDATED, MISSING = "new", "updated", "missing"
+
+    def __init__(self, kind, moodle_id, section, name, url, previous=None):
+        self.kind = kind
+        self.moodle_id = moodle_id
+        self.section = section
+        self.name = name
+        self.url = url
+        self.previous = previous if previous is not None else []
+        self.stored = False # True if the content was taken from the store
+
+    def __str__(self):
+        return "%s: %s (%s)" % (self.kind, self.name, self.section)
+
+    def __repr__(self):
+        return "<Change " + str(self) + ">"
+
+def safe_dirname(name):
+    """ Make a name given by Moodle usable as a directory name """
+    name = name.replace(os.sep, "-").replace("/", "-").strip()
+    return name if name not in {"", ".", ".."} else "_"
+
+class Synchronizer(object):
+    """ Synchronize the directory of a course with the resources of its Moodle
+    course. Only the resources missing from the manifest are downloaded, so a
+    synchronization where nothing changed costs a single page fetch.
+
+    With a BlobStore, the resources whose content is already known (same id,
+    or new id with the same fingerprint) are hard-linked instead of downloaded """
+    def __init__(self, moodle, store=None):
+        self._moodle = moodle
+        self._store = store
+
+    def changes(self, course, manifest, resources=None):
+        """ Compare the manifest with the resources listed by Moodle (fetched
+        if not given) and return the list of changes to apply """
+        if resources is None:
+            ch = components.get("CourseHandler")
+            resources = self._moodle.course_resources(ch.moodle_id_for_course(course))
+
+        changes = []
+        for section in resources:
+            for link in section["links"]:
+                rid = resource_id(link.get("href", ""))
+                if rid is None:
+                    continue
+                name = link.get("text", "").strip()
+                # some backends give a direct url to the file
+                url = link.get("download", link["href"])
+
+                known = manifest.get(rid)
+                if known is not None:
+                    path = os.path.join(course.fullpath(), known.path)
+                    if not (os.path.isfile(path) and os.path.getsize(path) == known.size):
+                        changes.append(Change(Change.MISSING, rid, section["name"], name, url, [known]))
+                    continue
+
+                previous = manifest.find(section["name"], name)
+                kind = Change.UPDATED if previous else Change.NEW
+                changes.append(Change(kind, rid, section["name"], name, url, previous))
+
+        logger.debug("Changes for %s: %s" % (course.name, changes))
+        return changes
+
+    def _from_store(self, course_id, change):
+        """ Return the entry of the store holding the content of the changed
+        resource, None if it must be downloaded """
+        entry = self._store.lookup(change.moodle_id)
+        if entry is not None:
+            return entry
+
+        # A known resource that only changed id keeps the same fingerprint
+        previous = self._store.previous_ids(course_id, change.section, change.name)
+        last = self._store.lookup(previous[-1]) if previous else None
+        if last is None or not last["fingerprint"]:
+            return None
+
+        if same_fingerprint(last["fingerprint"], self._moodle.downloader.probe(change.url)):
+            logger.info("%s only changed id (%d -> %d)" % (change.name, previous[-1], change.moodle_id))
+            return last
+        return None
+
+    def _store_download(self, course_id, change, download):
+        """ Put a downloaded file in the store and return its hash """
+        hash = self._store.add(download.path)
+        self._store.record(change.moodle_id, course_id, change.section, change.name,
+                           hash, os.path.basename(download.path), download.fingerprint)
+        return hash
+
+    def _transferred(self, manifest, course, change, path, hash=None):
+        for prev in change.previous:
+            if prev.moodle_id != change.moodle_id:
+                manifest.remove(prev.moodle_id)
+        manifest.add(Resource.from_file(change.moodle_id, change.section, change.name,
+                                        course.fullpath(), path, hash))
+
+    @staticmethod
+    def _replaced(course, change):
+        """ The file of the previous version of the changed resource, which
+        its new version can overwrite """
+        if not change.previous:
+            return None
+        return os.path.join(course.fullpath(), change.previous[-1].path)
+
+    @staticmethod
+    def _free_path(directory, filename, owned, replaced):
+        """ Path in the directory for a file, not taken by another file or by
+        another resource of the manifest (`owned`), as the downloader does """
+        def taken(name):
+            path = os.path.abspath(os.path.join(directory, name))
+            if replaced is not None and path == os.path.abspath(replaced):
+                return False
+            return path in owned or os.path.lexists(path)
+        return os.path.join(directory, free_name(filename, taken))
+
+    def sync(self, course, resources=None):
+        """ Transfer what is new or changed for the course and update its
+        manifest. Return a list of tuples (change, error) """
+        manifest = course.read_manifest()
+        changes = self.changes(course, manifest, resources)
+        if not changes:
+            return []
+
+        course_id = components.get("CourseHandler").moodle_id_for_course(course)
+        # the files of the other resources are never overwritten, even missing
+        owned = { os.path.abspath(os.path.join(course.fullpath(), r.path)) for r in manifest.resources() }
+        results = []
+        downloads = {}
+        try:
+            for change in changes:
+                directory = os.path.join(course.moodle_resources_path, safe_dirname(change.section))
+                os.makedirs(directory, exist_ok=True)
+
+                entry = self._from_store(course_id, change) if self._store is not None else None
+                if entry is None:
+                    downloads[Download(change.url, directory, replaces=self._replaced(course, change))] = change
+                    continue
+
+                replaced = self._replaced(course, change)
+                path = self._store.link(entry["hash"], Synchronizer._free_path(directory, entry["filename"], owned, replaced),
+                                        replaces=replaced)
+                self._store.record(change.moodle_id, course_id, change.section, change.name,
+                                   entry["hash"], entry["filename"], entry["fingerprint"])
+                change.stored = True
+                self._transferred(manifest, course, change, path, entry["hash"])
+                results.append((change, None))
+
+            for download, error in self._moodle.downloader.download_all(downloads.keys(), owned):
+                change = downloads[download]
+                if error is None:
+                    hash = self._store_download(course_id, change, download) if self._store is not None else None
+                    self._transferred(manifest, course, change, download.path, hash)
+                results.append((change, error))
+        finally:
+            # keep track of what was transferred even if interrupted
+            course.write_manifest(manifest)
+            if self._store is not None:
+                self._store.save()
+
+        return results
@@ -0,0 +1,281 @@
+import os
+import abc
+import time
+import errno
+import select
+import struct
+import logging
+import ctypes
+import ctypes.util
+
+import epflmanager.components as components
+import epflmanager.cache as cache
+import epflmanager.metadata as metadata
+from epflmanager.io.specialdirs import CourseDir
+
+logger = logging.getLogger(__name__)
+
+# Depths of the watched directories under main_dir
+MAIN, SEMESTER, COURSE = 0, 1, 2
+
+class Watcher(abc.ABC):
+    """
+    Keep the knowledge of the course tree up to date while it changes:
+    every changed directory (main directory, semesters, courses) is dropped
+    from the shared cache and, if the CourseIndex is started, read again
+    right away with the Moodle and site.url files of the courses. Queries
+    then never have to walk the tree.
+
+    Changes are only processed once the tree has been quiet for `settle`
+    seconds, which coalesces bursts of events (a copy of a whole course) and
+    lets the index trust the modification times it records.
+
+    The subclasses tell how the changes are detected (`_wait`).
+    """
+    def __init__(self, main_dir=None, settle=None):
+        self._ch = components.get("CourseHandler")
+        if main_dir is None:
+            main_dir = self._ch._main_dir.fullpath()
+        self.main_dir = os.path.abspath(main_dir)
+        self.settle = settle if settle is not None else cache.Cache.RACY / 10**9
+        self._dirty = set()
+        self._last_change = None
+
+    def depth(self, path):
+        """ Depth of a path under main_dir, None if it is not watched """
+        rel = os.path.relpath(path, self.main_dir)
+        if rel == ".":
+            return MAIN
+        parts = rel.split(os.sep)
+        if parts[0] == ".." or len(parts) > COURSE:
+            return None
+        if not self._ch.is_semester_dir(parts[0]):
+            return None
+        if len(parts) == COURSE and not self._ch.can_be_course_dir(parts[1]):
+            return None
+        return len(parts)
+
+    def directories(self, path=None):
+        """ Yield the watched directories under a path (main_dir by default) """
+        path = self.main_dir if path is None else path
+        depth = self.depth(path)
+        if depth is None or not os.path.isdir(path):
+            return
+        yield path
+        if depth < COURSE:
+            try:
+                entries = [ e.path for e in os.scandir(path) if e.is_dir() ]
+            except FileNotFoundError:
+                return
+            for subdir in entries:
+                yield from self.directories(subdir)
+
+    def tracked_files(self, course_path):
+        """ Files of a course directory that are parsed """
+        course = CourseDir(os.path.dirname(course_path))(os.path.basename(course_path))
+        return [course.moodle_file_path, course.course_urls_file_path]
+
+    def refresh(self, path):
+        """ Update what is known about a directory """
+        cache.shared.invalidate(path)
+        if self.depth(path) == COURSE:
+            # a Moodle id changed by hand changes the generation of the
+            # metadata, the courses by id of the catalogue are then rebuilt
+            metadata.shared.moodle_id(self.tracked_files(path)[0])
+        index = components.get("CourseIndex")
+        if index is None:
+            return
+
+        try:
+            index.subdirs(path)
+        except FileNotFoundError:
+            return
+        if self.depth(path) == COURSE:
+            moodle_file, urls_file = self.tracked_files(path)
+            index.moodle_id(moodle_file)
+            index.course_urls(urls_file)
+
+    def _changed(self, paths):
+        paths = [ p for p in paths if self.depth(p) is not None ]
+        if paths:
+            self._dirty.update(paths)
+            self._last_change = time.monotonic()
+
+    @abc.abstractmethod
+    def _wait(self, timeout):
+        """ Wait for changes at most `timeout` seconds, return the changed directories """
+
+    def step(self, timeout):
+        """ Process the changes of the next `timeout` seconds at most. Return
+        the refreshed directories, once they are settled """
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            if self._dirty and now - self._last_change >= self.settle:
+                refreshed, self._dirty = sorted(self._dirty), set()
+                for path in refreshed:
+                    self.refresh(path)
+                return refreshed
+
+            wait = deadline - now
+            if self._dirty:
+                wait = min(wait, self._last_change + self.settle - now)
+            if wait <= 0:
+                return []
+            self._changed(self._wait(wait))
+
+    def run(self, callback=None, stop=None, timeout=1.0):
+        """ Watch until `stop` (a threading.Event) is set, call `callback`
+        with the refreshed directories """
+        while stop is None or not stop.is_set():
+            refreshed = self.step(timeout)
+            if refreshed and callback is not None:
+                callback(refreshed)
+
+    def close(self):
+        pass
+
+class InotifyUnavailable(OSError): pass
+
+class InotifyWatcher(Watcher):
+    """ Watcher using the inotify API of Linux (through ctypes) """
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM  = 0x00000040
+    IN_MOVED_TO    = 0x00000080
+    IN_CREATE      = 0x00000100
+    IN_DELETE      = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF   = 0x00000800
+    IN_Q_OVERFLOW  = 0x00004000
+    IN_IGNORED     = 0x00008000
+    IN_ONLYDIR     = 0x01000000
+    IN_ISDIR       = 0x40000000
+
+    DIR_EVENTS = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+    COURSE_EVENTS = DIR_EVENTS | IN_CLOSE_WRITE
+
+    EVENT = struct.Struct("iIII") # wd, mask, cookie, len
+
+    def __init__(self, main_dir=None, settle=None):
+        super().__init__(main_dir, settle)
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+            self._fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        except (OSError, AttributeError) as e:
+            raise InotifyUnavailable("inotify is not available: %s" % e)
+        if self._fd < 0:
+            raise InotifyUnavailable(ctypes.get_errno(), "inotify_init1 failed")
+
+        self._paths = {} # wd -> path
+        for path in self.directories():
+            self.watch(path)
+        logger.info("Watching %d directories with inotify" % len(self._paths))
+
+    def watch(self, path):
+        mask = self.COURSE_EVENTS if self.depth(path) == COURSE else self.DIR_EVENTS
+        wd = self._add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                logger.warn("Too many watches (see /proc/sys/fs/inotify/max_user_watches)")
+            elif err not in (errno.ENOENT, errno.ENOTDIR):
+                logger.warn("Unable to watch %s: %s" % (path, os.strerror(err)))
+            return
+        # a moved directory keeps its watch: only its path changes
+        self._paths[wd] = path
+
+    def _wait(self, timeout):
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & self.IN_Q_OVERFLOW:
+                logger.warn("Events were lost, refreshing everything")
+                changed.update(self._paths.values())
+                continue
+
+            path = self._paths.get(wd)
+            if path is None:
+                continue
+            if mask & self.IN_IGNORED:
+                del self._paths[wd]
+                continue
+            if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                changed.add(os.path.dirname(path))
+                continue
+
+            changed.add(path)
+            if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                for subdir in self.directories(os.path.join(path, name)):
+                    self.watch(subdir)
+                    changed.add(subdir)
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+class PollingWatcher(Watcher):
+    """ Watcher comparing the modification times of the tree every
+    `interval` seconds, where inotify is not available """
+    def __init__(self, main_dir=None, settle=None, interval=5.0):
+        super().__init__(main_dir, settle)
+        self.interval = interval
+        self._next_poll = time.monotonic() + interval
+        self._mtimes = self.mtimes()
+        logger.info("Polling %d directories every %ss" % (len(self._mtimes), interval))
+
+    def _stat(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def mtimes(self):
+        """ Map from the watched directories to their modification time and
+        the one of their tracked files """
+        mtimes = {}
+        for path in self.directories():
+            files = self.tracked_files(path) if self.depth(path) == COURSE else []
+            mtimes[path] = tuple(self._stat(p) for p in [path] + files)
+        return mtimes
+
+    def _wait(self, timeout):
+        wait = self._next_poll - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0, wait))
+        self._next_poll = time.monotonic() + self.interval
+
+        mtimes = self.mtimes()
+        changed = { p for p, m in mtimes.items() if self._mtimes.get(p) != m }
+        # the parent of a removed directory changed as well
+        changed.update(os.path.dirname(p) for p in self._mtimes.keys() - mtimes.keys())
+        self._mtimes = mtimes
+        return changed
+
+def create_watcher(main_dir=None, settle=None, polling=False, interval=5.0):
+    """ Return an InotifyWatcher, or a PollingWatcher if inotify is not
+    available (or `polling` is set) """
+    if not polling:
+        try:
+            return InotifyWatcher(main_dir, settle)
+        except InotifyUnavailable as e:
+            logger.info("%s, falling back to polling" % e)
+    return PollingWatcher(main_dir, settle, interval)
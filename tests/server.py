@@ -0,0 +1,128 @@
+""" Local stand-in for the HTTP servers used by epflmanager """
+
+import re
+import time
+import threading
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class FileHandler(BaseHTTPRequestHandler):
+    """ Serve the files of `server.files` (a map from path to (content, etag),
+    or to None to drop the connection).
+    Honour conditional and Range/If-Range requests like the Moodle server does """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.do_GET(body=False)
+
+    def do_GET(self, body=True):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            time.sleep(self.server.delay)
+            self.respond(body)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def respond(self, body):
+        path = self.path.split("?")[0]
+        if path not in self.server.files:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if self.server.files[path] is None:
+            # a dropped connection: the client gets no response at all
+            self.close_connection = True
+            return
+
+        content, etag = self.server.files[path]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        start = 0
+        status = 200
+        m = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+        if m is not None and self.headers.get("If-Range", etag) == etag:
+            start = int(m.group(1))
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        # stop in the middle of the content to simulate a dropped connection
+        end = len(content)
+        if self.server.cut_after is not None:
+            end = min(end, start + self.server.cut_after)
+
+        self.send_response(status)
+        self.send_header("ETag", etag)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Disposition", 'attachment; filename="%s"' % path.rsplit("/", 1)[-1])
+        self.send_header("Content-Length", str(len(content) - start))
+        if status == 206:
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, len(content) - 1, len(content)))
+        self.end_headers()
+        if body:
+            self.wfile.write(content[start:end])
+            if end < len(content):
+                self.close_connection = True
+
+class LocalServer(object):
+    """ HTTP server running in a thread, to be used as a context manager """
+    def __init__(self, handler=FileHandler):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.files = {}
+        self.httpd.requests = []
+        self.httpd.cut_after = None
+        self.httpd.delay = 0
+        self.httpd.lock = threading.Lock()
+        self.httpd.in_flight = 0
+        self.httpd.max_in_flight = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def files(self):
+        return self.httpd.files
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def max_in_flight(self):
+        """ Maximum number of requests that were handled at the same time """
+        return self.httpd.max_in_flight
+
+    def delay(self, seconds):
+        """ Wait before answering each request """
+        self.httpd.delay = seconds
+
+    def cut_after(self, n):
+        self.httpd.cut_after = n
+
+    def url(self, path):
+        return "http://127.0.0.1:%d%s" % (self.httpd.server_address[1], path)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,152 @@
+import os
+import shutil
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+from urllib import parse
+
+from epflmanager.connections.asyncmoodle import AsyncMoodle
+from epflmanager.connections.downloader import Download, DownloadError
+from epflmanager.connections.session import AuthenticationFailed
+import epflmanager.components as components
+
+from components import setup_config, setup_console
+from server import LocalServer, FileHandler
+
+MY_PAGE = """<html><body>
+<div class="coc-course"><h3><a title="Algorithms" href="/course/view.php?id=13768">Algorithms</a></h3></div>
+<div class="coc-course"><h3><a title="Analysis" href="/course/view.php?id=14000">Analysis</a></h3></div>
+</body></html>"""
+
+COURSE_PAGE = """<html><body><ul>
+<li class="section"><div class="content"><h3 class="sectionname">Week %(n)d</h3>
+<ul><li><a href="/mod/resource/view.php?id=%(n)d01">Slides</a></li>
+<li><a href="/mod/forum/view.php?id=%(n)d02">Forum</a></li></ul></div></li>
+</ul></body></html>"""
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+class AsyncMoodleTest(unittest.TestCase):
+
+    def setUp(self):
+        setup_config()
+        setup_console()
+        self.directory = tempfile.mkdtemp()
+        self.server = LocalServer().__enter__()
+        self.server.files["/my/"] = (MY_PAGE.encode("utf-8"), '"my"')
+        for n in range(1, 21):
+            self.server.files["/course/%d" % n] = ((COURSE_PAGE % { "n": n }).encode("utf-8"), '"c%d"' % n)
+        self.server.files["/files/slides.pdf"] = (b"slides" * 1000, '"s"')
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        shutil.rmtree(self.directory)
+
+    def moodle(self, concurrency=4):
+        return AsyncMoodle(concurrency=concurrency,
+                           main_url=self.server.url(""),
+                           course_url=self.server.url("/course/{course_id}"),
+                           cookie_file=os.path.join(self.directory, "moodle.cookies"))
+
+    def test_courses(self):
+        async def courses():
+            async with self.moodle() as moodle:
+                return await moodle.courses()
+
+        self.assertDictEqual(run(courses()), { "Algorithms": 13768, "Analysis": 14000 })
+
+    def test_course_resources(self):
+        async def resources():
+            async with self.moodle() as moodle:
+                return await moodle.course_resources(3)
+
+        sections = run(resources())
+        self.assertEqual(len(sections), 1)
+        self.assertEqual(sections[0]["name"], "Week 3")
+        self.assertListEqual([l["text"] for l in sections[0]["links"]], ["Slides", "Forum"])
+
+    def test_courses_resources_respects_the_concurrency_limit(self):
+        self.server.delay(0.05)
+        async def resources():
+            async with self.moodle(concurrency=5) as moodle:
+                return [ r async for r in moodle.courses_resources(range(1, 21)) ]
+
+        results = run(resources())
+        self.assertSetEqual({ course_id for course_id, _, _ in results }, set(range(1, 21)))
+        self.assertTrue(all(error is None for _, _, error in results))
+        self.assertTrue(1 < self.server.max_in_flight <= 5)
+
+    def test_download_all(self):
+        downloads = [ Download(self.server.url("/files/slides.pdf"), self.directory),
+                      Download(self.server.url("/files/nothing.pdf"), self.directory) ]
+        async def download():
+            async with self.moodle() as moodle:
+                return { d.url: e async for d, e in moodle.download_all(downloads) }
+
+        errors = run(download())
+        self.assertIsNone(errors[self.server.url("/files/slides.pdf")])
+        self.assertIsInstance(errors[self.server.url("/files/nothing.pdf")], DownloadError)
+        with open(os.path.join(self.directory, "slides.pdf"), "rb") as f:
+            self.assertEqual(f.read(), b"slides" * 1000)
+
+class TequilaHandler(FileHandler):
+    """ The login of Moodle through Tequila, accepting the password "right" """
+    def do_GET(self, body=True):
+        if self.path == "/login/":
+            self.server.requests.append((self.command, self.path, dict(self.headers)))
+            self.send_response(303)
+            self.send_header("Location", "/tequila?requestkey=abc")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        super().do_GET(body)
+
+    def do_POST(self):
+        params = dict(parse.parse_qsl(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")))
+        self.server.requests.append((self.command, self.path, params))
+        body = b"You are connected as someone" if params.get("password") == "right" else b"Wrong password"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class AsyncAuthenticationTest(unittest.TestCase):
+    """ Authentication with the credentials of the environment """
+
+    def setUp(self):
+        setup_config()
+        setup_console()
+        self.directory = tempfile.mkdtemp()
+        self.cookie_file = os.path.join(self.directory, "moodle.cookies")
+        self.server = LocalServer(TequilaHandler).__enter__()
+        self.server.files["/tequila"] = (b"login form", '"t"')
+        self.config = components.get("Config")
+        self.config["moodle"]["credentials"] = "env"
+
+    def tearDown(self):
+        self.config.remove_option("moodle", "credentials")
+        self.server.__exit__(None, None, None)
+        shutil.rmtree(self.directory)
+
+    def authenticate(self, password):
+        async def authenticate():
+            async with AsyncMoodle(main_url=self.server.url(""), cookie_file=self.cookie_file) as moodle:
+                await moodle.authentication_process()
+        environ = { "EPFL_GASPAR_USER": "gaspar", "EPFL_GASPAR_PASSWORD": password }
+        with mock.patch.dict(os.environ, environ), \
+             mock.patch("epflmanager.connections.asyncmoodle.TEQUILA_LOGIN_URL", self.server.url("/tequila/login?requestkey=%s")):
+            run(authenticate())
+
+    def test_refused_session_is_not_saved(self):
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate("wrong")
+        self.assertFalse(os.path.exists(self.cookie_file))
+
+        posted = [ params for method, path, params in self.server.requests if method == "POST" ]
+        self.assertListEqual(posted, [{ "username": "gaspar", "password": "wrong" }])
+
+    def test_accepted_session_is_saved(self):
+        self.authenticate("right")
+        self.assertTrue(os.path.exists(self.cookie_file))
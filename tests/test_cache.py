@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+from epflmanager.cache import Cache
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dirs = []
+        for name in ["A", "B"]:
+            d = os.path.join(self.tmp.name, name)
+            os.mkdir(d)
+            self.age(d)
+            self.dirs.append(d)
+        self.cache = Cache(max_size=10)
+        self.computed = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def age(self, path, seconds=10):
+        """ Set the modification time of a path in the past, so that it is
+        not racy anymore """
+        t = os.stat(path).st_mtime - seconds
+        os.utime(path, (t, t))
+
+    def compute(self, value):
+        def inner():
+            self.computed += 1
+            return value
+        return inner
+
+    def test_value_is_computed_once(self):
+        for _ in range(3):
+            self.assertEqual(self.cache.get("k", self.compute([1]), self.dirs[0]), [1])
+        self.assertEqual(self.computed, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+
+    def test_modified_directory_invalidates(self):
+        self.cache.get("k", self.compute([1]), self.dirs[0])
+        os.mkdir(os.path.join(self.dirs[0], "new"))
+        self.assertEqual(self.cache.get("k", self.compute([2]), self.dirs[0]), [2])
+
+    def test_racy_directory_is_not_trusted(self):
+        racy = os.path.join(self.tmp.name, "C")
+        os.mkdir(racy)
+        self.cache.get("k", self.compute([1]), racy)
+        self.cache.get("k", self.compute([1]), racy)
+        self.assertEqual(self.computed, 2)
+
+    def test_invalidate(self):
+        self.cache.get("a", self.compute([1]), self.dirs[0])
+        self.cache.get("b", self.compute([2]), self.dirs[1])
+        self.cache.invalidate(self.dirs[0])
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.get("a", self.compute([3]), self.dirs[0]), [3])
+        self.assertEqual(self.cache.invalidations, 1)
+
+    def test_least_recently_used_values_are_evicted(self):
+        self.cache.get("a", self.compute([1] * 4), self.dirs[0])
+        self.cache.get("b", self.compute([2] * 4), self.dirs[0])
+        self.cache.get("a", self.compute(None), self.dirs[0])
+        self.cache.get("c", self.compute([3] * 4), self.dirs[1])
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertEqual(self.cache.stats()["size"], 8)
+        # b was the least recently used
+        self.assertEqual(self.cache.get("b", self.compute([4]), self.dirs[0]), [4])
+
+    def test_missing_directory_is_not_cached(self):
+        missing = os.path.join(self.tmp.name, "missing")
+        self.cache.get("k", self.compute([1]), missing)
+        self.assertEqual(len(self.cache), 0)
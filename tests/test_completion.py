@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+
+from epflmanager.completion import CompletionCache, complete, COMMANDS, COURSE_ACTIONS
+
+class ListingSource(object):
+    """ Read the names from a tree of real directories, counting the reads """
+    def __init__(self, main_dir):
+        self.main_dir = main_dir
+        self.urls_file = "site.url"
+        self.reads = []
+
+    def semesters(self):
+        self.reads.append("semesters")
+        return sorted(os.listdir(self.main_dir))
+
+    def courses(self, semester):
+        self.reads.append(semester)
+        return sorted(os.listdir(os.path.join(self.main_dir, semester)))
+
+    def sites(self, semester, course):
+        self.reads.append(course)
+        try:
+            with open(os.path.join(self.main_dir, semester, course, self.urls_file)) as f:
+                return [ line.split(None, 1)[1].strip() for line in f if line.strip() ]
+        except FileNotFoundError:
+            return []
+
+class CompletionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.main_dir = os.path.join(self.tmp.name, "EPFL")
+        self.config_file = os.path.join(self.tmp.name, "config.ini")
+        with open(self.config_file, "w") as f:
+            f.write("[directories]\n")
+        for path in ["BA1/Algebra", "BA1/Analysis", "BA2/Physics"]:
+            os.makedirs(os.path.join(self.main_dir, path))
+        with open(os.path.join(self.main_dir, "BA2", "Physics", "site.url"), "w") as f:
+            f.write("http://example.com/physics Course page\nhttp://example.com/ex Exercises\n")
+        for root, dirs, files in os.walk(self.main_dir):
+            for name in [root] + [ os.path.join(root, f) for f in files ]:
+                self.age(name)
+        self.source = ListingSource(self.main_dir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def age(self, path, seconds=10):
+        t = os.stat(path).st_mtime - seconds
+        os.utime(path, (t, t))
+
+    def cache_for(self, config_file):
+        return CompletionCache(os.path.join(self.tmp.name, "completion.json"), config_file, self.source)
+
+    def complete(self, *words):
+        return complete(["--config", self.config_file] + list(words), self.cache_for)
+
+    def test_commands_are_completed_without_reading_the_tree(self):
+        self.assertListEqual(complete([""], self.cache_for), COMMANDS)
+        self.assertListEqual(complete(["co"], self.cache_for), ["courses"])
+        self.assertListEqual(complete(["courses", "s"], self.cache_for), ["sync"])
+        self.assertListEqual(self.source.reads, [])
+
+    def test_courses_of_the_latest_semester(self):
+        self.assertListEqual(self.complete("open", ""), ["Physics"])
+        self.assertListEqual(self.complete("--semester", "BA1", "courses", "sync", "a"), ["Algebra", "Analysis"])
+        self.assertListEqual(self.complete("--semester", ""), ["BA1", "BA2"])
+
+    def test_sites_of_a_course(self):
+        self.assertListEqual(self.complete("open", "phys", ""), ["Course page", "Exercises"])
+        self.assertListEqual(self.complete("open", "Physics", "ex"), ["Exercises"])
+
+    def test_names_are_read_once(self):
+        for _ in range(3):
+            self.complete("open", "Physics", "")
+        self.assertListEqual(self.source.reads, ["semesters", "BA2", "Physics"])
+
+    def test_changed_directory_is_read_again(self):
+        self.complete("open", "")
+        os.mkdir(os.path.join(self.main_dir, "BA2", "Mechanics"))
+        self.assertListEqual(self.complete("open", ""), ["Mechanics", "Physics"])
+        self.assertListEqual(self.source.reads, ["semesters", "BA2", "BA2"])
+
+    def test_recently_modified_directory_is_not_trusted(self):
+        os.mkdir(os.path.join(self.main_dir, "BA2", "Mechanics")) # racy
+        self.complete("open", "")
+        self.complete("open", "")
+        self.assertListEqual(self.source.reads, ["semesters", "BA2", "BA2"])
+
+    def test_changed_config_drops_the_cache(self):
+        self.complete("open", "")
+        with open(self.config_file, "a") as f:
+            f.write("main_dir=/elsewhere\n")
+        self.complete("open", "")
+        self.assertListEqual(self.source.reads, ["semesters", "BA2", "semesters", "BA2"])
+
+    def test_commands_of_the_parser(self):
+        from epflmanager.cli import build_parser
+        parser = build_parser()
+        commands = parser._subparsers._group_actions[0].choices
+        self.assertSetEqual(set(commands), set(COMMANDS))
+        actions = commands["courses"]._subparsers._group_actions[0].choices
+        self.assertSetEqual(set(actions), set(COURSE_ACTIONS))
+
+    def test_options_of_the_command_and_action(self):
+        self.assertListEqual(complete(["watch", "--p"], self.cache_for), ["--polling"])
+        self.assertListEqual(complete(["courses", "link", "--a"], self.cache_for), ["--all"])
+        self.assertListEqual(complete(["c", "link", "Algebra", "--a"], self.cache_for), ["--all"])
+        for action in ["list", "news", "sync", "add"]:
+            self.assertListEqual(complete(["courses", action, "--a"], self.cache_for), [])
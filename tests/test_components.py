@@ -0,0 +1,112 @@
+import unittest
+
+from epflmanager.components import ComponentRegistry, ComponentAlreadyRegisteredError, ComponentDependencyError
+
+class Thing(object):
+    def __init__(self, name, log):
+        self.name = name
+        self.log = log
+
+    def teardown(self):
+        self.log.append("teardown " + self.name)
+
+class ComponentRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = ComponentRegistry()
+        self.log = []
+
+    def factory(self, name, depends=(), **kwargs):
+        def create():
+            self.log.append("create " + name)
+            return Thing(name, self.log)
+        self.registry.register_factory(name, create, depends=depends, **kwargs)
+
+    def test_factory_is_called_on_first_use_only(self):
+        self.factory("A")
+        self.assertTrue(self.registry.is_registered("A"))
+        self.assertFalse(self.registry.is_started("A"))
+        self.assertListEqual(self.log, [])
+
+        a = self.registry.get("A")
+        self.assertIs(self.registry.get("A"), a)
+        self.assertListEqual(self.log, ["create A"])
+        self.assertIn("A", self.registry.timings)
+
+    def test_factory_that_failed_is_tried_again(self):
+        attempts = []
+        def create():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OSError("not yet")
+            return Thing("A", self.log)
+        self.registry.register_factory("A", create)
+
+        with self.assertRaises(OSError):
+            self.registry.get("A")
+        self.assertTrue(self.registry.is_registered("A"))
+        self.assertEqual(self.registry.get("A").name, "A")
+
+    def test_dependencies_are_created_first(self):
+        self.factory("C", depends=["B"])
+        self.factory("B", depends=["A"])
+        self.factory("A")
+        self.registry.get("C")
+        self.assertListEqual(self.log, ["create A", "create B", "create C"])
+
+    def test_missing_dependency(self):
+        self.factory("B", depends=["A"])
+        with self.assertRaises(ComponentDependencyError):
+            self.registry.get("B")
+        self.assertFalse(self.registry.is_started("B"))
+
+    def test_circular_dependency(self):
+        self.factory("A", depends=["B"])
+        self.factory("B", depends=["A"])
+        with self.assertRaisesRegex(ComponentDependencyError, "A -> B -> A"):
+            self.registry.get("A")
+
+    def test_teardown_in_reverse_order(self):
+        self.factory("A")
+        self.factory("B", depends=["A"])
+        self.factory("C")
+        self.registry.get("B")
+        self.registry.get("C")
+        del self.log[:]
+
+        self.registry.teardown()
+        self.assertListEqual(self.log, ["teardown C", "teardown B", "teardown A"])
+        self.assertFalse(self.registry.is_started("A"))
+
+    def test_teardown_of_a_component_releases_its_dependents(self):
+        self.factory("A")
+        self.factory("B", depends=["A"])
+        self.factory("C")
+        self.registry.get("B")
+        self.registry.get("C")
+        del self.log[:]
+
+        self.registry.teardown("A")
+        self.assertListEqual(self.log, ["teardown B", "teardown A"])
+        self.assertTrue(self.registry.is_started("C"))
+
+        # created again when needed
+        self.registry.get("B")
+        self.assertListEqual(self.log[2:], ["create A", "create B"])
+
+    def test_teardown_hook_of_the_factory(self):
+        self.factory("A", teardown=lambda a: self.log.append("closed " + a.name))
+        self.registry.get("A")
+        self.registry.teardown()
+        self.assertListEqual(self.log, ["create A", "closed A"])
+
+    def test_explicit_component_replaces_factory(self):
+        self.factory("A")
+        thing = Thing("explicit", self.log)
+        thing._component_name = "A"
+        self.registry.register(thing)
+        self.assertIs(self.registry.get("A"), thing)
+        self.assertListEqual(self.log, [])
+
+        with self.assertRaises(ComponentAlreadyRegisteredError):
+            self.factory("A")
@@ -7,6 +7,8 @@ import itertools
 import pyfakefs.fake_filesystem_unittest as fakefs
 
 from epflmanager.coursehandler import CourseHandler, SemesterNotFound, CourseNotFound
+from epflmanager.index import CourseIndex
+from epflmanager.watcher import PollingWatcher
 from epflmanager.io.fileorganizer import Directory
 from epflmanager.io.specialdirs import SemesterDir, CourseDir, CourseNotLinkedWithMoodle
 import epflmanager.components as components
@@ -74,6 +76,13 @@ class CourseHandlerTest(fakefs.TestCase):
 
         os.chdir(path)
 
+    def age_tree(self):
+        """ Make the tree look not modified recently: its listings and files
+        are trusted by the caches """
+        for directory, _, files in os.walk(self.root):
+            for path in [directory] + [ os.path.join(directory, f) for f in files ]:
+                os.utime(path, (0, 0))
+
     def create_classic_epfl_hierarchy(self, semesters=None, course_gen=None):
         """ Create the following file tree:
 
@@ -312,3 +321,157 @@ class CourseHandlerTest(fakefs.TestCase):
             newMoodleID2 = 1000
             self.ch.link_course_with_moodle(course2, newMoodleID2)
             self.assertEquals(self.ch.moodle_id_for_course(course2), str(newMoodleID2))
+
+    def test_link_courses_with_moodle(self):
+        self.create_classic_epfl_hierarchy(semesters=["BA1"], course_gen=itertools.repeat(0))
+        self.create_course_tree("Linked", "BA1", with_moodle=True)
+        self.create_course_tree("Algorithms", "BA1", with_moodle=False)
+        self.create_course_tree("Physics", "BA1", with_moodle=False)
+
+        with self.ch:
+            semester = self.ch.get_semester("BA1")
+            unlinked = self.ch.unlinked_courses(semester)
+            self.assertListEqual(sorted(c.name for c in unlinked), ["Algorithms", "Physics"])
+
+            self.ch.link_courses_with_moodle([ (c, 200 + i) for i, c in enumerate(sorted(unlinked, key=lambda c: c.name)) ])
+            self.assertListEqual(self.ch.unlinked_courses(semester), [])
+            self.assertEqual(self.ch.moodle_id_for_course(self.ch.get_course("Physics", semester)), "201")
+            self.assertListEqual([ c.name for c in self.ch.courses_with_moodle_id(200) ], ["Algorithms"])
+
+    def test_find_courses_searches_all_semesters(self):
+        self.create_classic_epfl_hierarchy(semesters=["BA1", "BA3", "MA1"], course_gen=itertools.repeat(1))
+        self.create_course_tree("Algorithms", "BA3")
+        self.create_course_tree("Algebra", "BA1")
+        self.create_course_tree("Advanced Algorithms", "MA1")
+
+        with self.ch:
+            results = self.ch.find_courses("algorithms")
+            self.assertListEqual([ (c.semester_name, c.name) for _, c in results ][:2],
+                                 [("BA3", "Algorithms"), ("MA1", "Advanced Algorithms")])
+
+            # the courses of the given semester come first
+            results = self.ch.find_courses("alg", self.ch.get_semester("BA1"))
+            self.assertEqual(results[0][1].name, "Algebra")
+
+            # only the semester for an empty query
+            self.assertSetEqual({ c.name for _, c in self.ch.find_courses("") }, {"Advanced Algorithms", "MA1Course1"})
+
+    def test_find_courses_sees_new_courses(self):
+        self.create_classic_epfl_hierarchy(semesters=["BA1", "BA2"], course_gen=itertools.repeat(1))
+
+        with self.ch:
+            self.assertListEqual(self.ch.find_courses("physics"), [])
+            self.create_course_tree("Physics", "BA1")
+            self.assertListEqual([ c.name for _, c in self.ch.find_courses("physics") ], ["Physics"])
+
+    def test_get_course_without_semester_looks_in_all_semesters(self):
+        self.create_classic_epfl_hierarchy(semesters=["BA1", "BA2", "MA1"], course_gen=itertools.repeat(1))
+        self.create_course_tree("Analysis", "BA1")
+        self.create_course_tree("Analysis", "BA2")
+
+        with self.ch:
+            self.assertEqual(self.ch.get_course("MA1Course1").name, "MA1Course1")
+            course = self.ch.get_course("Analysis")
+            self.assertEqual((course.semester_name, course.name), ("BA2", "Analysis"))
+            self.assertListEqual([ c.semester_name for c in self.ch.catalogue().by_name("Analysis") ], ["BA1", "BA2"])
+            with self.assertRaises(CourseNotFound):
+                self.ch.get_course("Analysis", self.ch.get_semester("MA1"))
+            with self.assertRaises(CourseNotFound):
+                self.ch.get_course("Nothing")
+
+    def test_courses_with_moodle_id(self):
+        self.create_classic_epfl_hierarchy(semesters=["BA1", "BA2"], course_gen=itertools.repeat(1))
+        self.create_course_tree("Analysis", "BA1", with_moodle=False)
+
+        with self.ch:
+            # every course of the hierarchy is linked with the id 100
+            self.assertEqual(len(self.ch.courses_with_moodle_id(100)), 2)
+            self.assertListEqual(self.ch.courses_with_moodle_id(42), [])
+
+            analysis = self.ch.get_course("Analysis")
+            self.ch.link_course_with_moodle(analysis, 42)
+            self.assertListEqual(self.ch.courses_with_moodle_id("42"), [analysis])
+
+    def test_courses_linked_by_hand_are_found(self):
+        self.create_classic_epfl_hierarchy(semesters=["BA1", "BA2"], course_gen=itertools.repeat(0))
+        self.create_course_tree("Algo", "BA1")
+        self.create_course_tree("Analysis", "BA1", with_moodle=False)
+        self.create_course_tree("Algorithms", "BA2", with_moodle=False)
+        self.age_tree()
+
+        with self.ch:
+            self.assertEqual([ c.name for c in self.ch.courses_with_moodle_id(100) ], ["Algo"])
+            self.assertListEqual(self.ch.courses_with_moodle_id(42), [])
+
+            # without CourseHandler (by hand or by another process), seen by the watcher
+            self.fs.CreateFile("/BA1/Analysis/.moodle.Analysis", contents="[course]\nmoodle_id = 42")
+            self.fs.CreateFile("/BA2/Algorithms/.moodle.Algorithms", contents="[course]\nmoodle_id = 100")
+            watcher = PollingWatcher(main_dir=self.root)
+            for path in ["/BA1/Analysis", "/BA2/Algorithms"]:
+                watcher.refresh(path)
+            self.assertEqual([ c.name for c in self.ch.courses_with_moodle_id(100) ], ["Algo", "Algorithms"])
+            self.assertEqual([ c.name for c in self.ch.courses_with_moodle_id(42) ], ["Analysis"])
+
+    def test_unknown_moodle_ids_do_not_read_the_ids_again(self):
+        self.create_classic_epfl_hierarchy(semesters=["BA1", "BA2"], course_gen=itertools.repeat(1))
+        self.age_tree()
+
+        with self.ch:
+            self.ch.courses_with_moodle_id(100)
+            by_moodle_id = self.ch.catalogue()._by_moodle_id
+            for moodle_id in [1, 2, 3]:
+                self.assertListEqual(self.ch.courses_with_moodle_id(moodle_id), [])
+            self.assertIs(self.ch.catalogue()._by_moodle_id, by_moodle_id)
+
+    def test_renamed_course_is_repaired(self):
+        self.create_classic_epfl_hierarchy(semesters=["BA1", "BA2"], course_gen=itertools.repeat(0))
+        self.create_course_tree("Algo", "BA2")
+        self.fs.get_object("/BA2/Algo").st_ino = 4242 # not set by this version of pyfakefs
+        index = CourseIndex(":memory:")
+        components.as_component(index, "CourseIndex")
+        try:
+            with self.ch:
+                self.assertEqual([ c.name for c in self.ch.repair_courses() ], ["Algo"])
+                self.assertEqual(index.course_by_path(os.path.abspath("/BA2/Algo"))[2], "100")
+
+                os.rename("/BA2/Algo", "/BA2/Algorithms")
+                # found by its former name
+                course = self.ch.get_course("Algo")
+                self.assertEqual(course.name, "Algorithms")
+                self.assertTrue(os.path.exists("/BA2/Algorithms/.moodle.Algorithms"))
+                self.assertEqual(self.ch.moodle_id_for_course(course), "100")
+
+                os.rename("/BA2/Algorithms", "/BA2/Algorithmics")
+                # listing the courses does not change anything
+                self.assertListEqual(self.ch.linked_courses(), [])
+                self.assertTrue(os.path.exists("/BA2/Algorithmics/.moodle.Algorithms"))
+                self.assertEqual(index.course_by_path(os.path.abspath("/BA2/Algorithms"))[2], "100")
+
+                self.assertEqual([ c.name for c in self.ch.repair_courses() ], ["Algorithmics"])
+                self.assertEqual(index.course_by_path(os.path.abspath("/BA2/Algorithmics"))[2], "100")
+        finally:
+            components.teardown("CourseIndex")
+            index.close()
+
+    def test_removed_course_is_forgotten(self):
+        self.create_classic_epfl_hierarchy(semesters=["BA1"], course_gen=itertools.repeat(0))
+        self.create_course_tree("Algo", "BA1")
+        self.create_course_tree("Analysis", "BA1")
+        self.fs.get_object("/BA1/Algo").st_ino = 4242 # not set by this version of pyfakefs
+        self.fs.get_object("/BA1/Analysis").st_ino = 4243
+        index = CourseIndex(":memory:")
+        components.as_component(index, "CourseIndex")
+        try:
+            with self.ch:
+                algo, analysis = self.ch.get_course("Algo"), self.ch.get_course("Analysis")
+                self.ch.repair_courses()
+                self.assertIsNotNone(index.course_by_path(os.path.abspath("/BA1/Algo")))
+
+                # removed between the listing and the recording
+                self.fs.RemoveObject("/BA1/Algo")
+                self.ch._remember_locations([(algo, "100"), (analysis, "100")])
+                self.assertIsNone(index.course_by_path(os.path.abspath("/BA1/Algo")))
+                self.assertIsNotNone(index.course_by_path(os.path.abspath("/BA1/Analysis")))
+        finally:
+            components.teardown("CourseIndex")
+            index.close()
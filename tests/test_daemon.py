@@ -0,0 +1,90 @@
+import io
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+import contextlib
+
+import epflmanager.client as client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = """
+[directories]
+main_dir={main_dir}
+semester_directories=["BA1","BA2"]
+course_urls_file=site.url
+moodle_config_file=.moodle.{{course_name}}
+schedule_file=schedule.png
+index_file=
+
+[moodle]
+main_url=http://moodle.epfl.ch/
+course_url=%(main_url)scourse/view.php?id={{course_id}}
+cookie_file={tmp}/cookies
+"""
+
+class DaemonTest(unittest.TestCase):
+    """ Run a daemon in another process and talk to it like bin/epfl """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        main_dir = os.path.join(cls.tmp, "EPFL")
+        for d in ["BA1/Algebra", "BA2/Analysis", "BA2/Physics"]:
+            os.makedirs(os.path.join(main_dir, d))
+        cls.config = os.path.join(cls.tmp, "config.ini")
+        with open(cls.config, "w") as f:
+            f.write(CONFIG.format(main_dir=main_dir, tmp=cls.tmp))
+
+        cls.socket = os.path.join(cls.tmp, "epfl.sock")
+        env = dict(os.environ, EPFL_DAEMON_SOCKET=cls.socket, PYTHONPATH=ROOT)
+        cls.daemon = subprocess.Popen([sys.executable, os.path.join(ROOT, "bin", "epfl"),
+                                       "--config", cls.config, "daemon", "start"],
+                                      env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + 10
+        while client.request({"op": "status"}, cls.socket) is None:
+            if time.time() > deadline or cls.daemon.poll() is not None:
+                raise RuntimeError("The daemon did not start")
+            time.sleep(0.05)
+
+    @classmethod
+    def tearDownClass(cls):
+        client.request({"op": "shutdown"}, cls.socket)
+        cls.daemon.wait(10)
+        shutil.rmtree(cls.tmp)
+
+    def run_command(self, *argv):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            status = client.run(["--config", self.config] + list(argv), self.socket)
+        return status, out.getvalue()
+
+    def test_command_output_is_forwarded(self):
+        status, out = self.run_command("--semester", "BA2", "courses")
+        self.assertEqual(status, 0)
+        self.assertIn("Analysis", out)
+        self.assertIn("Physics", out)
+
+    def test_errors_are_forwarded(self):
+        status, out = self.run_command("--semester", "MA4", "courses")
+        self.assertIn("Semester not found", out)
+        status, out = self.run_command("nonexisting")
+        self.assertEqual(status, 2)
+        self.assertIn("invalid choice", out)
+
+    def test_local_commands_run_in_the_client(self):
+        self.assertIsNone(self.run_command("daemon", "status")[0])
+
+    def test_other_configuration_runs_in_the_client(self):
+        self.assertIsNone(client.run(["--config", "other.ini", "courses"], self.socket))
+
+    def test_no_daemon(self):
+        self.assertIsNone(client.run(["courses"], os.path.join(self.tmp, "missing.sock")))
+
+    def test_status(self):
+        status = client.request({"op": "status"}, self.socket)
+        self.assertEqual(status["pid"], self.daemon.pid)
@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from epflmanager.connections.downloader import Downloader, Download, DownloadError
+
+from server import LocalServer
+
+class DownloaderTest(unittest.TestCase):
+
+    CONTENT = bytes(range(256)) * 1000
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = LocalServer().__enter__()
+        self.server.files["/slides.pdf"] = (self.CONTENT, '"v1"')
+        self.downloader = Downloader(requests.session(), workers=2)
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        shutil.rmtree(self.directory)
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name), "rb") as f:
+            return f.read()
+
+    def interrupted_download(self):
+        """ Download the first part of the file only. Return the number of bytes received """
+        self.server.cut_after(200000)
+        with self.assertRaises(Exception):
+            self.downloader.download(Download(self.server.url("/slides.pdf"), self.directory))
+        self.server.cut_after(None)
+
+        received = os.path.getsize(os.path.join(self.directory, "slides.pdf.part"))
+        self.assertTrue(0 < received < len(self.CONTENT))
+        return received
+
+    def test_download_uses_the_server_filename(self):
+        path = self.downloader.download(Download(self.server.url("/slides.pdf"), self.directory))
+        self.assertEqual(path, os.path.join(self.directory, "slides.pdf"))
+        self.assertEqual(self.read("slides.pdf"), self.CONTENT)
+
+    def test_finished_download_leaves_no_partial_file(self):
+        self.downloader.download(Download(self.server.url("/slides.pdf"), self.directory))
+        self.assertListEqual(os.listdir(self.directory), ["slides.pdf"])
+
+    def test_missing_resource_raises_an_error(self):
+        with self.assertRaises(DownloadError):
+            self.downloader.download(Download(self.server.url("/nothing.pdf"), self.directory))
+
+    def test_download_all_reports_every_download(self):
+        self.server.files["/exercises.pdf"] = (b"exercises", '"e1"')
+        downloads = [ Download(self.server.url(p), self.directory) for p in ["/slides.pdf", "/exercises.pdf", "/nothing.pdf"] ]
+        results = { d.url: e for d, e in self.downloader.download_all(downloads) }
+        self.assertIsNone(results[self.server.url("/slides.pdf")])
+        self.assertIsNone(results[self.server.url("/exercises.pdf")])
+        self.assertIsInstance(results[self.server.url("/nothing.pdf")], DownloadError)
+
+    def test_download_all_gives_unique_names_in_a_directory(self):
+        self.server.files["/week1/slides.pdf"] = (b"week 1", '"w1"')
+        self.server.files["/week2/slides.pdf"] = (b"week 2", '"w2"')
+        downloads = [ Download(self.server.url(p), self.directory) for p in ["/week1/slides.pdf", "/week2/slides.pdf"] ]
+        for download, error in self.downloader.download_all(downloads):
+            self.assertIsNone(error)
+
+        self.assertListEqual(sorted(os.listdir(self.directory)), ["slides (2).pdf", "slides.pdf"])
+        self.assertSetEqual({ self.read("slides.pdf"), self.read("slides (2).pdf") }, { b"week 1", b"week 2" })
+
+    def test_download_all_fetches_a_url_once(self):
+        downloads = [ Download(self.server.url("/slides.pdf"), self.directory) for _ in range(2) ]
+        results = list(self.downloader.download_all(downloads))
+
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(d.path == os.path.join(self.directory, "slides.pdf") and e is None for d, e in results))
+        self.assertEqual(len([ r for r in self.server.requests if r[0] == "GET" ]), 1)
+
+    def test_files_already_there_are_not_overwritten(self):
+        with open(os.path.join(self.directory, "slides.pdf"), "wb") as f:
+            f.write(b"another resource")
+        path = self.downloader.download(Download(self.server.url("/slides.pdf"), self.directory))
+
+        self.assertEqual(path, os.path.join(self.directory, "slides (2).pdf"))
+        self.assertEqual(self.read("slides.pdf"), b"another resource")
+        self.assertEqual(self.read("slides (2).pdf"), self.CONTENT)
+
+    def test_previous_version_is_replaced(self):
+        previous = os.path.join(self.directory, "slides.pdf")
+        with open(previous, "wb") as f:
+            f.write(b"previous version")
+        path = self.downloader.download(Download(self.server.url("/slides.pdf"), self.directory, replaces=previous))
+
+        self.assertEqual(path, previous)
+        self.assertEqual(self.read("slides.pdf"), self.CONTENT)
+
+    def test_interrupted_download_is_resumed(self):
+        received = self.interrupted_download()
+        self.downloader.download(Download(self.server.url("/slides.pdf"), self.directory))
+
+        self.assertEqual(self.read("slides.pdf"), self.CONTENT)
+        method, path, headers = self.server.requests[-1]
+        self.assertEqual(headers.get("Range"), "bytes=%d-" % received)
+
+    def test_download_starts_over_if_the_file_changed(self):
+        self.interrupted_download()
+        new_content = b"new version"
+        self.server.files["/slides.pdf"] = (new_content, '"v2"')
+        self.downloader.download(Download(self.server.url("/slides.pdf"), self.directory))
+
+        self.assertEqual(self.read("slides.pdf"), new_content)
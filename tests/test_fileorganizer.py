@@ -1,10 +1,12 @@
 import unittest
 import os
+from unittest import mock
 from functools import reduce
 
 import pyfakefs.fake_filesystem_unittest as fakefs
 
 from epflmanager.io.fileorganizer import Directory, Path
+import epflmanager.io.fileorganizer as fileorganizer
 import epflmanager.components as components
 
 from components import setup_console
@@ -139,6 +141,28 @@ class FileOrganizerTest(fakefs.TestCase):
             self.assertTrue(d.exists())
             self.assertTrue(d.is_dir())
 
+    def test_same_parent_and_name_give_the_same_path(self):
+        root_path = Directory(self.root)(".")
+        d = Directory(root_path)("test")
+        self.assertIs(d, Directory(root_path)("test"))
+        self.assertIsNot(d, Path(root_path)("test"))
+        self.assertEqual(hash(d), hash(Path(self.root)("test")))
+
+    def test_other_spellings_of_a_location_keep_their_path(self):
+        d = Directory(Directory(self.root)("."))("test")
+        other = Directory(self.root)("test")
+        self.assertIsNot(d, other)
+        self.assertEqual(d, other)
+        self.assertEqual(d.fullpath(), os.path.join(self.root, ".", "test"))
+        self.assertEqual(other.fullpath(), os.path.join(self.root, "test"))
+        self.assertEqual(other.parent, self.root)
+
+    def test_relative_paths_are_not_interned(self):
+        self.assertIsNot(Directory("relative")("test"), Directory("relative")("test"))
+
+    def test_paths_have_no_dict(self):
+        self.assertFalse(hasattr(Directory(self.root)("test"), "__dict__"))
+
     def test_split_parent_on_root_path(self):
         res = Path.split_parent(self.root)
         expected = (self.root, "")
@@ -232,3 +256,36 @@ class FileOrganizerTest(fakefs.TestCase):
             self.assertFalse(os.path.exists(dirname))
             self.assertFalse(root.create_directory_if_not_exists(dirname))
             self.assertFalse(os.path.exists(dirname))
+
+    def test_dirs_lists_only_directories(self):
+        root = self.create_basic_filesystem()
+        names = { d.name for d in Directory(root)("Dir1").dirs() }
+        self.assertSetEqual(names, {"EmptyDir"})
+
+    def test_snapshot_gives_the_type_of_the_entries(self):
+        root = self.create_basic_filesystem()
+        snapshot = Directory(root)("Dir1").snapshot()
+        self.assertListEqual([e.name for e in snapshot.dirs()], ["EmptyDir"])
+        self.assertSetEqual({e.name for e in snapshot.files()},
+                            {"File1", "EmptyFile", ".hiddenFile", "File with spaces"})
+        self.assertIsNone(snapshot.get("FileXXXX"))
+
+    def test_scanned_dirs_answer_without_the_filesystem(self):
+        root = self.create_basic_filesystem()
+        dir2 = [ d for d in root.dirs() if d.name == "Dir2" ][0]
+        # the type is the one seen by the scan: no more stat or scandir
+        touched = AssertionError("the filesystem was used")
+        with mock.patch.object(fileorganizer.os, "stat", side_effect=touched), \
+             mock.patch.object(fileorganizer.os, "scandir", side_effect=touched), \
+             mock.patch.object(fileorganizer.os.path, "isdir", side_effect=touched), \
+             mock.patch.object(fileorganizer.os.path, "isfile", side_effect=touched):
+            self.assertTrue(dir2.as_class(Directory).is_dir())
+            self.assertFalse(dir2.is_file())
+
+    def test_deleted_paths_do_not_exist(self):
+        root = self.create_basic_filesystem()
+        dir2 = [ d for d in root.dirs() if d.name == "Dir2" ][0]
+        os.rmdir("Dir2")
+        self.assertFalse(dir2.exists())
+        # the type seen by the scan is forgotten
+        self.assertFalse(dir2.is_dir())
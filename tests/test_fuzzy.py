@@ -0,0 +1,59 @@
+import unittest
+
+from epflmanager.fuzzy import FuzzyIndex, clear_winner, similarity, match_names
+
+NAMES = ["Algorithms", "Advanced Algorithms", "Algebra", "Linear Algebra", "Analysis I",
+         "Computer Architecture", "ProbabilityAndStatistics", "Physics"]
+
+class FuzzyIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = FuzzyIndex((name, name) for name in NAMES)
+
+    def names(self, query):
+        return [ key for _, key in self.index.search(query) ]
+
+    def test_exact_then_prefix_then_word(self):
+        self.assertListEqual(self.names("algebra"), ["Algebra", "Linear Algebra"])
+        self.assertListEqual(self.names("alg")[2:], ["Linear Algebra", "Advanced Algorithms"])
+
+    def test_case_does_not_matter(self):
+        self.assertListEqual(self.names("PHYS"), ["Physics"])
+
+    def test_subsequence_favours_starts_of_words(self):
+        self.assertEqual(self.names("aa")[0], "Advanced Algorithms")
+        self.assertEqual(self.names("pas")[0], "ProbabilityAndStatistics")
+        self.assertEqual(self.names("ca")[0], "Computer Architecture")
+
+    def test_typos(self):
+        self.assertEqual(self.names("algoritms")[0], "Algorithms")
+
+    def test_no_match(self):
+        self.assertListEqual(self.names("xyz"), [])
+
+    def test_incremental_updates(self):
+        self.index.remove("Physics")
+        self.assertListEqual(self.names("phys"), [])
+        self.index.add("Physics II", "Physics II")
+        self.assertListEqual(self.names("phys"), ["Physics II"])
+        self.assertEqual(len(self.index), len(NAMES))
+
+    def test_clear_winner(self):
+        self.assertEqual(clear_winner(self.index.search("phys")), "Physics")
+        self.assertEqual(clear_winner(self.index.search("algebra")), "Algebra")
+        self.assertIsNone(clear_winner(self.index.search("alg")))
+        self.assertIsNone(clear_winner([]))
+
+class NameMatchingTest(unittest.TestCase):
+
+    def test_similarity_ignores_codes_case_and_accents(self):
+        self.assertGreater(similarity("ProbabilityAndStatistics", "MATH-232 Probability and statistics"), 0.9)
+        self.assertGreater(similarity("Electromagnetisme", "PHYS-202 Électromagnétisme"), 0.9)
+        self.assertLess(similarity("Compilers", "Computer networks"), 0.5)
+
+    def test_match_names_pairs_each_title_once(self):
+        matches = match_names(["Algorithms", "AdvancedAlgorithms", "Compilers"],
+                              ["CS-250 Algorithms", "CS-450 Advanced algorithms", "COM-208 Computer networks"])
+        self.assertDictEqual({ name: title for name, (_, title) in matches.items() },
+                             { "Algorithms": "CS-250 Algorithms",
+                               "AdvancedAlgorithms": "CS-450 Advanced algorithms" })
@@ -0,0 +1,104 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from epflmanager.connections.httpcache import HTTPCache
+
+from server import LocalServer
+
+class CountingParser(object):
+    """ Parser that remembers how many times it was called """
+    def __init__(self):
+        self.__name__ = "counting_parser"
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return text.upper()
+
+class LowerParser(CountingParser):
+    """ Another parser with the same name """
+    def __call__(self, text):
+        self.calls += 1
+        return text.lower()
+
+class HTTPCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = LocalServer().__enter__()
+        self.server.files["/course"] = (b"course page", '"v1"')
+        self.session = requests.session()
+        self.parser = CountingParser()
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        shutil.rmtree(self.directory)
+
+    def fetch(self, cache):
+        return cache.fetch(self.session, self.server.url("/course"), self.parser)
+
+    def test_fresh_entry_is_served_without_request(self):
+        cache = HTTPCache(self.directory, ttl=60)
+        self.assertEqual(self.fetch(cache), "COURSE PAGE")
+        self.assertEqual(self.fetch(cache), "COURSE PAGE")
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.parser.calls, 1)
+
+    def test_unchanged_page_is_revalidated_and_not_parsed(self):
+        cache = HTTPCache(self.directory, ttl=0)
+        self.fetch(cache)
+        self.assertEqual(self.fetch(cache), "COURSE PAGE")
+
+        method, path, headers = self.server.requests[-1]
+        self.assertEqual(headers.get("If-None-Match"), '"v1"')
+        self.assertEqual(self.parser.calls, 1)
+
+    def test_changed_page_is_parsed_again(self):
+        cache = HTTPCache(self.directory, ttl=0)
+        self.fetch(cache)
+        self.server.files["/course"] = (b"new page", '"v2"')
+        self.assertEqual(self.fetch(cache), "NEW PAGE")
+        self.assertEqual(self.parser.calls, 2)
+
+    def test_entries_survive_a_new_cache_instance(self):
+        self.fetch(HTTPCache(self.directory, ttl=60))
+        self.fetch(HTTPCache(self.directory, ttl=60))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_errors_are_not_cached(self):
+        cache = HTTPCache(self.directory, ttl=60)
+        cache.fetch(self.session, self.server.url("/nothing"), self.parser)
+        self.assertListEqual(os.listdir(self.directory) if os.path.isdir(self.directory) else [], [])
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.server.files["/other"] = (b"x" * 1000, '"o1"')
+        cache = HTTPCache(self.directory, ttl=60, max_size=1500)
+        self.fetch(cache)
+        old = time.time() - 100
+        for name in os.listdir(self.directory):
+            os.utime(os.path.join(self.directory, name), (old, old))
+
+        cache.fetch(self.session, self.server.url("/other"), self.parser)
+        self.fetch(cache)
+        self.assertEqual(len([r for r in self.server.requests if r[1] == "/course"]), 2)
+
+    def test_parsers_with_the_same_name_keep_their_results(self):
+        cache = HTTPCache(self.directory, ttl=60)
+        lower = LowerParser()
+        self.assertEqual(self.fetch(cache), "COURSE PAGE")
+        self.assertEqual(cache.fetch(self.session, self.server.url("/course"), lower), "course page")
+        self.assertEqual(self.fetch(cache), "COURSE PAGE")
+        self.assertEqual((self.parser.calls, lower.calls), (1, 1))
+
+    def test_new_version_of_a_parser_parses_again(self):
+        cache = HTTPCache(self.directory, ttl=60)
+        self.fetch(cache)
+        self.parser.version = 2
+        self.fetch(cache)
+        self.assertEqual(self.parser.calls, 2)
+        self.assertEqual(len(self.server.requests), 1)
@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+
+from epflmanager.index import CourseIndex
+
+class CourseIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "EPFL")
+        for d in ["BA1/Algebra", "BA1/Analysis", "BA2/Physics"]:
+            os.makedirs(os.path.join(self.root, d))
+        self.moodle_file = os.path.join(self.root, "BA1", "Algebra", ".moodle.Algebra")
+        self.write(self.moodle_file, "[course]\ncourse_name = Algebra\nmoodle_id = 42\n")
+        self.index = CourseIndex(os.path.join(self.tmp.name, "index.sqlite"))
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def write(self, path, content):
+        with open(path, "w") as f:
+            f.write(content)
+
+    def age(self, path, seconds=10):
+        """ Set the modification time of a path in the past, so that it is
+        not racy anymore """
+        t = os.stat(path).st_mtime - seconds
+        os.utime(path, (t, t))
+
+    def test_subdirs(self):
+        self.assertListEqual(self.index.subdirs(self.root), ["BA1", "BA2"])
+        self.assertListEqual(self.index.subdirs(os.path.join(self.root, "BA1")), ["Algebra", "Analysis"])
+
+    def test_unchanged_directory_is_not_listed_again(self):
+        self.age(self.root)
+        self.index.subdirs(self.root)
+        # a change that does not touch the mtime is not seen
+        mtime = os.stat(self.root).st_mtime_ns
+        os.mkdir(os.path.join(self.root, "MA1"))
+        os.utime(self.root, ns=(mtime, mtime))
+        self.assertListEqual(self.index.subdirs(self.root), ["BA1", "BA2"])
+
+    def test_modified_directory_is_listed_again(self):
+        self.age(self.root)
+        self.index.subdirs(self.root)
+        os.mkdir(os.path.join(self.root, "MA1"))
+        self.assertListEqual(self.index.subdirs(self.root), ["BA1", "BA2", "MA1"])
+
+    def test_racy_directory_is_listed_again(self):
+        self.index.subdirs(self.root)
+        os.rmdir(os.path.join(self.root, "BA2", "Physics"))
+        os.rmdir(os.path.join(self.root, "BA2"))
+        self.assertListEqual(self.index.subdirs(self.root), ["BA1"])
+
+    def test_moodle_id(self):
+        self.assertEqual(self.index.moodle_id(self.moodle_file), "42")
+        self.assertIsNone(self.index.moodle_id(os.path.join(self.root, "BA2", "Physics", ".moodle.Physics")))
+
+    def test_moodle_id_follows_the_file(self):
+        self.age(self.moodle_file)
+        self.assertEqual(self.index.moodle_id(self.moodle_file), "42")
+        self.write(self.moodle_file, "[course]\ncourse_name = Algebra\nmoodle_id = 43\n")
+        self.assertEqual(self.index.moodle_id(self.moodle_file), "43")
+        os.remove(self.moodle_file)
+        self.assertIsNone(self.index.moodle_id(self.moodle_file))
+
+    def test_course_urls(self):
+        urls_file = os.path.join(self.root, "BA1", "Algebra", "site.url")
+        self.assertIsNone(self.index.course_urls(urls_file))
+        self.write(urls_file, "http://example.com Example\nhttp://epfl.ch\n")
+        self.age(urls_file)
+        expected = [("http://example.com", "Example"), ("http://epfl.ch", "Default")]
+        self.assertListEqual(self.index.course_urls(urls_file), expected)
+        self.assertListEqual(self.index.course_urls(urls_file), expected)
+
+    def test_index_persists_between_runs(self):
+        self.age(self.root)
+        self.index.subdirs(self.root)
+        self.index.close()
+        self.index = CourseIndex(os.path.join(self.tmp.name, "index.sqlite"))
+        self.assertTrue(self.index._is_fresh("directories", self.root, os.stat(self.root).st_mtime_ns))
+
+    def test_corrupted_index_is_rebuilt(self):
+        self.index.close()
+        self.write(os.path.join(self.tmp.name, "index.sqlite"), "garbage" * 1000)
+        self.index = CourseIndex(os.path.join(self.tmp.name, "index.sqlite"))
+        self.assertListEqual(self.index.subdirs(self.root), ["BA1", "BA2"])
+
+    def test_course_locations(self):
+        algebra = os.path.join(self.root, "BA1", "Algebra")
+        st = os.stat(algebra)
+        self.index.remember_course(algebra, st.st_dev, st.st_ino, 42)
+        self.assertEqual(self.index.course_by_file(st.st_dev, st.st_ino), (algebra, "42"))
+        self.assertEqual(self.index.course_by_path(algebra), (st.st_dev, st.st_ino, "42"))
+
+        # the same directory, renamed
+        renamed = os.path.join(self.root, "BA1", "Linear Algebra")
+        os.rename(algebra, renamed)
+        self.index.remember_course(renamed, st.st_dev, st.st_ino, 42)
+        self.assertEqual(self.index.course_by_file(st.st_dev, st.st_ino), (renamed, "42"))
+        self.assertIsNone(self.index.course_by_path(algebra))
+
+        self.index.forget_course(renamed)
+        self.assertIsNone(self.index.course_by_file(st.st_dev, st.st_ino))
@@ -0,0 +1,186 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+import pyfakefs.fake_filesystem_unittest as fakefs
+
+from epflmanager.manifest import Manifest, Resource
+from epflmanager.parsers import moodle_file_parser
+from epflmanager.sync import Synchronizer, Change
+from epflmanager.connections.downloader import Downloader
+from epflmanager.store import BlobStore
+import epflmanager.components as components
+
+from components import initialize_components
+from server import LocalServer
+
+def resource_link(moodle_id, text):
+    return { "href": "http://moodle.epfl.ch/mod/resource/view.php?id=%d" % moodle_id, "text": text }
+
+class FakeMoodle(object):
+    """ Only knows the resources of the courses it was given """
+    def __init__(self, resources):
+        self.resources = resources
+        self.fetched = []
+
+    def course_resources(self, course_id):
+        self.fetched.append(course_id)
+        return self.resources
+
+class ManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.manifest = Manifest(moodle_file_parser("[course]\ncourse_name = Algo\nmoodle_id = 100"))
+        self.resource = Resource(914285, "Week 1", "Solutions to Problems", "Moodle/Week 1/sol.pdf", 42, "abc")
+
+    def test_empty_manifest_has_no_resources(self):
+        self.assertListEqual(self.manifest.resources(), [])
+
+    def test_added_resource_can_be_retrieved(self):
+        self.manifest.add(self.resource)
+        self.assertIn(914285, self.manifest)
+        self.assertEqual(self.manifest.get(914285), self.resource)
+        self.assertListEqual(self.manifest.resources(), [self.resource])
+
+    def test_get_returns_None_for_unknown_resource(self):
+        self.assertIsNone(self.manifest.get(1))
+
+    def test_find_resource_by_section_and_name(self):
+        self.manifest.add(self.resource)
+        self.assertListEqual(self.manifest.find("Week 1", "Solutions to Problems"), [self.resource])
+        self.assertListEqual(self.manifest.find("Week 2", "Solutions to Problems"), [])
+
+    def test_remove_resource(self):
+        self.manifest.add(self.resource)
+        self.manifest.remove(914285)
+        self.assertNotIn(914285, self.manifest)
+
+    def test_course_section_is_kept(self):
+        self.manifest.add(self.resource)
+        self.assertEqual(self.manifest.config["course"]["moodle_id"], "100")
+
+    def test_names_with_percent_are_accepted(self):
+        self.resource.name = "100% exam"
+        self.manifest.add(self.resource)
+        self.assertEqual(self.manifest.get(914285).name, "100% exam")
+
+class SynchronizerTest(fakefs.TestCase):
+
+    def setUp(self):
+        initialize_components()
+        self.ch = components.get("CourseHandler")
+        self.setUpPyfakefs()
+        os.makedirs("/BA1/Algo")
+        self.fs.CreateFile("/BA1/Algo/.moodle.Algo", contents="[course]\ncourse_name = Algo\nmoodle_id = 100")
+        self.fs.CreateFile("/BA1/Algo/Moodle/Week 1/sol.pdf", contents="x"*42)
+
+    def changes(self, resources, known=()):
+        with self.ch:
+            course = self.ch.get_course("Algo")
+            manifest = course.read_manifest()
+            for r in known:
+                manifest.add(r)
+            return Synchronizer(FakeMoodle(resources)).changes(course, manifest)
+
+    def test_new_resources_are_detected(self):
+        changes = self.changes([{ "name": "Week 1", "links": [resource_link(1, "Slides")] }])
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0].kind, Change.NEW)
+        self.assertEqual(changes[0].moodle_id, 1)
+
+    def test_links_that_are_not_resources_are_ignored(self):
+        links = [{ "href": "http://moodle.epfl.ch/mod/forum/view.php?id=3", "text": "Forum" }]
+        self.assertListEqual(self.changes([{ "name": "General", "links": links }]), [])
+
+    def test_known_resources_are_not_transferred(self):
+        known = Resource(914285, "Week 1", "Sol", "Moodle/Week 1/sol.pdf", 42, "abc")
+        changes = self.changes([{ "name": "Week 1", "links": [resource_link(914285, "Sol")] }], [known])
+        self.assertListEqual(changes, [])
+
+    def test_resource_with_new_id_is_an_update(self):
+        known = Resource(914285, "Week 1", "Sol", "Moodle/Week 1/sol.pdf", 42, "abc")
+        changes = self.changes([{ "name": "Week 1", "links": [resource_link(915248, "Sol")] }], [known])
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0].kind, Change.UPDATED)
+        self.assertListEqual(changes[0].previous, [known])
+
+    def test_deleted_local_file_is_transferred_again(self):
+        known = Resource(7, "Week 1", "Gone", "Moodle/Week 1/gone.pdf", 42, "abc")
+        changes = self.changes([{ "name": "Week 1", "links": [resource_link(7, "Gone")] }], [known])
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0].kind, Change.MISSING)
+
+class SyncTest(unittest.TestCase):
+    """ Synchronization of a course with files served by a local server """
+
+    def setUp(self):
+        initialize_components()
+        self.directory = tempfile.mkdtemp()
+        config = components.get("Config")
+        self.main_dir = config["directories"]["main_dir"]
+        config["directories"]["main_dir"] = self.directory
+        self.ch = components.get("CourseHandler")
+        self.ch._init()
+        os.makedirs(os.path.join(self.directory, "BA1", "Algo"))
+        with open(os.path.join(self.directory, "BA1", "Algo", ".moodle.Algo"), "w") as f:
+            f.write("[course]\ncourse_name = Algo\nmoodle_id = 100\n")
+        self.course = self.ch.get_course("Algo")
+
+        self.server = LocalServer().__enter__()
+        self.server.files["/1/sheet.pdf"] = (b"sheet of week 1", '"s1"')
+        self.server.files["/2/sheet.pdf"] = (b"sheet of week 2", '"s2"')
+        self.moodle = FakeMoodle([])
+        self.moodle.downloader = Downloader(requests.session())
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+        components.get("Config")["directories"]["main_dir"] = self.main_dir
+        self.ch._init()
+        shutil.rmtree(self.directory)
+
+    def sync(self, *ids, store=None):
+        links = [ dict(resource_link(i, "Sheet %d" % i), download=self.server.url("/%d/sheet.pdf" % i)) for i in ids ]
+        results = Synchronizer(self.moodle, store).sync(self.course, [{ "name": "Week", "links": links }])
+        self.assertTrue(all(error is None for _, error in results))
+        return sorted((change.moodle_id, change.kind) for change, _ in results)
+
+    def read(self, moodle_id):
+        resource = self.course.read_manifest().get(moodle_id)
+        with open(os.path.join(self.course.fullpath(), resource.path), "rb") as f:
+            return f.read()
+
+    def test_resources_with_the_same_filename_keep_their_files(self):
+        self.assertListEqual(self.sync(1), [(1, Change.NEW)])
+        self.assertListEqual(self.sync(1, 2), [(2, Change.NEW)])
+
+        self.assertEqual(self.read(1), b"sheet of week 1")
+        self.assertEqual(self.read(2), b"sheet of week 2")
+        # nothing is transferred back and forth
+        self.assertListEqual(self.sync(1, 2), [])
+
+    def test_file_of_a_missing_resource_is_not_taken(self):
+        self.sync(1)
+        os.remove(os.path.join(self.course.fullpath(), self.course.read_manifest().get(1).path))
+        # not listed by Moodle for a while
+        self.assertListEqual(self.sync(2), [(2, Change.NEW)])
+        self.assertListEqual(self.sync(1, 2), [(1, Change.MISSING)])
+
+        self.assertEqual(self.course.read_manifest().get(1).path, os.path.join("Moodle", "Week", "sheet.pdf"))
+        self.assertEqual(self.read(1), b"sheet of week 1")
+        self.assertEqual(self.read(2), b"sheet of week 2")
+
+    def test_stored_content_does_not_take_the_file_of_a_resource(self):
+        store = BlobStore(os.path.join(self.directory, ".store"))
+        self.sync(1, store=store)
+        # the content of the resource 2 was stored for another course
+        other = os.path.join(self.directory, "sheet.pdf")
+        with open(other, "wb") as f:
+            f.write(b"sheet of week 2")
+        store.record(2, 200, "Week", "Sheet 2", store.add(other), "sheet.pdf")
+
+        self.assertListEqual(self.sync(1, 2, store=store), [(2, Change.NEW)])
+        self.assertEqual(self.course.read_manifest().get(2).path, os.path.join("Moodle", "Week", "sheet (2).pdf"))
+        self.assertEqual(self.read(1), b"sheet of week 1")
+        self.assertEqual(self.read(2), b"sheet of week 2")
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+
+from epflmanager.metadata import MetadataCache
+
+class MetadataCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.moodle_file = os.path.join(self.tmp.name, ".moodle.Analysis")
+        self.urls_file = os.path.join(self.tmp.name, "site.url")
+        self.write(self.moodle_file, "[course]\ncourse_name = Analysis\nmoodle_id = 42\n")
+        self.write(self.urls_file, "http://example.com Example\nhttp://epfl.ch\n")
+        self.cache = MetadataCache()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, path, content, age=10):
+        with open(path, "w") as f:
+            f.write(content)
+        t = os.stat(path).st_mtime - age
+        os.utime(path, (t, t))
+
+    def test_files_are_parsed_once(self):
+        for _ in range(3):
+            self.assertEqual(self.cache.moodle_id(self.moodle_file), "42")
+            self.assertListEqual(self.cache.course_urls(self.urls_file),
+                                 [("http://example.com", "Example"), ("http://epfl.ch", "Default")])
+        self.assertEqual((self.cache.hits, self.cache.misses), (4, 2))
+
+    def test_missing_file(self):
+        path = os.path.join(self.tmp.name, "nothing")
+        self.assertIsNone(self.cache.moodle_id(path))
+        self.assertIsNone(self.cache.course_urls(path))
+
+    def test_changed_file_is_parsed_again(self):
+        self.cache.moodle_id(self.moodle_file)
+        # same size, other modification time
+        self.write(self.moodle_file, "[course]\ncourse_name = Analysis\nmoodle_id = 43\n", age=5)
+        self.assertEqual(self.cache.moodle_id(self.moodle_file), "43")
+
+    def test_recently_modified_file_is_not_trusted(self):
+        self.write(self.moodle_file, "[course]\nmoodle_id = 7\n", age=0)
+        self.cache.moodle_id(self.moodle_file)
+        self.assertEqual(self.cache.moodle_id(self.moodle_file), "7")
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_invalidate(self):
+        self.cache.moodle_id(self.moodle_file)
+        self.cache.invalidate(self.moodle_file)
+        self.cache.moodle_id(self.moodle_file)
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_generation_changes_with_the_moodle_ids(self):
+        self.cache.moodle_id(self.moodle_file)
+        generation = self.cache.generation
+        self.write(self.moodle_file, "[course]\ncourse_name = Analysis\nmoodle_id = 42\n", age=5)
+        self.cache.moodle_id(self.moodle_file)
+        self.assertEqual(self.cache.generation, generation)
+
+        self.write(self.moodle_file, "[course]\ncourse_name = Analysis\nmoodle_id = 43\n", age=2)
+        self.cache.moodle_id(self.moodle_file)
+        self.assertNotEqual(self.cache.generation, generation)
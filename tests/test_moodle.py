@@ -0,0 +1,367 @@
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+import epflmanager.components as components
+import epflmanager.metadata as metadata
+from epflmanager.connections.moodle import Moodle, IMPORTANT_COOKIES
+from epflmanager.connections.session import AuthenticationFailed, CredentialsUnavailable
+import epflmanager.cli as cli
+from epflmanager.commands.coursemanagement import CourseCommands
+
+from components import initialize_components
+from server import LocalServer, FileHandler
+
+COURSE_PAGE = """<html><body><ul>
+<li class="section"><div class="content"><h3 class="sectionname">Week %(n)d</h3>
+<ul><li><a href="/mod/resource/view.php?id=%(n)d01">Slides %(n)d</a></li></ul></div></li>
+</ul></body></html>"""
+
+class MoodleTestCase(unittest.TestCase):
+    """ The Moodle component against a local server, configured through the
+    Config component (restored after every test) """
+    backend = Moodle
+    handler = FileHandler
+    options = {} # more options of the moodle section
+
+    def setUp(self):
+        initialize_components()
+        self.directory = tempfile.mkdtemp()
+        self.server = LocalServer(self.handler).__enter__()
+        for n in range(1, 9):
+            self.server.files["/course/%d" % n] = ((COURSE_PAGE % { "n": n }).encode("utf-8"), '"c%d"' % n)
+
+        config = components.get("Config")
+        self.saved = { option: config["moodle"].get(option, raw=True) for option in config["moodle"] }
+        config["moodle"]["main_url"] = self.server.url("")
+        config["moodle"]["course_url"] = self.server.url("/course/{course_id}")
+        config["moodle"]["cookie_file"] = os.path.join(self.directory, "moodle.cookies")
+        config["moodle"]["cache_dir"] = os.path.join(self.directory, "cache")
+        config["moodle"]["listing_workers"] = "4"
+        config.read_dict({ "moodle": self.options })
+        self.moodle = self.backend()
+
+    def tearDown(self):
+        components.teardown("Moodle")
+        config = components.get("Config")
+        for option in list(config["moodle"]):
+            config.remove_option("moodle", option)
+        config.read_dict({ "moodle": self.saved })
+        self.server.__exit__(None, None, None)
+        shutil.rmtree(self.directory)
+
+class MoodleTest(MoodleTestCase):
+
+    def test_courses_resources_fetches_the_courses_concurrently(self):
+        self.server.delay(0.05)
+        results = list(self.moodle.courses_resources(range(1, 9)))
+
+        self.assertSetEqual({ course_id for course_id, _, _ in results }, set(range(1, 9)))
+        self.assertTrue(all(error is None for _, _, error in results))
+        resources = { course_id: r for course_id, r, _ in results }
+        self.assertEqual(resources[3][0]["name"], "Week 3")
+        self.assertTrue(1 < self.server.max_in_flight <= 4)
+
+    def test_courses_resources_reports_errors_per_course(self):
+        self.server.files["/course/2"] = None
+        results = { course_id: (r, e) for course_id, r, e in self.moodle.courses_resources([1, 2, 3]) }
+
+        self.assertIsNone(results[2][0])
+        self.assertIsNotNone(results[2][1])
+        self.assertIsNone(results[1][1])
+        self.assertIsNone(results[3][1])
+
+    def test_courses_resources_without_courses(self):
+        self.assertListEqual(list(self.moodle.courses_resources([])), [])
+
+    def test_each_command_fetches_the_answers_again(self):
+        cookies = requests.cookies.RequestsCookieJar()
+        for name in IMPORTANT_COOKIES:
+            cookies.set(name, "x")
+        self.moodle._cookies = cookies
+        self.moodle._issued = time.time()
+        self.moodle._cache.ttl = 0
+        self.assertEqual(self.moodle.course_resources(1)[0]["name"], "Week 1")
+
+        self.server.files["/course/1"] = ((COURSE_PAGE % { "n": 10 }).encode("utf-8"), '"c10"')
+        # kept during a command
+        self.assertEqual(self.moodle.course_resources(1)[0]["name"], "Week 1")
+        # the next command (in the daemon) sees the change
+        self.moodle.connect()
+        self.assertEqual(self.moodle.course_resources(1)[0]["name"], "Week 10")
+
+class ExpiredSessionHandler(FileHandler):
+    """ Moodle when the session expired: every page redirects to the login page """
+    def do_GET(self, body=True):
+        if self.path.startswith("/course/"):
+            self.server.requests.append(("GET", self.path, dict(self.headers)))
+            self.send_response(303)
+            self.send_header("Location", "/login/index.php")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        super().do_GET(body)
+
+class ExpiredSessionTest(MoodleTestCase):
+    """ Sessions past their lifetime, with the default credentials (asked
+    to the user) """
+    handler = ExpiredSessionHandler
+
+    def setUp(self):
+        super().setUp()
+        cookies = requests.cookies.RequestsCookieJar()
+        for name in IMPORTANT_COOKIES:
+            cookies.set(name, "x")
+        self.moodle._cookies = cookies
+        self.moodle.authentication_process = mock.Mock()
+
+    def test_expired_session_is_authenticated_again(self):
+        self.moodle._issued = time.time() - 5 * 3600
+        self.moodle.connect()
+        self.moodle.authentication_process.assert_called_once_with()
+
+        self.moodle.authentication_process.reset_mock()
+        self.moodle._issued = time.time()
+        self.moodle.connect()
+        self.moodle.authentication_process.assert_not_called()
+
+    def test_redirection_to_the_login_page_is_an_error(self):
+        self.moodle._issued = time.time()
+        self.moodle.connect()
+        with self.assertRaises(AuthenticationFailed):
+            self.moodle.course_resources(1)
+
+        # the next command authenticates again
+        self.moodle.connect()
+        self.moodle.authentication_process.assert_called_once_with()
+
+class SessionRefreshTest(MoodleTestCase):
+    """ Renewal of the session in the background, with credentials that do
+    not need the user """
+    options = { "credentials": "env", "session_lifetime": "3600", "session_refresh_margin": "600" }
+
+    def fail_with(self, error):
+        def authentication_process():
+            raise error
+        self.moodle.authentication_process = authentication_process
+
+    def test_renewal_is_scheduled_before_the_expiry(self):
+        self.moodle._issued = time.time()
+        self.moodle.schedule_refresh()
+        self.assertAlmostEqual(self.moodle._refresh_timer.interval, 3000, delta=5)
+
+    def test_delay_has_a_lower_bound(self):
+        self.moodle._issued = time.time() - 3600 # expired
+        self.moodle.schedule_refresh()
+        self.assertEqual(self.moodle._refresh_timer.interval, Moodle.MIN_REFRESH_DELAY)
+
+        self.moodle._issued = None
+        self.moodle.schedule_refresh()
+        self.assertEqual(self.moodle._refresh_timer.interval, Moodle.MIN_REFRESH_DELAY)
+
+    def test_refused_credentials_are_not_tried_again(self):
+        for error in [AuthenticationFailed("refused"), CredentialsUnavailable("no password")]:
+            self.moodle.schedule_refresh()
+            self.fail_with(error)
+            self.moodle._refresh()
+            self.assertIsNone(self.moodle._refresh_timer)
+
+    def test_other_failures_are_tried_again_later_and_later(self):
+        self.fail_with(requests.ConnectionError("no network"))
+        delays = []
+        for _ in range(8):
+            self.moodle._refresh()
+            delays.append(self.moodle._refresh_timer.interval)
+        self.assertListEqual(delays, [60, 120, 240, 480, 960, 1920, 3600, 3600])
+
+        # a success starts again from the expiry of the new session
+        def authentication_process():
+            self.moodle._issued = time.time()
+        self.moodle.authentication_process = authentication_process
+        self.moodle._refresh()
+        self.assertAlmostEqual(self.moodle._refresh_timer.interval, 3000, delta=5)
+        self.assertEqual(self.moodle._refresh_failures, 0)
+
+    def test_renewal_only_writes_to_the_log(self):
+        messages = []
+        with components.get("Console") as console:
+            for name in ["error", "warn", "info", "print"]:
+                setattr(console, name, lambda *args, **kwargs: messages.append(args))
+            for error in [AuthenticationFailed("refused"), requests.ConnectionError("no network")]:
+                self.fail_with(error)
+                with self.assertLogs("epflmanager.connections.moodle"):
+                    self.moodle._refresh()
+        self.assertListEqual(messages, [])
+
+    def test_margin_must_be_smaller_than_the_lifetime(self):
+        components.teardown("Moodle")
+        components.get("Config")["moodle"]["session_refresh_margin"] = "3600"
+        self.moodle = self.backend()
+        self.assertEqual(self.moodle._refresh_margin, 900)
+
+    def test_unavailable_credentials_are_reported(self):
+        run = mock.Mock()
+        errors = []
+        with components.get("Console") as console, mock.patch.dict(os.environ, clear=True):
+            console.error = errors.append
+            cli.moodle_initializer(run)(argparse.Namespace())
+
+        run.assert_not_called()
+        self.assertEqual(len(errors), 1)
+        self.assertIn("EPFL_GASPAR_USER", errors[0])
+
+class NewsCommandTest(MoodleTestCase):
+    """ `epfl courses news` on a tree of linked courses """
+
+    def setUp(self):
+        super().setUp()
+        config = components.get("Config")
+        self.main_dir = config["directories"]["main_dir"]
+        config["directories"]["main_dir"] = self.directory
+        self.ch = components.get("CourseHandler")
+        self.ch._init()
+
+        self.create_course("Algorithms", 3)
+        self.create_course("AlgorithmsExercises", 3)
+        self.create_course("Analysis", 2)
+
+        self.console = components.get("Console").__enter__()
+        self.printed = []
+        self.errors = []
+        self.console.print = lambda *args, **kwargs: self.printed.append(" ".join(map(str, args)))
+        self.console.info = self.printed.append
+        self.console.error = self.errors.append
+
+    def tearDown(self):
+        self.console.__exit__(None, None, None)
+        components.get("Config")["directories"]["main_dir"] = self.main_dir
+        self.ch._init()
+        super().tearDown()
+
+    def create_course(self, name, moodle_id, semester="BA1"):
+        path = os.path.join(self.directory, semester, name)
+        os.makedirs(path)
+        with open(os.path.join(path, ".moodle.%s" % name), "w") as f:
+            f.write("[course]\ncourse_name = %s\nmoodle_id = %d\n" % (name, moodle_id))
+
+    def news(self, course=""):
+        CourseCommands.news(argparse.Namespace(semester=self.ch.get_semester("BA1"), course=course))
+
+    def test_news_lists_the_new_resources_of_every_course(self):
+        self.news()
+
+        for name in ["Algorithms", "AlgorithmsExercises", "Analysis"]:
+            self.assertIn("%s:" % name, self.printed)
+        self.assertEqual(self.printed.count("- [new] Slides 3 (Week 3)"), 2)
+        self.assertIn("- [new] Slides 2 (Week 2)", self.printed)
+
+    def test_courses_of_a_same_moodle_course_are_fetched_once(self):
+        self.news("Algo")
+
+        self.assertListEqual([ p for p in self.printed if p.endswith(":") ], ["Algorithms:", "AlgorithmsExercises:"])
+        self.assertEqual(len([ r for r in self.server.requests if r[1] == "/course/3" ]), 1)
+
+    def test_news_reports_the_courses_that_failed(self):
+        self.server.files["/course/2"] = None
+        self.news()
+
+        self.assertEqual(len(self.errors), 1)
+        self.assertTrue(self.errors[0].startswith("Unable to fetch the resources of Analysis"))
+        self.assertIn("Algorithms:", self.printed)
+
+    def test_news_of_a_course_of_another_semester(self):
+        self.create_course("Probability", 4, semester="BA2")
+        self.news("Proba")
+
+        self.assertListEqual([ p for p in self.printed if p.endswith(":") ], ["Probability:"])
+        self.assertIn("- [new] Slides 4 (Week 4)", self.printed)
+
+class FakeMoodle(object):
+    """ The Moodle courses of the user, without connection """
+    def __init__(self, courses, error=None):
+        self.courses = courses
+        self.error = error
+
+    def connect(self):
+        if self.error is not None:
+            raise self.error
+
+class LinkAllCommandTest(unittest.TestCase):
+    """ `epfl courses link --all` """
+
+    def setUp(self):
+        initialize_components()
+        self.directory = tempfile.mkdtemp()
+        config = components.get("Config")
+        self.main_dir = config["directories"]["main_dir"]
+        config["directories"]["main_dir"] = self.directory
+        self.ch = components.get("CourseHandler")
+        self.ch._init()
+
+        for name in ["Algorithms", "Algebra", "AnalysisI", "Physics"]:
+            os.makedirs(os.path.join(self.directory, "BA1", name))
+        self.ch.link_course_with_moodle(self.ch.get_course("Algorithms"), 200)
+
+        components.teardown("Moodle")
+        self.moodle = FakeMoodle({ "Algorithms": 200, "Algebra": 201, "Analysis": 200, "Zoology": 300 })
+        components.as_component(self.moodle, "Moodle")
+
+        self.console = components.get("Console").__enter__()
+        self.printed = []
+        self.errors = []
+        self.console.print = lambda *args, **kwargs: self.printed.append(" ".join(map(str, args)))
+        self.console.info = self.printed.append
+        self.console.error = self.errors.append
+
+    def tearDown(self):
+        self.console.__exit__(None, None, None)
+        components.teardown("Moodle")
+        components.get("Config")["directories"]["main_dir"] = self.main_dir
+        self.ch._init()
+        shutil.rmtree(self.directory)
+
+    def link_all(self, confirm):
+        self.console.confirm = lambda *args, **kwargs: confirm
+        args = cli.build_parser().parse_args(["--semester", "BA1", "courses", "link", "--all"])
+        args.func(args)
+
+    def moodle_ids(self):
+        return { c.name: metadata.shared.moodle_id(c.moodle_file_path) for c in self.ch.courses() }
+
+    def test_courses_are_linked_with_the_most_similar_titles(self):
+        self.link_all(confirm=True)
+
+        # Analysis is the Moodle course of Algorithms, already linked
+        self.assertEqual(self.moodle_ids(), { "Algorithms": "200", "Algebra": "201", "AnalysisI": None, "Physics": None })
+        self.assertFalse(any("id 200" in line for line in self.printed))
+        self.assertIn("Not matched: AnalysisI, Physics", self.printed)
+        self.assertIn("Courses linked!", self.printed)
+
+    def test_nothing_is_linked_without_confirmation(self):
+        self.link_all(confirm=False)
+
+        self.assertEqual(self.moodle_ids(), { "Algorithms": "200", "Algebra": None, "AnalysisI": None, "Physics": None })
+        self.assertNotIn("Courses linked!", self.printed)
+
+    def test_failed_connection_is_reported(self):
+        for error in [AuthenticationFailed("refused"), CredentialsUnavailable("no password")]:
+            self.moodle.error = error
+            self.link_all(confirm=True)
+
+        self.assertListEqual(self.errors, ["Unable to connect to Moodle: refused",
+                                           "Unable to connect to Moodle: no password"])
+        self.assertIsNone(self.moodle_ids()["Algebra"])
+
+    def test_link_tells_the_other_courses_of_the_moodle_course(self):
+        self.console.inputs(["200"])
+        args = cli.build_parser().parse_args(["--semester", "BA1", "courses", "link", "AnalysisI"])
+        args.func(args)
+
+        self.assertEqual(self.moodle_ids()["AnalysisI"], "200")
+        self.assertIn("Also linked with this Moodle course: Algorithms (BA1)", self.printed)
@@ -0,0 +1,78 @@
+import unittest
+
+from epflmanager.connections.moodleparser import parse_course_resources, iter_course_resources
+
+COURSE_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Algorithms</title></head>
+<body>
+<a href="/my/">My courses</a>
+<ul class="topics">
+<li id="section-0" class="section main"><div class="left side"></div>
+  <div class="content">
+    <h3 class="sectionname"><span>General</span></h3>
+    <div class="summary"><p>Welcome<br>to the course &amp; have fun</p></div>
+    <ul class="section img-text">
+      <li class="activity forum"><a href="http://moodle.epfl.ch/mod/forum/view.php?id=1">
+        <img src="forum.png" class="iconlarge"><span class="instancename">News forum<span class="accesshide"> Forum</span></span></a></li>
+    </ul>
+  </div>
+</li>
+<li id="section-1" class="section main">
+  <div class="content">
+    <h3 class="sectionname">Week   1</h3>
+    <ul class="section img-text">
+      <li class="activity resource"><a class="" onclick="" href="http://moodle.epfl.ch/mod/resource/view.php?id=914285"><span class="instancename">Solutions to Problems</span></a></li>
+      <li class="activity resource"><a href="http://moodle.epfl.ch/mod/resource/view.php?id=914286">Slides</a>
+    </ul>
+  </div>
+</li>
+</ul>
+<footer><a href="/help">Help</a></footer>
+</body></html>"""
+
+class CoursePageParserTest(unittest.TestCase):
+
+    def test_empty_page(self):
+        self.assertListEqual(parse_course_resources(""), [])
+
+    def test_sections_are_found_in_order(self):
+        sections = parse_course_resources(COURSE_PAGE)
+        self.assertListEqual([s["name"] for s in sections], ["General", "Week 1"])
+
+    def test_links_of_a_section(self):
+        week1 = parse_course_resources(COURSE_PAGE)[1]
+        self.assertListEqual([l["href"] for l in week1["links"]],
+                             ["http://moodle.epfl.ch/mod/resource/view.php?id=914285",
+                              "http://moodle.epfl.ch/mod/resource/view.php?id=914286"])
+        self.assertEqual(week1["links"][0]["text"], "Solutions to Problems")
+        self.assertEqual(week1["links"][0]["class"], "")
+
+    def test_link_text_contains_the_text_of_nested_elements(self):
+        general = parse_course_resources(COURSE_PAGE)[0]
+        self.assertEqual(general["links"][0]["text"].strip(), "News forum Forum")
+
+    def test_links_outside_sections_are_ignored(self):
+        hrefs = [l["href"] for s in parse_course_resources(COURSE_PAGE) for l in s["links"]]
+        self.assertNotIn("/my/", hrefs)
+        self.assertNotIn("/help", hrefs)
+
+    def test_result_does_not_depend_on_chunking(self):
+        expected = parse_course_resources(COURSE_PAGE)
+        for size in [1, 7, 100]:
+            chunks = [COURSE_PAGE[i:i+size] for i in range(0, len(COURSE_PAGE), size)]
+            self.assertListEqual(parse_course_resources(chunks), expected)
+
+    def test_sections_are_yielded_before_the_end_of_the_page(self):
+        cut = COURSE_PAGE.index("Week   1</h3>") + 20
+        fed = []
+        def chunks():
+            for chunk in [COURSE_PAGE[:cut], COURSE_PAGE[cut:]]:
+                fed.append(chunk)
+                yield chunk
+
+        sections = iter_course_resources(chunks())
+        # The first section is complete once the title of the next one is read
+        self.assertEqual(next(sections)["name"], "General")
+        self.assertEqual(len(fed), 1)
+        self.assertEqual(next(sections)["name"], "Week 1")
+        self.assertEqual(len(fed), 2)
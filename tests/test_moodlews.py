@@ -0,0 +1,131 @@
+import json
+import unittest
+from urllib import parse
+
+from epflmanager.connections.moodlews import courses_from_enrolments, sections_from_contents
+from epflmanager.connections.moodlews import MoodleWebService, MoodleWebServiceError
+from epflmanager.connections.moodle import resource_id
+from epflmanager.connections.downloader import Download
+
+from server import FileHandler
+from test_moodle import MoodleTestCase
+
+CONTENTS = [
+    { "id": 1, "name": "General", "modules": [
+        { "id": 10, "name": "News forum", "modname": "forum",
+          "url": "http://moodle.epfl.ch/mod/forum/view.php?id=10" },
+        { "id": 11, "name": "Some text", "modname": "label" } ]},
+    { "id": 2, "name": "Week 1", "modules": [
+        { "id": 914285, "name": "Solutions to Problems", "modname": "resource",
+          "url": "http://moodle.epfl.ch/mod/resource/view.php?id=914285",
+          "contents": [{ "type": "file", "filename": "sol.pdf", "filesize": 42,
+                         "fileurl": "http://moodle.epfl.ch/webservice/pluginfile.php/1/mod_resource/content/1/sol.pdf?forcedownload=1" }] } ]},
+]
+
+class MoodleWebServiceConversionTest(unittest.TestCase):
+
+    def test_courses_from_enrolments(self):
+        enrolments = [{ "id": 13768, "shortname": "CS-250", "fullname": "Algorithms" },
+                      { "id": "14000", "shortname": "MATH-101", "fullname": "Analysis" }]
+        self.assertDictEqual(courses_from_enrolments(enrolments), { "Algorithms": 13768, "Analysis": 14000 })
+
+    def test_sections_keep_their_order_and_names(self):
+        sections = sections_from_contents(CONTENTS)
+        self.assertListEqual([s["name"] for s in sections], ["General", "Week 1"])
+
+    def test_modules_without_url_are_ignored(self):
+        general = sections_from_contents(CONTENTS)[0]
+        self.assertListEqual([l["text"] for l in general["links"]], ["News forum"])
+
+    def test_resources_keep_their_moodle_id(self):
+        link = sections_from_contents(CONTENTS)[1]["links"][0]
+        self.assertEqual(resource_id(link["href"]), 914285)
+
+    def test_download_urls_do_not_hold_the_token(self):
+        link = sections_from_contents(CONTENTS)[1]["links"][0]
+        query = parse.parse_qs(parse.urlparse(link["download"]).query)
+        self.assertNotIn("token", query)
+        self.assertEqual(query["forcedownload"], ["1"])
+        self.assertEqual(link["filename"], "sol.pdf")
+
+TOKEN = "0123456789abcdef"
+
+class WebServiceHandler(FileHandler):
+    """ The REST web service of Moodle: answers `server.functions[wsfunction]`
+    to the requests having the right token """
+    def do_POST(self):
+        params = dict(parse.parse_qsl(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")))
+        self.server.requests.append((self.command, self.path, params))
+        if self.path != "/webservice/rest/server.php":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if params.get("wstoken") != TOKEN:
+            result = { "exception": "webservice_access_exception", "message": "Invalid token" }
+        else:
+            result = self.server.functions[params["wsfunction"]]
+        body = json.dumps(result).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class MoodleWebServiceTest(MoodleTestCase):
+    backend = MoodleWebService
+    handler = WebServiceHandler
+    options = { "token": TOKEN }
+
+    def setUp(self):
+        super().setUp()
+        self.server.httpd.functions = {
+            "core_webservice_get_site_info": { "userid": 42 },
+            "core_enrol_get_users_courses": [{ "id": 13768, "fullname": "Algorithms" }],
+            "core_course_get_contents": [
+                { "name": "Week 1", "modules": [
+                    { "id": 914285, "name": "Solutions", "modname": "resource",
+                      "url": self.server.url("/mod/resource/view.php?id=914285"),
+                      "contents": [{ "type": "file", "filename": "sol.pdf", "filesize": 9,
+                                     "fileurl": self.server.url("/webservice/pluginfile.php/1/sol.pdf?forcedownload=1") }] }] }],
+        }
+        self.server.files["/webservice/pluginfile.php/1/sol.pdf"] = (b"solutions", '"s"')
+
+    def test_connect_gets_the_user(self):
+        self.moodle.connect()
+        self.assertEqual(self.moodle._user_id, 42)
+        method, path, params = self.server.requests[-1]
+        self.assertEqual((params["wsfunction"], params["wstoken"]), ("core_webservice_get_site_info", TOKEN))
+
+    def test_courses(self):
+        self.moodle.connect()
+        self.assertDictEqual(self.moodle.courses, { "Algorithms": 13768 })
+        self.assertEqual(self.server.requests[-1][2]["userid"], "42")
+
+    def test_errors_of_the_web_service_are_raised(self):
+        self.moodle._token = "wrong"
+        with self.assertRaisesRegex(MoodleWebServiceError, "Invalid token"):
+            self.moodle.call("core_webservice_get_site_info")
+
+    def test_http_errors_are_raised(self):
+        self.moodle._ws_url = self.server.url("/nothing")
+        with self.assertRaisesRegex(MoodleWebServiceError, "HTTP 404"):
+            self.moodle.call("core_webservice_get_site_info")
+
+    def test_connect_without_token(self):
+        self.moodle._token = None
+        with self.assertRaises(MoodleWebServiceError):
+            self.moodle.connect()
+
+    def test_files_are_downloaded_with_the_token_out_of_the_logs(self):
+        link = self.moodle.course_resources(13768)[0]["links"][0]
+        with self.assertLogs("epflmanager.connections.downloader", "DEBUG") as logs:
+            path = self.moodle.downloader.download(Download(link["download"], self.directory))
+
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"solutions")
+        method, sent, headers = self.server.requests[-1]
+        self.assertIn("token=%s" % TOKEN, sent)
+        self.assertNotIn(TOKEN, "\n".join(logs.output))
+        self.assertNotIn(TOKEN, link["download"])
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from epflmanager.search import SearchIndex, ExtractionFailed, extract_text, query_expression
+
+class SearchIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "EPFL")
+        self.write("BA1/Analysis/notes.md", "# Limits\nThe epsilon-delta definition of continuity.\n")
+        self.write("BA1/Analysis/.git/config", "continuity")
+        self.write("BA3/Algorithms/src/sort.py", "def quicksort(values):\n    # pivot chosen at random\n")
+        self.write("BA3/Algorithms/slides.bin", "continuity")
+        self.courses = [ (c, os.path.join(self.root, c)) for c in ["BA1/Analysis", "BA3/Algorithms"] ]
+        self.index = SearchIndex(os.path.join(self.tmp.name, "search.sqlite"), workers=1)
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def write(self, name, content, age=10):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+        t = os.stat(path).st_mtime - age
+        os.utime(path, (t, t))
+
+    def found(self, query):
+        return [ (r.course, os.path.basename(r.path)) for r in self.index.search(query) ]
+
+    def test_query_expression(self):
+        self.assertEqual(query_expression('quick "sort'), '"quick"* "sort"*')
+        self.assertEqual(query_expression("  "), "")
+
+    def test_search(self):
+        self.assertEqual(self.index.update(self.courses), (2, 0))
+        self.assertListEqual(self.found("continuity"), [("BA1/Analysis", "notes.md")])
+        self.assertListEqual(self.found("quick"), [("BA3/Algorithms", "sort.py")])
+        self.assertListEqual(self.found("pivot random"), [("BA3/Algorithms", "sort.py")])
+        self.assertListEqual(self.found("pivot continuity"), [])
+        self.assertIn("[continuity]", self.index.search("continuity")[0].snippet)
+
+    def test_only_changed_files_are_read(self):
+        self.index.update(self.courses)
+        self.assertEqual(self.index.update(self.courses), (0, 0))
+
+        self.write("BA1/Analysis/notes.md", "# Series\nAbsolute convergence.\n", age=5)
+        self.assertEqual(self.index.update(self.courses), (1, 0))
+        self.assertListEqual(self.found("continuity"), [])
+        self.assertListEqual(self.found("convergence"), [("BA1/Analysis", "notes.md")])
+
+    def test_removed_files_are_dropped(self):
+        self.index.update(self.courses)
+        os.remove(os.path.join(self.root, "BA3/Algorithms/src/sort.py"))
+        self.assertEqual(self.index.update(self.courses), (0, 1))
+        self.assertListEqual(self.found("quicksort"), [])
+
+    def test_recently_modified_file_is_read_again(self):
+        self.write("BA1/Analysis/todo.txt", "exam", age=0)
+        self.index.update(self.courses)
+        self.assertEqual(self.index.update(self.courses), (1, 0))
+
+    def test_failed_extractions_are_read_again(self):
+        self.write("BA1/Analysis/limits.txt", "squeeze theorem")
+        def failing(path):
+            if path.endswith("limits.txt"):
+                raise ExtractionFailed("timeout")
+            return extract_text(path)
+
+        with mock.patch("epflmanager.search.extract_text", failing):
+            self.assertEqual(self.index.update(self.courses), (2, 0))
+        self.assertListEqual(self.found("squeeze"), [])
+        self.assertEqual(self.index.update(self.courses), (1, 0))
+        self.assertListEqual(self.found("squeeze"), [("BA1/Analysis", "limits.txt")])
+
+    def test_extractors_are_looked_up_once_per_update(self):
+        for i in range(5):
+            self.write("BA3/Algorithms/slides%d.pdf" % i, "%PDF")
+        with mock.patch("shutil.which", return_value=None) as which:
+            self.index.update(self.courses)
+        self.assertEqual(which.call_count, 1)
+
+    def test_workers(self):
+        for i in range(40):
+            self.write("BA3/Algorithms/exercises/ex%d.txt" % i, "exercise number%d" % i)
+        self.index.workers = 2
+        self.assertEqual(self.index.update(self.courses)[0], 42)
+        self.assertListEqual(self.found("number17"), [("BA3/Algorithms", "ex17.txt")])
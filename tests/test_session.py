@@ -0,0 +1,85 @@
+import os
+import json
+import time
+import pickle
+import tempfile
+import unittest
+import configparser
+
+import requests
+
+from epflmanager.connections.session import SessionStore, CredentialsUnavailable, credentials_source
+
+def make_cookies():
+    cookies = requests.cookies.RequestsCookieJar()
+    cookies.set("MoodleSession", "abc", domain="moodle.epfl.ch", path="/")
+    cookies.set("MOODLEID1_", "def", domain="moodle.epfl.ch", path="/")
+    return cookies
+
+class SessionStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cookies")
+        self.store = SessionStore(self.path, lifetime=60)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_missing_file(self):
+        self.assertIsNone(self.store.load())
+
+    def test_save_and_load(self):
+        issued = time.time()
+        self.store.save(make_cookies(), issued)
+        cookies, loaded_issued = self.store.load()
+        self.assertEqual(cookies.get_dict(), {"MoodleSession": "abc", "MOODLEID1_": "def"})
+        self.assertEqual(loaded_issued, issued)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+    def test_expired_session(self):
+        self.store.save(make_cookies(), time.time() - 61)
+        self.assertIsNone(self.store.load())
+
+    def test_legacy_pickle_is_ignored(self):
+        with open(self.path, "wb") as f:
+            pickle.dump(make_cookies(), f)
+        self.assertIsNone(self.store.load())
+
+    def test_other_version_is_ignored(self):
+        with open(self.path, "w") as f:
+            json.dump({"version": SessionStore.VERSION + 1, "issued": time.time(), "cookies": []}, f)
+        self.assertIsNone(self.store.load())
+
+class CredentialsSourceTest(unittest.TestCase):
+
+    def config(self, **options):
+        config = configparser.ConfigParser()
+        config["moodle"] = options
+        return config
+
+    def test_prompt_by_default(self):
+        self.assertIsNone(credentials_source(self.config()))
+
+    def test_env(self):
+        source = credentials_source(self.config(credentials="env"))
+        env = {"EPFL_GASPAR_USER": "user", "EPFL_GASPAR_PASSWORD": "secret"}
+        old = { k: os.environ.get(k) for k in env }
+        os.environ.update(env)
+        try:
+            self.assertEqual(source(), ("user", "secret"))
+            del os.environ["EPFL_GASPAR_PASSWORD"]
+            self.assertRaises(CredentialsUnavailable, source)
+        finally:
+            for k, v in old.items():
+                os.environ.pop(k, None)
+                if v is not None:
+                    os.environ[k] = v
+
+    def test_command(self):
+        source = credentials_source(self.config(credentials="command", gaspar_user="user",
+                                                password_command="echo secret"))
+        self.assertEqual(source(), ("user", "secret"))
+
+    def test_unknown_source(self):
+        self.assertRaises(CredentialsUnavailable, credentials_source, self.config(credentials="keyring"))
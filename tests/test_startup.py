@@ -0,0 +1,29 @@
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that are slow to import and only needed by some commands
+HEAVY = ["readline", "sqlite3", "requests", "pyquery", "lxml", "aiohttp",
+         "epflmanager.connections", "epflmanager.coursehandler", "epflmanager.io",
+         "epflmanager.commands.coursemanagement"]
+
+class StartupTest(unittest.TestCase):
+    """ Check that the commands only import what they use """
+
+    def imported_after(self, code):
+        script = "import sys, json\n%s\nprint(json.dumps([m for m in %r if m in sys.modules]))" % (code, HEAVY)
+        out = subprocess.check_output([sys.executable, "-c", script], env=dict(os.environ, PYTHONPATH=ROOT))
+        return json.loads(out.decode("utf-8").splitlines()[-1])
+
+    def test_client_imports_nothing_heavy(self):
+        self.assertListEqual(self.imported_after("import epflmanager.client"), [])
+
+    def test_parsing_the_arguments_imports_nothing_heavy(self):
+        code = ("import epflmanager.cli as cli\n"
+                "cli.start_console()\n"
+                "cli.build_parser().parse_args(['courses', 'sync'])")
+        self.assertListEqual(self.imported_after(code), [])
@@ -0,0 +1,82 @@
+import os
+import unittest
+
+import pyfakefs.fake_filesystem_unittest as fakefs
+
+from epflmanager.store import BlobStore, BlobNotFound, same_fingerprint
+
+class SameFingerprintTest(unittest.TestCase):
+
+    def test_etags_are_compared_first(self):
+        self.assertTrue(same_fingerprint({ "etag": "a", "size": 1 }, { "etag": "a", "size": 2 }))
+        self.assertFalse(same_fingerprint({ "etag": "a" }, { "etag": "b" }))
+
+    def test_size_and_date_are_used_without_etag(self):
+        f = { "etag": None, "size": 10, "last_modified": "Mon, 07 Mar 2016 13:56:00 GMT" }
+        self.assertTrue(same_fingerprint(f, dict(f)))
+        self.assertFalse(same_fingerprint(f, dict(f, size=11)))
+
+    def test_size_alone_is_not_enough(self):
+        f = { "etag": None, "size": 10, "last_modified": None }
+        self.assertFalse(same_fingerprint(f, dict(f)))
+
+    def test_missing_fingerprint(self):
+        self.assertFalse(same_fingerprint(None, { "etag": "a" }))
+
+class BlobStoreTest(fakefs.TestCase):
+
+    def setUp(self):
+        self.setUpPyfakefs()
+        os.makedirs("/EPFL/BA1/Algo")
+        os.makedirs("/EPFL/BA2/Analysis")
+        self.store = BlobStore("/EPFL/.store")
+
+    def test_added_file_is_stored_under_its_hash(self):
+        self.fs.CreateFile("/EPFL/BA1/Algo/slides.pdf", contents="slides")
+        hash = self.store.add("/EPFL/BA1/Algo/slides.pdf")
+        self.assertTrue(self.store.has(hash))
+        self.assertTrue(os.path.samefile(self.store.blob_path(hash), "/EPFL/BA1/Algo/slides.pdf"))
+
+    def test_same_content_is_stored_once(self):
+        self.fs.CreateFile("/EPFL/BA1/Algo/slides.pdf", contents="slides")
+        self.fs.CreateFile("/EPFL/BA2/Analysis/copy.pdf", contents="slides")
+        h1 = self.store.add("/EPFL/BA1/Algo/slides.pdf")
+        h2 = self.store.add("/EPFL/BA2/Analysis/copy.pdf")
+        self.assertEqual(h1, h2)
+        self.assertTrue(os.path.samefile("/EPFL/BA1/Algo/slides.pdf", "/EPFL/BA2/Analysis/copy.pdf"))
+
+    def test_link_makes_content_available(self):
+        self.fs.CreateFile("/EPFL/BA1/Algo/slides.pdf", contents="slides")
+        hash = self.store.add("/EPFL/BA1/Algo/slides.pdf")
+        self.store.link(hash, "/EPFL/BA2/Analysis/slides.pdf")
+        with open("/EPFL/BA2/Analysis/slides.pdf") as f:
+            self.assertEqual(f.read(), "slides")
+
+    def test_link_does_not_overwrite_other_files(self):
+        self.fs.CreateFile("/EPFL/BA1/Algo/slides.pdf", contents="slides")
+        self.fs.CreateFile("/EPFL/BA2/Analysis/slides.pdf", contents="notes of the user")
+        hash = self.store.add("/EPFL/BA1/Algo/slides.pdf")
+        with self.assertRaises(FileExistsError):
+            self.store.link(hash, "/EPFL/BA2/Analysis/slides.pdf")
+        with open("/EPFL/BA2/Analysis/slides.pdf") as f:
+            self.assertEqual(f.read(), "notes of the user")
+
+        # unless it is the previous version of the resource
+        self.store.link(hash, "/EPFL/BA2/Analysis/slides.pdf", replaces="/EPFL/BA2/Analysis/slides.pdf")
+        self.assertTrue(os.path.samefile("/EPFL/BA1/Algo/slides.pdf", "/EPFL/BA2/Analysis/slides.pdf"))
+
+    def test_link_unknown_content_fails(self):
+        with self.assertRaises(BlobNotFound):
+            self.store.link("0"*40, "/EPFL/BA1/Algo/nothing.pdf")
+
+    def test_history_of_ids_survives_reload(self):
+        self.fs.CreateFile("/EPFL/BA1/Algo/sol.pdf", contents="solutions")
+        hash = self.store.add("/EPFL/BA1/Algo/sol.pdf")
+        self.store.record(914285, 100, "Week 1", "Solutions to Problems", hash, "sol.pdf", { "etag": "x" })
+        self.store.record(915248, 100, "Week 1", "Solutions to Problems", hash, "sol.pdf", { "etag": "x" })
+        self.store.save()
+
+        store = BlobStore("/EPFL/.store")
+        self.assertListEqual(store.previous_ids(100, "Week 1", "Solutions to Problems"), [914285, 915248])
+        self.assertEqual(store.lookup(914285)["hash"], hash)
+        self.assertIsNone(store.lookup(1))
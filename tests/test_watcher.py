@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import epflmanager.cache as cache
+from epflmanager.watcher import Watcher, InotifyWatcher, PollingWatcher, InotifyUnavailable, COURSE, SEMESTER
+
+from components import initialize_components
+
+class WatcherTestMixin(object):
+    """ Tests run against every kind of watcher """
+
+    def setUp(self):
+        initialize_components()
+        self.tmp = tempfile.mkdtemp()
+        for d in ["BA1/Algebra", "BA1/.git", "Other/Course"]:
+            os.makedirs(os.path.join(self.tmp, d))
+        self.watcher = self.create_watcher()
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.tmp)
+
+    def path(self, *parts):
+        return os.path.join(self.tmp, *parts)
+
+    def changes(self):
+        return self.watcher.step(2.0)
+
+    def test_depth(self):
+        self.assertEqual(self.watcher.depth(self.path("BA1")), SEMESTER)
+        self.assertEqual(self.watcher.depth(self.path("BA1", "Algebra")), COURSE)
+        self.assertIsNone(self.watcher.depth(self.path("BA1", ".git")))
+        self.assertIsNone(self.watcher.depth(self.path("Other")))
+        self.assertIsNone(self.watcher.depth(self.path("BA1", "Algebra", "Week1")))
+
+    def test_new_course(self):
+        os.mkdir(self.path("BA1", "Analysis"))
+        changed = self.changes()
+        self.assertIn(self.path("BA1"), changed)
+
+    def test_renamed_course(self):
+        os.rename(self.path("BA1", "Algebra"), self.path("BA1", "LinearAlgebra"))
+        self.assertIn(self.path("BA1"), self.changes())
+        # the course is still watched under its new name
+        with open(self.path("BA1", "LinearAlgebra", "site.url"), "w") as f:
+            f.write("http://example.com\n")
+        self.assertIn(self.path("BA1", "LinearAlgebra"), self.changes())
+
+    def test_changes_outside_of_the_courses_are_ignored(self):
+        os.mkdir(self.path("Other", "Course", "New"))
+        os.mkdir(self.path("BA1", ".git", "objects"))
+        self.assertListEqual(self.watcher.step(0.5), [])
+
+    def test_changed_directories_are_invalidated(self):
+        key = ("test", self.path("BA1"))
+        cache.shared.get(key, lambda: 1, self.path("BA1"))
+        os.mkdir(self.path("BA1", "Analysis"))
+        self.changes()
+        self.assertNotIn(key, cache.shared._entries)
+
+class InotifyWatcherTest(WatcherTestMixin, unittest.TestCase):
+    def create_watcher(self):
+        try:
+            return InotifyWatcher(self.tmp, settle=0)
+        except InotifyUnavailable:
+            self.skipTest("inotify is not available")
+
+class PollingWatcherTest(WatcherTestMixin, unittest.TestCase):
+    def create_watcher(self):
+        return PollingWatcher(self.tmp, settle=0, interval=0.05)
+
+class WatcherTest(unittest.TestCase):
+    def test_a_watcher_needs_a_way_to_wait_for_changes(self):
+        initialize_components()
+        with self.assertRaises(TypeError):
+            Watcher(tempfile.gettempdir())